@@ -1,5 +1,5 @@
 # Import necessary modules from Flask and other libraries
-from flask import Flask
+from flask import Flask, g
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
@@ -7,6 +7,10 @@ from flask_cors import CORS
 from dotenv import load_dotenv
 from config import config
 from flask_wtf.csrf import CSRFProtect
+from .cache import response_cache
+from .passwords import password_hasher
+from . import sqlite
+from .routing import RoutingSession, replica_binds
 
 # Load environment variables from a .env file
 load_dotenv()
@@ -15,7 +19,7 @@ load_dotenv()
 csrf = CSRFProtect()
 
 # Initialize the database, migration tool, and login manager
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
 login_manager = LoginManager()
 
@@ -42,10 +46,22 @@ def create_app(config_name):
     app.config.from_object(config[config_name])
     config[config_name].init_app(app)
 
-    # Initialize the extensions with the application instance
+    # Read replicas are registered as extra binds; app.routing sends replica-safe reads to them
+    app.config['SQLALCHEMY_BINDS'] = {
+        **(app.config.get('SQLALCHEMY_BINDS') or {}),
+        **replica_binds(app.config.get('SQLALCHEMY_REPLICAS', [])),
+    }
+
+    # Initialize the extensions with the application instance; the rate limiter goes first
+    # so its before_request hook turns requests away before any other work
+    ratelimit.rate_limiter.init_app(app)
     db.init_app(app)
+    sqlite.init_app(app, db)
     migrate.init_app(app, db)
     csrf.init_app(app)
+    response_cache.init_app(app)
+    password_hasher.init_app(app)
+    identity.user_cache.init_app(app)
     CORS(app)
 
     # Import and register blueprints for authentication and main functionality
@@ -62,17 +78,46 @@ def create_app(config_name):
     return app
 
 # Import models to ensure they are registered with SQLAlchemy
-from . import models
+from . import models, sharding, identity, tokens, ratelimit, availability
 
 @login_manager.user_loader
 def load_user(user_id):
     """
-    Loads a user by their user ID.
+    Loads the identity of a user by their user ID, from the user cache when it can.
 
     Args:
         user_id (int): The ID of the user to load.
 
     Returns:
-        User: The User object if found, otherwise None.
+        UserIdentity: The user's identity if found and not deleted, otherwise None.
+    """
+    # A deleted profile is logged out everywhere while its data is being purged
+    user = identity.load_identity(int(user_id))
+    if user is None:
+        return None
+    # The request's queries on the user's log tables go to their shard
+    sharding.select_shard(db.session, user.shard_id)
+    return user
+
+@login_manager.request_loader
+def load_user_from_token(request):
+    """
+    Loads the user of a request without a session from its API token, on views that accept
+    tokens (see app.tokens.token_auth). The token is checked by its signature, expiry, scope
+    and the in-memory revocation list, which also refuses the tokens of deleted users, and is
+    reloaded from the database every API_TOKEN_REVOCATION_REFRESH seconds. The identity comes
+    from the user cache, as for a session, so the database is only read on a cache miss.
+
+    Args:
+        request (Request): The current request.
+
+    Returns:
+        TokenIdentity: The token's user if there is a valid token, otherwise None.
     """
-    return models.User.query.get(int(user_id))
+    claims = tokens.request_token_claims()
+    if claims is None:
+        return None
+    user = identity.TokenIdentity(claims)
+    sharding.select_shard(db.session, user.shard_id)
+    g.api_token = claims
+    return user
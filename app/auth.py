@@ -1,31 +1,19 @@
 # Import necessary modules from Flask and other libraries
-from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app as app
-from flask_login import LoginManager, login_user, login_required, logout_user, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
+from datetime import datetime
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, g, current_app as app
+from sqlalchemy.exc import IntegrityError
+from flask_login import login_user, login_required, logout_user, current_user
 from .models import User
 from .forms import RegistrationForm, LoginForm
-from . import db
+from .availability import name_taken, username_taken
+from .passwords import HashingBusy, password_hasher, check_and_upgrade
+from .identity import load_identity
+from .tokens import TOKEN_SCOPES, TokenError, issue_token, revoke_token, token_auth
+from . import db, csrf
 
 # Create a Blueprint for authentication routes
 auth = Blueprint('auth', __name__, url_prefix='/auth')
 
-# Initialize LoginManager
-login_manager = LoginManager()
-login_manager.login_view = 'auth.login'
-
-@login_manager.user_loader
-def load_user(user_id):
-    """
-    A user loader callback used to reload the user object from the user ID stored in the session.
-
-    Args:
-        user_id (int): The ID of the user to load.
-
-    Returns:
-        User: The User object if found, otherwise None.
-    """
-    return User.query.get(int(user_id))
-
 @auth.route('/register', methods=['GET', 'POST'])
 def register():
     """
@@ -41,14 +29,16 @@ def register():
         password = form.password.data
         
         # Check if the username or email already exists
-        existing_user = User.query.filter_by(username=username).first()
-        existing_email = User.query.filter_by(email=email).first()
-        if existing_user or existing_email:
+        if name_taken(username, email):
             flash('Username or email already exists!', 'error')
             return redirect(url_for('auth.register'))
         
         # Hash the password and create a new user
-        hashed_password = generate_password_hash(password, method='pbkdf2:sha256')
+        try:
+            hashed_password = password_hasher.hash(password)
+        except HashingBusy:
+            flash('We are handling a lot of sign-ups right now. Please try again in a moment.', 'error')
+            return render_template('register.html', form=form), 503
         new_user = User(username=username, email=email, password=hashed_password)
         
         # Add the new user to the database
@@ -57,6 +47,11 @@ def register():
             db.session.commit()
             flash('Registration successful! Please log in.', 'success')
             return redirect(url_for('auth.login'))
+        except IntegrityError:
+            # Taken by someone this worker's name filter has not seen yet
+            db.session.rollback()
+            flash('Username or email already exists!', 'error')
+            return redirect(url_for('auth.register'))
         except Exception as e:
             db.session.rollback()
             app.logger.error(f"Error adding user: {e}")
@@ -68,6 +63,20 @@ def register():
 
     return render_template('register.html', form=form)
 
+@auth.route('/username_available', methods=['GET'])
+def username_available():
+    """
+    API route telling the registration form whether a username is free, as it is typed.
+    Most free names are answered from the in-memory name filter without a query.
+
+    Returns:
+        JSON: {"username": str, "available": bool}
+    """
+    username = request.args.get('username', '').strip()
+    if not 2 <= len(username) <= 80:
+        return jsonify({'error': 'Username must be between 2 and 80 characters'}), 400
+    return jsonify({'username': username, 'available': not username_taken(username)})
+
 @auth.route('/login', methods=['GET', 'POST'])
 def login():
     """
@@ -89,9 +98,16 @@ def login():
         app.logger.debug(f"User found: {user}")
 
         # Check if the user exists and the password is correct
-        if user and check_password_hash(user.password, password):
+        try:
+            valid = user is not None and user.deleted_at is None and check_and_upgrade(user, password)
+        except HashingBusy:
+            flash('We are handling a lot of logins right now. Please try again in a moment.', 'error')
+            return render_template('login.html', form=form), 503
+        if valid:
             app.logger.debug(f"Password is correct for user: {user.username}")
-            login_user(user, remember=True)
+            db.session.commit()  # Saves the upgraded hash, if the hashing parameters changed
+            # current_user is a UserIdentity on every request, this one included
+            login_user(load_identity(user.id), remember=True)
             next_page = request.args.get('next')
             return redirect(next_page) if next_page else redirect(url_for('main.dashboard'))
         else:
@@ -116,3 +132,46 @@ def logout():
     logout_user()
     flash('You have been logged out.', 'info')
     return redirect(url_for('auth.login'))
+
+@auth.route('/tokens', methods=['POST'])
+@csrf.exempt
+def create_token():
+    """
+    API route to issue a signed API token for JSON clients. Expects JSON data:
+    {"email": ..., "password": ..., "scopes": ["read", "write"], "expires_in": seconds}.
+    Scopes and expires_in are optional; see app/tokens.py.
+
+    Returns:
+        JSON: {"token", "token_type", "scopes", "expires_at"} with status 201.
+    """
+    data = request.get_json(silent=True) or {}
+    user = User.query.filter_by(email=data.get('email')).first()
+    try:
+        valid = user is not None and user.deleted_at is None and check_and_upgrade(user, str(data.get('password', '')))
+    except HashingBusy as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
+    if not valid:
+        return jsonify({'error': 'Invalid email or password'}), 401
+    db.session.commit()
+    try:
+        token, claims = issue_token(user.id, data.get('scopes') or TOKEN_SCOPES, data.get('expires_in'))
+    except (TokenError, TypeError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'token': token,
+        'token_type': 'Bearer',
+        'scopes': claims['scp'],
+        'expires_at': datetime.utcfromtimestamp(claims['exp']).isoformat() + 'Z',
+    }), 201
+
+@auth.route('/tokens/revoke', methods=['POST'])
+@login_required
+@token_auth()
+def revoke_current_token():
+    """
+    API route to revoke the API token the request was made with.
+    """
+    if g.get('api_token') is None:
+        return jsonify({'error': 'Send the token to revoke as a Bearer token'}), 400
+    revoke_token(g.api_token)
+    return jsonify({'message': 'Token revoked'}), 200
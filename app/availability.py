@@ -0,0 +1,105 @@
+import hashlib
+import math
+import threading
+from flask import current_app
+from sqlalchemy import event, or_, select
+from .models import User
+from . import db
+
+# Usernames and emails the filter is sized for, and the share of free names it may report as maybe taken
+NAME_FILTER_CAPACITY = 100000
+NAME_FILTER_ERROR_RATE = 0.01
+
+class BloomFilter:
+    """
+    A Bloom filter over strings: `value in filter` is False only for values never added,
+    and wrongly True for about error_rate of them once capacity values are in.
+    Values cannot be removed.
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        # Two 64-bit halves of one digest give every position (Kirsch-Mitzenmacher double hashing)
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+def _username_key(username):
+    return f'u:{username}'
+
+def _email_key(email):
+    # Emails are compared case-insensitively here, so the filter errs on the side of "maybe taken"
+    return f'e:{email.strip().lower()}'
+
+class _NameFilter:
+    # The process's filter over existing usernames and emails, built on first use and rebuilt,
+    # twice as large, once more names were added than it was sized for
+    def __init__(self):
+        self.bloom = None
+        self.lock = threading.Lock()
+
+def _name_filter():
+    names = current_app.extensions.setdefault('name_filter', _NameFilter())
+    with names.lock:
+        if names.bloom is None or names.bloom.count > names.bloom.capacity:
+            rows = db.session.execute(select(User.username, User.email)).all()
+            capacity = max(current_app.config.get('NAME_FILTER_CAPACITY', NAME_FILTER_CAPACITY), 4 * len(rows))
+            bloom = BloomFilter(capacity, current_app.config.get('NAME_FILTER_ERROR_RATE', NAME_FILTER_ERROR_RATE))
+            for username, email in rows:
+                bloom.add(_username_key(username))
+                bloom.add(_email_key(email))
+            names.bloom = bloom
+        return names
+
+def username_taken(username):
+    """
+    Checks whether a username is taken. Names the filter has never seen are free without a query.
+    """
+    names = _name_filter()
+    with names.lock:
+        maybe = _username_key(username) in names.bloom
+    if not maybe:
+        return False
+    return db.session.execute(select(User.id).where(User.username == username).limit(1)).first() is not None
+
+def name_taken(username, email):
+    """
+    Checks whether a username or an email is taken, with at most one query, and none when the
+    filter has seen neither. Other workers' new users may be missing from this process's filter,
+    so the unique constraints on insert have the final say.
+    """
+    names = _name_filter()
+    with names.lock:
+        maybe_username = _username_key(username) in names.bloom
+        maybe_email = _email_key(email) in names.bloom
+    conditions = []
+    if maybe_username:
+        conditions.append(User.username == username)
+    if maybe_email:
+        conditions.append(User.email == email)
+    if not conditions:
+        return False
+    return db.session.execute(select(User.id).where(or_(*conditions)).limit(1)).first() is not None
+
+@event.listens_for(User, 'after_insert')
+def _remember_name(mapper, connection, user):
+    # A rolled back insert leaves its names in the filter, which only costs a query later
+    names = current_app.extensions.get('name_filter')
+    if names is not None and names.bloom is not None:
+        with names.lock:
+            names.bloom.add(_username_key(user.username))
+            names.bloom.add(_email_key(user.email))
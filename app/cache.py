@@ -0,0 +1,200 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from flask import current_app, request, stream_with_context
+from flask_login import current_user
+
+class ResponseCache:
+    """
+    A bounded, thread-safe LRU cache of serialized JSON responses.
+
+    Keys are (user_id, path, query) tuples and values are the response body bytes.
+    The cache is bounded by the total size of the stored bodies; the least recently used
+    entries are evicted first. All of a user's entries are dropped together when they write.
+    Entries also expire after ttl seconds, since 'daily'/'weekly' windows move with the clock.
+
+    The cache lives in the worker process, so each gunicorn worker holds its own copy.
+    """
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, ttl=300):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._keys_by_user = defaultdict(set)
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def init_app(self, app):
+        """
+        Configures the cache from RESPONSE_CACHE_MAX_BYTES and RESPONSE_CACHE_TTL and registers it on the app.
+        """
+        self.max_bytes = app.config.get('RESPONSE_CACHE_MAX_BYTES', self.max_bytes)
+        self.ttl = app.config.get('RESPONSE_CACHE_TTL', self.ttl)
+        app.extensions['response_cache'] = self
+
+    def get(self, key):
+        """
+        Returns the cached body for a key, or None, and marks it as recently used.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, body):
+        """
+        Stores a body, evicting least recently used entries until the cache fits.
+        Bodies larger than the whole cache are not stored.
+        """
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (body, time.monotonic() + self.ttl)
+            self._keys_by_user[key[0]].add(key)
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        body, _ = self._entries.pop(key)
+        self._size -= len(body)
+        user_keys = self._keys_by_user[key[0]]
+        user_keys.discard(key)
+        if not user_keys:
+            del self._keys_by_user[key[0]]
+
+    def invalidate_user(self, user_id):
+        """
+        Drops every cached response belonging to a user.
+        """
+        with self._lock:
+            for key in list(self._keys_by_user.get(user_id, ())):
+                self._remove(key)
+            self.invalidations += 1
+
+    def clear(self):
+        """
+        Drops every cached response.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+            self._size = 0
+
+    def stats(self):
+        """
+        Returns the cache counters and current size.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+def cache_key(user_id):
+    """
+    Builds the cache key for the current request: the user, the path and the sorted query arguments.
+    """
+    query = tuple(sorted(request.args.items(multi=True)))
+    return (user_id, request.path, query)
+
+def _time_slot():
+    """
+    Returns the current ETag time slot for responses whose window is relative to now.
+    Queries with an explicit start or end only change when the user writes.
+    """
+    if 'start' in request.args or 'end' in request.args:
+        return 0
+    return int(time.time() // current_app.config.get('RESPONSE_CACHE_TTL', 300))
+
+def request_etag(user):
+    """
+    Builds a strong ETag for the current request from the user's shard and data version,
+    the path, the query arguments and, for relative windows, the current time slot.
+    Versions are counted per shard (see app.models.DataVersion), so the shard is part of the tag.
+    """
+    _, path, query = cache_key(user.id)
+    digest = hashlib.sha1(repr((path, query, _time_slot())).encode()).hexdigest()[:16]
+    return f'{user.id}-{user.shard_id or 0}.{user.data_version}-{digest}'
+
+def _not_modified(etag):
+    return request.if_none_match.contains(etag)
+
+def _revalidate(response, etag):
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def cached_json(build):
+    """
+    Returns a JSON response for the current user, path and query, calling build() only on a miss.
+
+    A matching If-None-Match is answered with 304 before build() runs, so unchanged data
+    costs no log-table queries at all.
+
+    Args:
+        build (callable): Returns the data to serialize. Exceptions propagate and nothing is cached.
+
+    Returns:
+        Response: The JSON response.
+    """
+    etag = request_etag(current_user)
+    if _not_modified(etag):
+        response = current_app.response_class(status=304)
+    elif not current_app.config.get('RESPONSE_CACHE_ENABLED', True):
+        response = current_app.json.response(build())
+    else:
+        # The data version is part of the key, so a worker never serves a body
+        # from before the version current_user carries (see app.identity)
+        key = cache_key(current_user.id) + (current_user.data_version,)
+        body = response_cache.get(key)
+        if body is None:
+            body = current_app.json.dumps(build()).encode()
+            response_cache.set(key, body)
+        response = current_app.response_class(body, mimetype='application/json')
+    return _revalidate(response, etag)
+
+def streamed_json(generate):
+    """
+    Returns a streaming JSON response for the current request, with the same ETag handling
+    as cached_json(). Streamed bodies are never cached.
+
+    Args:
+        generate (callable): Returns an iterable of str chunks; only called when the body is sent.
+
+    Returns:
+        Response: The streaming response, or a 304.
+    """
+    etag = request_etag(current_user)
+    if _not_modified(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(stream_with_context(generate()), mimetype='application/json')
+    return _revalidate(response, etag)
+
+response_cache = ResponseCache()
@@ -0,0 +1,52 @@
+from datetime import date, datetime
+
+EPOCH = date(1970, 1, 1)
+
+# Fields with a handful of distinct values, sent as a dictionary plus codes
+CATEGORICAL_FIELDS = {'type', 'quality'}
+
+def epoch_day(value):
+    """
+    Converts a 'YYYY-MM-DD' string to the number of days since 1970-01-01.
+    """
+    return (date.fromisoformat(value) - EPOCH).days
+
+def epoch_hour(value):
+    """
+    Converts a 'YYYY-MM-DD HH:00' bucket label to the number of hours since 1970-01-01.
+    """
+    return int((datetime.fromisoformat(value) - datetime(1970, 1, 1)).total_seconds() // 3600)
+
+def encode_categories(values):
+    """
+    Encodes repeated strings as a dictionary of distinct values and one integer code per value.
+    """
+    dictionary = {}
+    codes = [dictionary.setdefault(value, len(dictionary)) for value in values]
+    return {'dictionary': list(dictionary), 'codes': codes}
+
+def to_columnar(points, columns, date_unit='day'):
+    """
+    Converts a list of chart points into one array per column.
+
+    Dates become epoch-day integers (or epoch hours for hour buckets) and categorical
+    fields become a dictionary plus codes, so field names are sent once instead of per point.
+
+    Args:
+        points (list): Serialized points, each a dict with a 'date' key.
+        columns (list): The keys of each point, so empty series keep their shape.
+        date_unit (str): 'day' or 'hour'.
+
+    Returns:
+        dict: The columnar payload, including a 'date_unit' key.
+    """
+    to_epoch = epoch_hour if date_unit == 'hour' else epoch_day
+    payload = {'date_unit': date_unit}
+    for column in columns:
+        values = [point[column] for point in points]
+        if column == 'date':
+            values = [to_epoch(value) for value in values]
+        elif column in CATEGORICAL_FIELDS:
+            values = encode_categories(values)
+        payload[column] = values
+    return payload
@@ -0,0 +1,97 @@
+try:
+    import numpy as np
+except ImportError:  # numpy is in requirements.txt; without it the pure Python path is used
+    np = None
+
+# numpy pays a few microseconds per kept point whatever the bucket size, so it only beats
+# the pure Python path once buckets average this many points (see benchmarks/downsample.py)
+VECTORIZE_BUCKET_SIZE = 40
+
+def _lttb_python(values, threshold):
+    """
+    Largest-Triangle-Three-Buckets over evenly spaced points, one point at a time.
+    """
+    n = len(values)
+    every = (n - 2) / (threshold - 2)
+    selected = 0
+    indices = [0]
+    for i in range(threshold - 2):
+        # Average point of the next bucket
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        avg_x = (avg_start + avg_end - 1) / 2
+        avg_y = sum(values[avg_start:avg_end]) / (avg_end - avg_start)
+
+        # Pick the point of this bucket forming the largest triangle with the
+        # previously selected point and the next bucket's average
+        ax, ay = selected, values[selected]
+        max_area = -1
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            area = abs((ax - avg_x) * (values[j] - ay) - (ax - j) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                selected = j
+        indices.append(selected)
+    indices.append(n - 1)
+    return indices
+
+def _lttb_numpy(values, threshold):
+    """
+    Largest-Triangle-Three-Buckets with numpy: bucket averages come from one cumulative
+    sum and each bucket's triangle areas are computed as a single array operation.
+    """
+    y = np.asarray(values, dtype=float)
+    n = len(y)
+    every = (n - 2) / (threshold - 2)
+    starts = np.minimum((np.arange(threshold) * every).astype(np.int64) + 1, n)
+    cumulative = np.concatenate(([0.0], np.cumsum(y)))
+    lengths = starts[2:] - starts[1:-1]
+    avg_y = (cumulative[starts[2:]] - cumulative[starts[1:-1]]) / lengths
+    avg_x = (starts[1:-1] + starts[2:] - 1) / 2
+
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    selected = 0
+    for i in range(threshold - 2):
+        candidates = np.arange(starts[i], starts[i + 1])
+        ay = y[selected]
+        areas = np.abs((selected - avg_x[i]) * (y[candidates] - ay) - (selected - candidates) * (avg_y[i] - ay))
+        selected = int(candidates[np.argmax(areas)])
+        indices[i + 1] = selected
+    return indices.tolist()
+
+def lttb_indices(values, max_points):
+    """
+    Chooses which points to keep so a series drawn with at most max_points points
+    keeps its visual shape (Largest-Triangle-Three-Buckets).
+
+    Points are treated as evenly spaced, which matches how Chart.js lays out the
+    category axis used by the dashboard charts.
+
+    Args:
+        values (list): The y values of the series, in x order.
+        max_points (int): The number of points to keep, at least 3.
+
+    Returns:
+        list: Sorted indices of the points to keep, always including the first and last.
+    """
+    if max_points >= len(values) or max_points < 3:
+        return list(range(len(values)))
+    if np is not None and len(values) >= VECTORIZE_BUCKET_SIZE * max_points:
+        return _lttb_numpy(values, max_points)
+    return _lttb_python(values, max_points)
+
+def downsample(points, field, max_points):
+    """
+    Downsamples a list of chart points (dicts) on one numeric field.
+
+    Args:
+        points (list): The serialized points, in date order.
+        field (str): The key holding the y value; missing values count as 0.
+        max_points (int): The number of points to keep.
+
+    Returns:
+        list: The kept points, in their original order.
+    """
+    values = [point.get(field) or 0 for point in points]
+    return [points[i] for i in lttb_indices(values, max_points)]
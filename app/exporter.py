@@ -0,0 +1,164 @@
+import csv
+import io
+import json
+import zipfile
+from datetime import date
+from sqlalchemy import select, union_all
+from .models import User
+from .ingest import ENTRY_KINDS
+from .streaming import STREAM_BATCH_SIZE
+from . import db, partitions
+
+# Content type of each export format
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'zip': 'application/zip',
+}
+
+# Columns exported for each kind; the files can be imported again with app.importer
+EXPORT_COLUMNS = {kind: ('id', 'date', *fields) for kind, (_, _, fields) in ENTRY_KINDS.items()}
+
+class ExportError(ValueError):
+    """
+    Raised when an export is asked for an unknown format or kind.
+    """
+
+def parse_kinds(value):
+    """
+    Parses a comma-separated list of entry kinds; an empty value means every kind.
+    """
+    kinds = [kind.strip() for kind in value.split(',') if kind.strip()] if value else list(EXPORT_COLUMNS)
+    for kind in kinds:
+        if kind not in EXPORT_COLUMNS:
+            raise ExportError(f"Unknown entry kind '{kind}'")
+    return kinds
+
+def export_statement(kind, user_id):
+    """
+    Builds the SELECT of one kind of a user's entries, oldest first, as plain columns,
+    across the kind's table and all its sealed partitions.
+    """
+    model = ENTRY_KINDS[kind][0]
+    arms = [select(*(table.c[name] for name in EXPORT_COLUMNS[kind])).where(table.c.user_id == user_id)
+            for table in partitions.tables(model)]
+    statement = arms[0] if len(arms) == 1 else union_all(*arms)
+    return statement.order_by(statement.selected_columns.date, statement.selected_columns.id)
+
+def export_rows(kind, user_id):
+    """
+    Returns a user's entries of one kind as Core rows fetched STREAM_BATCH_SIZE at a time,
+    so no ORM objects are built and memory stays flat however long the history is.
+    """
+    statement = export_statement(kind, user_id).execution_options(yield_per=STREAM_BATCH_SIZE)
+    return db.session.execute(statement)
+
+def _value(value):
+    return value.isoformat() if isinstance(value, date) else value
+
+def csv_chunks(kind, user_id):
+    """
+    Writes a user's entries of one kind as CSV with a header row.
+
+    Yields:
+        str: The header, then STREAM_BATCH_SIZE rows at a time.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(EXPORT_COLUMNS[kind])
+    for count, row in enumerate(export_rows(kind, user_id), 1):
+        writer.writerow([_value(value) for value in row])
+        if count % STREAM_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def ndjson_chunks(kinds, user_id):
+    """
+    Writes a user's entries of the given kinds as NDJSON, one object per line with a 'kind' field.
+
+    Yields:
+        str: STREAM_BATCH_SIZE lines at a time.
+    """
+    encoder = json.JSONEncoder(separators=(',', ':'))
+    for kind in kinds:
+        names = EXPORT_COLUMNS[kind]
+        lines = []
+        for row in export_rows(kind, user_id):
+            record = {'kind': kind}
+            record.update(zip(names, map(_value, row)))
+            lines.append(encoder.encode(record))
+            if len(lines) >= STREAM_BATCH_SIZE:
+                yield '\n'.join(lines) + '\n'
+                lines = []
+        if lines:
+            yield '\n'.join(lines) + '\n'
+
+class _ChunkWriter:
+    # An unseekable file for zipfile that keeps what was written until it is drained
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def zip_chunks(kinds, user_id):
+    """
+    Writes a zip bundle with a profile.json and one CSV file per kind.
+
+    The archive is built while it is sent: each CSV chunk is compressed and handed out
+    straight away, so the whole archive never exists in memory or on disk.
+
+    Yields:
+        bytes: Consecutive pieces of the zip file.
+    """
+    output = _ChunkWriter()
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        user = db.session.get(User, user_id)
+        archive.writestr('profile.json', json.dumps(user.to_dict() if user else {}, indent=2))
+        yield output.drain()
+        for kind in kinds:
+            with archive.open(f'{kind}.csv', 'w', force_zip64=True) as member:
+                for chunk in csv_chunks(kind, user_id):
+                    member.write(chunk.encode('utf-8'))
+                    yield output.drain()
+    yield output.drain()
+
+def export_chunks(fmt, kinds, user_id):
+    """
+    Returns the chunks of an export in the given format.
+
+    Args:
+        fmt (str): 'csv' (exactly one kind), 'ndjson' or 'zip'.
+        kinds (list): Entry kinds to include.
+        user_id (int): The user whose entries to export.
+
+    Returns:
+        iterator: str chunks for csv and ndjson, bytes chunks for zip.
+    """
+    if fmt == 'csv':
+        if len(kinds) != 1:
+            raise ExportError('A CSV export holds a single kind; use ndjson or zip for several')
+        return csv_chunks(kinds[0], user_id)
+    if fmt == 'ndjson':
+        return ndjson_chunks(kinds, user_id)
+    if fmt == 'zip':
+        return zip_chunks(kinds, user_id)
+    raise ExportError(f"Unknown export format '{fmt}'")
+
+def export_filename(fmt, kinds):
+    """
+    Returns the download file name of an export, e.g. 'activity.csv' or 'health-export.zip'.
+    """
+    stem = kinds[0] if len(kinds) == 1 and fmt != 'zip' else 'health-export'
+    return f'{stem}.{fmt}'
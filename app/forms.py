@@ -3,6 +3,10 @@ from wtforms import StringField, PasswordField, SubmitField, TextAreaField, Inte
 from wtforms.validators import DataRequired, Length, Email, EqualTo, NumberRange, Optional
 from datetime import datetime
 
+# Choices shared with the bulk ingestion API in app/ingest.py
+ACTIVITY_TYPES = ['Walking', 'Running', 'Cycling', 'Swimming', 'Other']
+SLEEP_QUALITIES = ['Poor', 'Fair', 'Good', 'Excellent']
+
 class RegistrationForm(FlaskForm):
     """
     Form for users to create a new account.
@@ -76,13 +80,7 @@ class ActivityForm(FlaskForm):
     steps = IntegerField('Steps', validators=[DataRequired(), NumberRange(min=0)])
     distance = FloatField('Distance (in km)', validators=[DataRequired(), NumberRange(min=0)])
     calories = IntegerField('Calories', validators=[DataRequired(), NumberRange(min=0)])
-    type = SelectField('Activity Type', choices=[
-        ('Walking', 'Walking'),
-        ('Running', 'Running'),
-        ('Cycling', 'Cycling'),
-        ('Swimming', 'Swimming'),
-        ('Other', 'Other')
-    ], validators=[DataRequired()])
+    type = SelectField('Activity Type', choices=[(t, t) for t in ACTIVITY_TYPES], validators=[DataRequired()])
     duration = IntegerField('Duration (in minutes)', validators=[DataRequired(), NumberRange(min=0)])
     submit = SubmitField('Log Activity')
 
@@ -116,7 +114,7 @@ class SleepForm(FlaskForm):
         submit (SubmitField): Submit button for the form.
     """
     hours = FloatField('Hours Slept', validators=[DataRequired(), NumberRange(min=0)])
-    quality = SelectField('Quality', choices=[('Poor', 'Poor'), ('Fair', 'Fair'), ('Good', 'Good'), ('Excellent', 'Excellent')], validators=[DataRequired()])
+    quality = SelectField('Quality', choices=[(q, q) for q in SLEEP_QUALITIES], validators=[DataRequired()])
     date = DateField('Date', format='%Y-%m-%d', validators=[Optional()])
     submit = SubmitField('Log Sleep')
 
@@ -0,0 +1,249 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import has_request_context
+from flask_login import UserMixin
+from sqlalchemy import event, select
+from sqlalchemy.orm import object_session
+from .models import User, DataVersion
+from .routing import RoutingSession, is_pinned
+from .sharding import shard_engine, shard_engines
+from . import db
+
+class UserIdentity(UserMixin):
+    """
+    The current_user of an authenticated request: the columns needed to authorize, route and
+    cache it, without the profile, password hash or relationships. Views that change the user
+    load the full User row themselves.
+
+    The data version comes from the user's shard, the rest from the directory. A cached
+    data_version can lag behind a write made through another worker. A browser that wrote
+    recently is pinned to the primary for REPLICA_PIN_SECONDS (see app.routing), in every worker,
+    and while it is pinned the version is read from the shard again instead, so users always
+    see their own writes; other clients of the same user see them within USER_CACHE_TTL.
+    """
+
+    def __init__(self, id, username, email, shard_id, data_version):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.shard_id = shard_id
+        self._data_version = data_version
+        self._fresh = False
+
+    @property
+    def data_version(self):
+        if not self._fresh and has_request_context() and is_pinned():
+            self._data_version = read_data_version(self.id, self.shard_id)
+            self._fresh = True
+        return self._data_version
+
+    def __repr__(self):
+        return f'<UserIdentity {self.username}>'
+
+class TokenIdentity(UserIdentity):
+    """
+    The current_user of a request authenticated by an API token. The token was checked against
+    the revocation list, which holds the tokens of deleted users, so the user exists. Like a
+    cookie session, the identity columns and data version come from the user cache, and only a
+    cache miss reads the user row and the version; while there are no shards the shard is known
+    without either. Token clients are never pinned to the primary, so a write made through
+    another worker shows in their data version within USER_CACHE_TTL.
+    """
+
+    def __init__(self, claims):
+        self.id = claims['sub']
+        self._row = None
+
+    @property
+    def shard_id(self):
+        if self._row is None and not shard_engines():
+            return None
+        return self._identity()[3]
+
+    @property
+    def data_version(self):
+        return self._identity()[4]
+
+    @property
+    def username(self):
+        return self._identity()[1]
+
+    @property
+    def email(self):
+        return self._identity()[2]
+
+    def _identity(self):
+        if self._row is None:
+            self._row = identity_row(self.id)
+            if self._row is None:
+                # Deleted since this worker last reloaded the revocation list
+                shard_id = shard_of(self.id)
+                self._row = (self.id, None, None, shard_id, read_data_version(self.id, shard_id))
+        return self._row
+
+    def __repr__(self):
+        return f'<TokenIdentity {self.id}>'
+
+
+class UserCache:
+    """
+    A bounded, thread-safe LRU cache of the identity columns of recently seen users, so that
+    authenticated requests do not load the user row every time.
+
+    Entries expire after ttl seconds. Users changed through the ORM, or whose data version was
+    bumped, are dropped from this process's cache when the change commits; other gunicorn workers
+    see the change once their entry expires, so ttl bounds how long a deleted or moved user keeps
+    their old identity there.
+    """
+
+    def __init__(self, max_entries=10000, ttl=5):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        """
+        Configures the cache from USER_CACHE_MAX_ENTRIES and USER_CACHE_TTL and registers it on the app.
+        """
+        self.max_entries = app.config.get('USER_CACHE_MAX_ENTRIES', self.max_entries)
+        self.ttl = app.config.get('USER_CACHE_TTL', self.ttl)
+        app.extensions['user_cache'] = self
+
+    def get(self, user_id):
+        """
+        Returns the cached identity columns of a user, or None.
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] < time.monotonic():
+                del self._entries[user_id]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, user_id, row):
+        """
+        Stores a user's identity columns, evicting the least recently used user when full.
+        """
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._entries[user_id] = (row, time.monotonic() + self.ttl)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        """
+        Drops a user's cached identity.
+        """
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        """
+        Drops every cached identity.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Returns the cache counters and current size.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+user_cache = UserCache()
+
+def read_data_version(user_id, shard_id):
+    """
+    Reads a user's data version from their shard, never from a replica.
+
+    Returns:
+        int: The version, 0 if the user has never written any log data.
+    """
+    return db.session.execute(
+        select(DataVersion.version).where(DataVersion.user_id == user_id),
+        bind_arguments={'bind': shard_engine(shard_id)},
+    ).scalar() or 0
+
+def shard_of(user_id):
+    """
+    Returns a user's shard id: None without a query while no shards are registered,
+    otherwise from the user cache or with a lookup of the column alone.
+    """
+    row = user_cache.get(user_id)
+    if row is not None:
+        return row[3]
+    if not shard_engines():
+        return None
+    return db.session.execute(select(User.shard_id).where(User.id == user_id)).scalar()
+
+def identity_row(user_id):
+    """
+    Returns the identity columns and data version of a user who has not been deleted, from the
+    cache or with one narrow SELECT in the directory and one on the user's shard, then cached.
+
+    Returns:
+        tuple: (id, username, email, shard_id, data_version), or None if the user does not exist or was deleted.
+    """
+    row = user_cache.get(user_id)
+    if row is None:
+        row = db.session.execute(
+            select(User.id, User.username, User.email, User.shard_id)
+            .where(User.id == user_id, User.deleted_at.is_(None))
+        ).first()
+        if row is None:
+            return None
+        row = (*row, read_data_version(user_id, row.shard_id))
+        user_cache.set(user_id, row)
+    return row
+
+def load_identity(user_id):
+    """
+    Returns the identity of a user who has not been deleted (see identity_row).
+
+    Returns:
+        UserIdentity: The identity, or None if the user does not exist or was deleted.
+    """
+    row = identity_row(user_id)
+    return UserIdentity(*row) if row is not None else None
+
+def forget_on_commit(db_session, user_id):
+    """
+    Drops a user from this process's user cache once the session's transaction commits.
+    """
+    db_session.info.setdefault('updated_users', set()).add(user_id)
+
+@event.listens_for(User, 'after_update')
+def _user_updated(mapper, connection, user):
+    # Profile edits, password changes, soft deletes and shard moves all go through the ORM
+    session = object_session(user)
+    if session is not None:
+        forget_on_commit(session, user.id)
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _forget_updated(db_session):
+    for user_id in db_session.info.pop('updated_users', ()):
+        user_cache.invalidate(user_id)
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _keep_cached(db_session):
+    db_session.info.pop('updated_users', None)
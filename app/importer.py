@@ -0,0 +1,186 @@
+import csv
+import json
+import os
+import threading
+from .models import DataVersion, ImportJob
+from .ingest import ENTRY_KINDS, validate_entries, insert_rows
+from .cache import response_cache
+from .sharding import use_user_shard
+from . import db
+
+FORMATS = ('csv', 'ndjson')
+
+# Default number of records validated and committed together
+IMPORT_CHUNK_SIZE = 5000
+
+# Rejected records kept on the job for reporting; the rest are only counted
+IMPORT_MAX_ERRORS = 100
+
+class ImportFormatError(ValueError):
+    """
+    Raised when an import file's format or default kind is not supported.
+    """
+
+def detect_format(filename):
+    """
+    Guesses an import format from a file name: .csv is CSV, .ndjson/.jsonl/.json are NDJSON.
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.ndjson', '.jsonl', '.json'):
+        return 'ndjson'
+    raise ImportFormatError(f"Cannot tell the format of '{os.path.basename(filename)}'; use csv or ndjson")
+
+def create_job(user_id, path, fmt=None, kind=None):
+    """
+    Creates and commits an import job for a file already on disk.
+
+    Args:
+        user_id (int): The user the entries are imported for.
+        path (str): The file to import.
+        fmt (str): 'csv' or 'ndjson'; guessed from the file name when omitted.
+        kind (str): Kind used for records without a 'kind' field, e.g. 'activity'.
+
+    Returns:
+        ImportJob: The new job.
+    """
+    fmt = fmt or detect_format(path)
+    if fmt not in FORMATS:
+        raise ImportFormatError(f"Unknown import format '{fmt}'")
+    if kind is not None and kind not in ENTRY_KINDS:
+        raise ImportFormatError(f"Unknown entry kind '{kind}'")
+    job = ImportJob(user_id=user_id, path=os.path.abspath(path), format=fmt, kind=kind)
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+def _lines(stream, position):
+    # Reads the binary stream line by line, keeping position[0] at the byte offset
+    # just past the last line handed out
+    for raw in stream:
+        # A byte order mark can only start the file
+        text = raw.decode('utf-8-sig' if position[0] == 0 else 'utf-8')
+        position[0] += len(raw)
+        yield text
+
+def _csv_records(stream, offset):
+    position = [0]
+    header = next(csv.reader(_lines(stream, position)), None)
+    if header is None:
+        return
+    if offset > position[0]:
+        stream.seek(offset)
+        position[0] = offset
+    else:
+        stream.seek(position[0])
+    for values in csv.reader(_lines(stream, position)):
+        if values:
+            yield position[0], dict(zip(header, values))
+
+def _ndjson_records(stream, offset):
+    position = [offset]
+    stream.seek(offset)
+    for line in _lines(stream, position):
+        if line.strip():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None  # Reported as an invalid entry
+            yield position[0], record
+
+def read_records(stream, fmt, offset=0):
+    """
+    Streams the records of an import file starting at a byte offset, one at a time.
+
+    Args:
+        stream: The file, opened in binary mode.
+        fmt (str): 'csv' (with a header row) or 'ndjson'.
+        offset (int): Byte offset of the first record to read; 0 for the start of the file.
+
+    Yields:
+        tuple: (offset just past the record, record dict or None if the line is not valid JSON).
+    """
+    records = _csv_records if fmt == 'csv' else _ndjson_records
+    return records(stream, offset)
+
+def _commit_chunk(job, chunk, offset):
+    entries = []
+    for record in chunk:
+        if isinstance(record, dict) and not record.get('kind') and job.kind:
+            record['kind'] = job.kind
+        entries.append(record)
+    rows, results = validate_entries(entries, job.user_id)
+    inserted = insert_rows(rows)
+    rejected = [result for result in results if result['status'] != 'ok']
+    if rejected:
+        errors = json.loads(job.errors) if job.errors else []
+        for result in rejected[:max(IMPORT_MAX_ERRORS - len(errors), 0)]:
+            errors.append({'record': job.rows_read + result['index'] + 1, 'errors': result['errors']})
+        job.errors = json.dumps(errors)
+    if inserted:
+        DataVersion.bump(job.user_id)
+    job.offset = offset
+    job.rows_read += len(chunk)
+    job.rows_imported += inserted
+    job.rows_rejected += len(rejected)
+    # The chunk's rows, the rollup and the job's new offset commit together
+    db.session.commit()
+    if inserted:
+        response_cache.invalidate_user(job.user_id)
+
+def run_import(job, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    """
+    Runs an import job to completion, resuming from its last committed chunk.
+
+    The file is streamed, so memory use depends on chunk_size, not on the size of the file.
+    Each chunk is validated in one batch, inserted with executemany, and committed together
+    with the job's progress.
+
+    Args:
+        job (ImportJob): The job to run.
+        chunk_size (int): Records per chunk and commit.
+        progress (callable): Called with the job after every committed chunk.
+
+    Returns:
+        ImportJob: The job, 'done' or 'failed'.
+    """
+    job.status = 'running'
+    db.session.commit()
+    try:
+        with open(job.path, 'rb') as stream:
+            chunk, offset = [], job.offset
+            for offset, record in read_records(stream, job.format, job.offset):
+                chunk.append(record)
+                if len(chunk) >= chunk_size:
+                    _commit_chunk(job, chunk, offset)
+                    chunk = []
+                    if progress:
+                        progress(job)
+            if chunk:
+                _commit_chunk(job, chunk, offset)
+                if progress:
+                    progress(job)
+        job.status = 'done'
+    except Exception as e:
+        # Committed chunks stay; the job can be resumed once the cause is fixed
+        db.session.rollback()
+        job.status = 'failed'
+        errors = json.loads(job.errors) if job.errors else []
+        errors.append({'record': job.rows_read + 1, 'errors': {'file': str(e)}})
+        job.errors = json.dumps(errors)
+    db.session.commit()
+    return job
+
+def run_import_in_background(app, user_id, job_id, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Runs one of a user's import jobs in a daemon thread with its own application context.
+    A job interrupted by a restart can be resumed with `manage.py import_entries --resume`.
+    """
+    def run():
+        with app.app_context():
+            use_user_shard(db.session, user_id)
+            run_import(db.session.get(ImportJob, job_id), chunk_size)
+    thread = threading.Thread(target=run, name=f'import-{job_id}', daemon=True)
+    thread.start()
+    return thread
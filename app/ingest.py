@@ -0,0 +1,197 @@
+import math
+from datetime import date, datetime
+from sqlalchemy import insert
+from .models import DataVersion, Activity, Nutrition, Sleep, Mood
+from .forms import ACTIVITY_TYPES, SLEEP_QUALITIES
+from .cache import response_cache
+from . import db, rollup
+
+# SQLite stores integers as signed 64-bit values; larger ones fail at insert time
+INTEGER_MIN, INTEGER_MAX = -2 ** 63, 2 ** 63 - 1
+
+def _integer(minimum=INTEGER_MIN, maximum=INTEGER_MAX):
+    def parse(value):
+        if isinstance(value, bool):
+            raise ValueError('must be an integer')
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        elif isinstance(value, str):
+            value = int(value.strip())
+        elif not isinstance(value, int):
+            raise ValueError('must be an integer')
+        return _check_range(value, minimum, maximum)
+    return parse
+
+def _number(minimum=None, maximum=None):
+    def parse(value):
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            raise ValueError('must be a number')
+        value = float(value)
+        if not math.isfinite(value):
+            raise ValueError('must be a finite number')
+        return _check_range(value, minimum, maximum)
+    return parse
+
+def _check_range(value, minimum, maximum):
+    if minimum is not None and value < minimum:
+        raise ValueError(f'must be at least {minimum}')
+    if maximum is not None and value > maximum:
+        raise ValueError(f'must be at most {maximum}')
+    return value
+
+def _choice(choices):
+    def parse(value):
+        if value not in choices:
+            raise ValueError(f"must be one of {', '.join(choices)}")
+        return value
+    return parse
+
+def _text(max_length):
+    def parse(value):
+        if not isinstance(value, str):
+            raise ValueError('must be a string')
+        if len(value) > max_length:
+            raise ValueError(f'must be at most {max_length} characters')
+        return value
+    return parse
+
+def _parse_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    if not isinstance(value, str):
+        raise ValueError('must be an ISO 8601 date or datetime')
+    parsed = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    # Stored datetimes are naive UTC, like datetime.utcnow() in the form routes
+    if parsed.tzinfo is not None:
+        parsed = (parsed - parsed.utcoffset()).replace(tzinfo=None)
+    return parsed
+
+def _parse_date(value):
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return value
+    return _parse_datetime(value).date()
+
+# For each entry kind: the model, how its date is parsed, and how each field is parsed.
+# Fields in OPTIONAL_FIELDS may be omitted; the rest are required, as in the log forms.
+ENTRY_KINDS = {
+    'activity': (Activity, _parse_datetime, {
+        'steps': _integer(minimum=0),
+        'distance': _number(minimum=0),
+        'calories': _integer(minimum=0),
+        'type': _choice(ACTIVITY_TYPES),
+        'duration': _integer(minimum=0),
+    }),
+    'nutrition': (Nutrition, _parse_date, {
+        'calories': _integer(minimum=0),
+        'protein': _number(minimum=0),
+        'carbs': _number(minimum=0),
+        'fats': _number(minimum=0),
+    }),
+    'sleep': (Sleep, _parse_date, {
+        'hours': _number(minimum=0),
+        'quality': _choice(SLEEP_QUALITIES),
+    }),
+    'mood': (Mood, _parse_date, {
+        'rating': _integer(minimum=1, maximum=10),
+        'notes': _text(255),
+    }),
+}
+
+OPTIONAL_FIELDS = {'notes'}
+
+def validate_entry(kind, data, user_id, now):
+    """
+    Validates one log entry and converts it into a row for its model's table.
+
+    Args:
+        kind (str): One of the keys of ENTRY_KINDS.
+        data (dict): The entry's fields, plus an optional ISO 8601 'date'.
+        user_id (int): The user the entry belongs to.
+        now (datetime): The date used when the entry has none.
+
+    Returns:
+        tuple: (model, row, errors); row is None when errors is not empty.
+    """
+    if kind not in ENTRY_KINDS:
+        return None, None, {'kind': f"must be one of {', '.join(ENTRY_KINDS)}"}
+    model, parse_date, fields = ENTRY_KINDS[kind]
+    row, errors = {'user_id': user_id}, {}
+    for name, parse in fields.items():
+        value = data.get(name)
+        if value is None or value == '':
+            if name in OPTIONAL_FIELDS:
+                row[name] = None
+            else:
+                errors[name] = 'is required'
+            continue
+        try:
+            row[name] = parse(value)
+        except (TypeError, ValueError) as e:
+            errors[name] = str(e) if str(e).startswith('must') else 'is invalid'
+    value = data.get('date')
+    try:
+        row['date'] = parse_date(now if value in (None, '') else value)
+    except (TypeError, ValueError):
+        errors['date'] = 'must be an ISO 8601 date or datetime'
+    return model, (None if errors else row), errors
+
+def validate_entries(entries, user_id, now=None):
+    """
+    Validates a batch of log entries of mixed kinds.
+
+    Args:
+        entries (list): Dicts with a 'kind' key and the fields of that kind.
+        user_id (int): The user the entries belong to.
+        now (datetime): The date used for entries without one; defaults to the current UTC time.
+
+    Returns:
+        tuple: (rows, results) where rows maps each model to its valid rows, in input order,
+        and results holds one {'index', 'status'[, 'errors']} dict per entry.
+    """
+    now = now or datetime.utcnow()
+    rows, results = {}, []
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            results.append({'index': index, 'status': 'invalid', 'errors': {'entry': 'must be an object'}})
+            continue
+        model, row, errors = validate_entry(entry.get('kind'), entry, user_id, now)
+        if errors:
+            results.append({'index': index, 'status': 'invalid', 'errors': errors})
+        else:
+            rows.setdefault(model, []).append(row)
+            results.append({'index': index, 'status': 'ok'})
+    return rows, results
+
+def insert_rows(rows):
+    """
+    Inserts validated rows with one executemany per model and adds them to the daily rollup,
+    in the current session's transaction.
+
+    Args:
+        rows (dict): Mapping of model to a list of row dicts, as returned by validate_entries().
+
+    Returns:
+        int: The number of rows inserted.
+    """
+    inserted = 0
+    for model, model_rows in rows.items():
+        if model_rows:
+            db.session.execute(insert(model.__table__), model_rows)
+            rollup.record_entries(model, model_rows)
+            inserted += len(model_rows)
+    return inserted
+
+def save_rows(user_id, rows):
+    """
+    Inserts a user's validated rows, bumps their data version, commits, and drops the
+    user's cached responses, so a batch costs one transaction however large it is.
+
+    Returns:
+        int: The number of rows inserted.
+    """
+    inserted = insert_rows(rows)
+    if inserted:
+        DataVersion.bump(user_id)
+        db.session.commit()
+        response_cache.invalidate_user(user_id)
+    return inserted
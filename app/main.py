@@ -1,14 +1,48 @@
-from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash
+from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash, abort, current_app, stream_with_context
 from flask_login import login_required, logout_user, current_user
-from datetime import datetime, timedelta
-from werkzeug.security import generate_password_hash
-from .models import User, Activity, Nutrition, Sleep, Mood
-from . import db
+from sqlalchemy import select, func
+from sqlalchemy.exc import IntegrityError
+from datetime import date, datetime, timedelta
+from itsdangerous import URLSafeSerializer, BadData
+from werkzeug.utils import secure_filename
+from .models import User, DataVersion, Activity, Nutrition, Sleep, Mood, DailySummary, ImportJob
+from .queries import QueryError, resolve_range, range_statement, bucket_statement, page_statement
+from .cache import response_cache, cached_json, streamed_json
+from .identity import user_cache
+from .tokens import token_auth
+from .passwords import HashingBusy, password_hasher
+from .availability import name_taken
+from .streaming import STREAM_BATCH_SIZE, json_array_chunks
+from .downsample import downsample
+from .columnar import to_columnar
+from .ingest import validate_entries, save_rows
+from .importer import ImportFormatError, create_job, run_import, run_import_in_background
+from .routing import replica_reads
+from .purge import soft_delete_user, purge_user, purge_in_background
+from .exporter import EXPORT_FORMATS, ExportError, parse_kinds, export_chunks, export_filename
+from . import db, rollup
 from .forms import DeleteProfileForm, ProfileForm, SleepForm, ContactForm, MoodForm, ActivityForm, NutritionForm
 import json
+import os
+import uuid
 
 main = Blueprint('main', __name__)
 
+# Default and maximum page sizes of the /history endpoints
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 500
+
+# Chart series served by the *_data endpoints: the model, the fields serialized for
+# each row, and how numeric fields aggregate into time buckets
+SERIES = {
+    'activity': (Activity, ('steps', 'distance', 'calories', 'type', 'duration'),
+                 {'steps': 'sum', 'distance': 'sum', 'calories': 'sum', 'duration': 'sum'}),
+    'nutrition': (Nutrition, ('calories', 'protein', 'carbs', 'fats'),
+                  {'calories': 'sum', 'protein': 'sum', 'carbs': 'sum', 'fats': 'sum'}),
+    'sleep': (Sleep, ('hours', 'quality'), {'hours': 'avg'}),
+    'mood': (Mood, ('rating', 'notes'), {'rating': 'avg'}),
+}
+
 @main.route('/')
 def home():
     """
@@ -41,18 +75,25 @@ def create_user():
     API route to create a new user. Expects JSON data.
     """
     data = request.get_json()
-    existing_user = User.query.filter_by(username=data['username']).first()
-    existing_email = User.query.filter_by(email=data['email']).first()
-    if existing_user or existing_email:
+    if name_taken(data['username'], data['email']):
         return jsonify({'error': 'Username or email already exists!'}), 400
 
+    try:
+        hashed_password = password_hasher.hash(data['password'])
+    except HashingBusy as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
     new_user = User(
         username=data['username'],
         email=data['email'],
-        password=generate_password_hash(data['password'], method='sha256')
+        password=hashed_password
     )
     db.session.add(new_user)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Taken by someone this worker's name filter has not seen yet
+        db.session.rollback()
+        return jsonify({'error': 'Username or email already exists!'}), 400
     return jsonify({'message': 'User created!'}), 201
 
 @main.route('/profile', methods=['GET', 'POST'])
@@ -62,21 +103,23 @@ def create_or_update_profile():
     Route to create or update the user's profile.
     """
     form = ProfileForm()
+    # current_user only carries the identity columns; the profile lives on the full row
+    user = db.get_or_404(User, current_user.id)
     if form.validate_on_submit():
-        current_user.first_name = form.first_name.data
-        current_user.last_name = form.last_name.data
-        current_user.bio = form.bio.data
-        current_user.location = form.location.data
-        current_user.date_of_birth = form.date_of_birth.data
+        user.first_name = form.first_name.data
+        user.last_name = form.last_name.data
+        user.bio = form.bio.data
+        user.location = form.location.data
+        user.date_of_birth = form.date_of_birth.data
         db.session.commit()
         flash('Your profile has been updated.', 'success')
         return redirect(url_for('main.dashboard'))
     elif request.method == 'GET':
-        form.first_name.data = current_user.first_name
-        form.last_name.data = current_user.last_name
-        form.bio.data = current_user.bio
-        form.location.data = current_user.location
-        form.date_of_birth.data = current_user.date_of_birth
+        form.first_name.data = user.first_name
+        form.last_name.data = user.last_name
+        form.bio.data = user.bio
+        form.location.data = user.location
+        form.date_of_birth.data = user.date_of_birth
     return render_template('profile.html', title='Profile', form=form)
 
 @main.route('/delete_profile', methods=['POST'])
@@ -89,17 +132,18 @@ def delete_profile():
     if form.validate_on_submit():
         user_id = current_user.id
 
-        # Delete all associated records
-        Activity.query.filter_by(user_id=user_id).delete()
-        Nutrition.query.filter_by(user_id=user_id).delete()
-        Sleep.query.filter_by(user_id=user_id).delete()
-        Mood.query.filter_by(user_id=user_id).delete()
-        
-        # Now delete the user
+        # Hide the profile now; its rows are purged in small batches so other writers are not blocked
         user = User.query.filter_by(id=user_id).first_or_404()
+        soft_delete_user(user)
         logout_user()  # Log out the user before deleting the profile
-        db.session.delete(user)
         db.session.commit()
+        response_cache.invalidate_user(user_id)
+        batch_size = current_app.config.get('PURGE_BATCH_SIZE', 1000)
+        pause = current_app.config.get('PURGE_PAUSE', 0.01)
+        if current_app.config.get('PURGE_IN_BACKGROUND', True):
+            purge_in_background(current_app._get_current_object(), user_id, batch_size, pause)
+        else:
+            purge_user(user_id, batch_size, pause)
 
         flash('Your profile has been deleted.', 'success')
         return redirect(url_for('main.home'))
@@ -107,32 +151,56 @@ def delete_profile():
 
 @main.route('/dashboard_data')
 @login_required
+@token_auth('read')
+@replica_reads
 def dashboard():
     """
     Route to display the dashboard data for the current user.
-    """
-    user_id = current_user.id
-
-    sleep_data = Sleep.query.filter_by(user_id=user_id).all()
-    total_sleep_hours = sum(s.hours for s in sleep_data)
-    avg_sleep_hours = total_sleep_hours / len(sleep_data) if sleep_data else 0
-
-    nutrition_data = Nutrition.query.filter_by(user_id=user_id).all()
-    total_calories = sum(n.calories for n in nutrition_data)
-
-    mood_data = Mood.query.filter_by(user_id=user_id).all()
-    mood_counts = {}
-    for mood in mood_data:
-        mood_counts[mood.rating] = mood_counts.get(mood.rating, 0) + 1
+    Returns JSON instead of the dashboard page when the client asks for it.
+    """
+    if wants_json():
+        return cached_json(lambda: get_dashboard_summary(current_user.id))
+    try:
+        bundle = build_dashboard_bundle(current_user.id, fmt='columnar')
+    except QueryError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('main.dashboard'))
+    summary = bundle['summary']
 
+    # The bundle is embedded in the page so the charts draw without any further requests
     return render_template(
         'dashboard.html', 
         name=current_user.username, 
-        avg_sleep_hours=avg_sleep_hours, 
-        total_calories=total_calories, 
-        mood_counts=json.dumps(mood_counts)
+        avg_sleep_hours=summary['avg_sleep_hours'], 
+        total_calories=summary['total_calories'], 
+        mood_counts=json.dumps(summary['mood_counts']),
+        bundle=bundle
     )
 
+@main.route('/dashboard_bundle')
+@login_required
+@token_auth('read')
+@replica_reads
+def dashboard_bundle():
+    """
+    API route returning the dashboard summary and the activity, nutrition, sleep and
+    mood series in a single response.
+    """
+    try:
+        return cached_json(lambda: build_dashboard_bundle(current_user.id))
+    except QueryError as e:
+        return jsonify({'error': str(e)}), 400
+
+@main.route('/cache_stats')
+@login_required
+def cache_stats():
+    """
+    API route exposing the response and user cache counters, enabled by RESPONSE_CACHE_STATS.
+    """
+    if not current_app.config.get('RESPONSE_CACHE_STATS'):
+        abort(404)
+    return jsonify({**response_cache.stats(), 'user_cache': user_cache.stats()}), 200
+
 @main.route('/log_sleep', methods=['GET', 'POST'])
 @login_required
 def log_sleep():
@@ -147,26 +215,21 @@ def log_sleep():
             quality=form.quality.data,
             date=datetime.utcnow().date()
         )
-        db.session.add(sleep)
-        db.session.commit()
+        save_log_entry(sleep)
         flash('Sleep logged successfully!', 'success')
         return redirect(url_for('main.dashboard'))
     return render_template('log_sleep.html', title='Log Sleep', form=form)
 
 @main.route('/sleep_data', methods=['GET'])
 @login_required
+@token_auth('read')
+@replica_reads
 def sleep_data():
     """
-    API route to get sleep data for the current user based on the period.
+    API route to get sleep data for the current user based on the period,
+    an explicit start/end range, and an optional bucket granularity.
     """
-    period = request.args.get('period', 'daily')
-    sleeps = get_sleeps_by_period(current_user.id, period)
-    sleep_data = [{
-        "hours": sleep.hours,
-        "quality": sleep.quality,
-        "date": sleep.date.strftime('%Y-%m-%d')
-    } for sleep in sleeps]
-    return jsonify(sleep_data), 200
+    return series_data(*SERIES['sleep'])
 
 @main.route('/log_mood', methods=['GET', 'POST'])
 @login_required
@@ -182,26 +245,21 @@ def log_mood():
             notes=form.notes.data,
             date=datetime.utcnow().date()
         )
-        db.session.add(new_mood)
-        db.session.commit()
+        save_log_entry(new_mood)
         flash('Mood logged successfully!', 'success')
         return redirect(url_for('main.dashboard'))
     return render_template('log_mood.html', form=form)
 
 @main.route('/mood_data', methods=['GET'])
 @login_required
+@token_auth('read')
+@replica_reads
 def mood_data():
     """
-    API route to get mood data for the current user based on the period.
+    API route to get mood data for the current user based on the period,
+    an explicit start/end range, and an optional bucket granularity.
     """
-    period = request.args.get('period', 'daily')
-    moods = get_moods_by_period(current_user.id, period)
-    mood_data = [{
-        "rating": mood.rating,
-        "notes": mood.notes,
-        "date": mood.date.strftime('%Y-%m-%d')
-    } for mood in moods]
-    return jsonify(mood_data), 200
+    return series_data(*SERIES['mood'])
 
 @main.route('/log_activity', methods=['GET', 'POST'])
 @login_required
@@ -220,29 +278,162 @@ def log_activity():
             duration=form.duration.data,
             date=datetime.utcnow()
         )
-        db.session.add(activity)
-        db.session.commit()
+        save_log_entry(activity)
         flash('Activity logged successfully!', 'success')
         return redirect(url_for('main.dashboard'))
     return render_template('log_activity.html', form=form)
 
 @main.route('/activity_data', methods=['GET'])
 @login_required
+@token_auth('read')
+@replica_reads
 def activity_data():
     """
-    API route to get activity data for the current user based on the period.
+    API route to get activity data for the current user based on the period,
+    an explicit start/end range, and an optional bucket granularity.
+    """
+    return series_data(*SERIES['activity'])
+
+@main.route('/activities')
+@login_required
+def activities():
+    """
+    Route for the activity history page. Entries are loaded page by page from /history/activity.
+    """
+    return render_template('activities.html', title='Your Activities')
+
+@main.route('/history/<kind>', methods=['GET'])
+@login_required
+def history(kind):
+    """
+    API route to page through the current user's activity, nutrition, sleep or mood entries, newest first.
+
+    Query parameters:
+        limit: Page size, 1 to HISTORY_MAX_PAGE_SIZE (default HISTORY_PAGE_SIZE).
+        cursor: The next_cursor of the previous page.
+
+    Returns:
+        JSON: {"items": [...], "next_cursor": str or null}
+    """
+    if kind not in SERIES:
+        abort(404)
+    model, fields, _ = SERIES[kind]
+    try:
+        limit = int(request.args.get('limit', HISTORY_PAGE_SIZE))
+        if not 1 <= limit <= HISTORY_MAX_PAGE_SIZE:
+            raise ValueError
+    except ValueError:
+        return jsonify({'error': f'limit must be between 1 and {HISTORY_MAX_PAGE_SIZE}'}), 400
+    try:
+        after = decode_history_cursor(kind, model, request.args.get('cursor'))
+    except BadData:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    def build():
+        # One extra row tells us whether there is a next page without a COUNT
+        rows = db.session.execute(page_statement(model, current_user.id, limit + 1, after, columns=fields)).all()
+        page = rows[:limit]
+        return {
+            'items': [{'id': row.id, 'date': row.date.isoformat(), **{f: getattr(row, f) for f in fields}}
+                      for row in page],
+            'next_cursor': encode_history_cursor(kind, page[-1]) if len(rows) > limit else None,
+        }
+    return cached_json(build)
+
+@main.route('/entries/bulk', methods=['POST'])
+@login_required
+@token_auth('write')
+def bulk_entries():
+    """
+    API route to log many activity, nutrition, sleep and mood entries for the current user at once.
+
+    The body is {"entries": [{"kind": "activity", "steps": ..., "date": ...}, ...]}; each entry has
+    the fields of its log form and an optional ISO 8601 date. Every entry is validated first,
+    then the valid ones are inserted in a single transaction. With ?atomic=1 nothing is inserted
+    unless every entry is valid.
+
+    Returns:
+        JSON: {"inserted": int, "rejected": int, "results": [{"index", "status", "errors"?}, ...]}
+    """
+    payload = request.get_json(silent=True)
+    entries = payload.get('entries') if isinstance(payload, dict) else payload
+    if not isinstance(entries, list):
+        return jsonify({'error': 'Expected a JSON list of entries'}), 400
+    max_entries = current_app.config.get('BULK_MAX_ENTRIES', 10000)
+    if len(entries) > max_entries:
+        return jsonify({'error': f'At most {max_entries} entries per request'}), 413
+    rows, results = validate_entries(entries, current_user.id)
+    rejected = sum(result['status'] != 'ok' for result in results)
+    if rejected and request.args.get('atomic') in ('1', 'true'):
+        return jsonify({'inserted': 0, 'rejected': rejected, 'results': results}), 422
+    inserted = save_rows(current_user.id, rows)
+    return jsonify({'inserted': inserted, 'rejected': rejected, 'results': results})
+
+@main.route('/imports', methods=['POST'])
+@login_required
+def create_import():
+    """
+    API route to import a CSV or NDJSON file of log entries for the current user.
+
+    Form fields:
+        file: The file to import. CSV files need a header row naming the entry fields.
+        format: 'csv' or 'ndjson'; guessed from the file name when omitted.
+        kind: Kind of the records that have no 'kind' field, e.g. 'activity'.
+
+    Returns:
+        JSON: The import job, with status 202 while it runs in the background.
+    """
+    upload = request.files.get('file')
+    if upload is None or not upload.filename:
+        return jsonify({'error': 'No file uploaded'}), 400
+    folder = current_app.config['IMPORT_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f'{uuid.uuid4().hex}-{secure_filename(upload.filename)}')
+    upload.save(path)
+    try:
+        job = create_job(current_user.id, path, request.form.get('format') or None, request.form.get('kind') or None)
+    except ImportFormatError as e:
+        os.remove(path)
+        return jsonify({'error': str(e)}), 400
+    chunk_size = current_app.config.get('IMPORT_CHUNK_SIZE', 5000)
+    if current_app.config.get('IMPORT_IN_BACKGROUND', True):
+        run_import_in_background(current_app._get_current_object(), current_user.id, job.id, chunk_size)
+        return jsonify(job.to_dict()), 202
+    return jsonify(run_import(job, chunk_size).to_dict())
+
+@main.route('/imports/<int:job_id>', methods=['GET'])
+@login_required
+def import_status(job_id):
+    """
+    API route to check the progress of one of the current user's imports.
     """
-    period = request.args.get('period', 'daily')
-    activities = get_activities_by_period(current_user.id, period)
-    activity_data = [{
-        "steps": a.steps,
-        "distance": a.distance,
-        "calories": a.calories,
-        "type": a.type,
-        "duration": a.duration,
-        "date": a.date.strftime('%Y-%m-%d')
-    } for a in activities]
-    return jsonify(activity_data), 200
+    job = db.session.get(ImportJob, job_id)
+    if job is None or job.user_id != current_user.id:
+        abort(404)
+    return jsonify(job.to_dict())
+
+@main.route('/export', methods=['GET'])
+@login_required
+@replica_reads
+def export():
+    """
+    API route to download the current user's complete history, streamed as it is read.
+
+    Query parameters:
+        format: 'csv' (one kind), 'ndjson' or 'zip' (profile.json plus one CSV per kind). Default 'zip'.
+        kind: Comma-separated entry kinds to include; every kind when omitted.
+    """
+    fmt = request.args.get('format', 'zip')
+    try:
+        kinds = parse_kinds(request.args.get('kind'))
+        chunks = export_chunks(fmt, kinds, current_user.id)
+    except ExportError as e:
+        return jsonify({'error': str(e)}), 400
+    response = current_app.response_class(stream_with_context(chunks), mimetype=EXPORT_FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{export_filename(fmt, kinds)}"'
+    response.cache_control.private = True
+    response.cache_control.no_store = True
+    return response
 
 @main.route('/log_nutrition', methods=['GET', 'POST'])
 @login_required
@@ -260,85 +451,222 @@ def log_nutrition():
             fats=form.fats.data,
             date=datetime.utcnow().date()
         )
-        db.session.add(nutrition)
-        db.session.commit()
+        save_log_entry(nutrition)
         flash('Nutrition logged successfully!', 'success')
         return redirect(url_for('main.dashboard'))
     return render_template('log_nutrition.html', title='Log Nutrition', form=form)
 
 @main.route('/nutrition_data', methods=['GET'])
 @login_required
+@token_auth('read')
+@replica_reads
 def nutrition_data():
     """
-    API route to get nutrition data for the current user based on the period.
-    """
-    period = request.args.get('period', 'daily')
-    nutritions = get_nutritions_by_period(current_user.id, period)
-    nutrition_data = [{
-        "calories": n.calories,
-        "protein": n.protein,
-        "carbs": n.carbs,
-        "fats": n.fats,
-        "date": n.date.strftime('%Y-%m-%d')
-    } for n in nutritions]
-    return jsonify(nutrition_data), 200
-
-def get_activities_by_period(user_id, period):
-    """
-    Helper function to get activities based on the specified period.
-    """
-    now = datetime.utcnow()
-    if period == 'daily':
-        start_date = now - timedelta(days=1)
-    elif period == 'weekly':
-        start_date = now - timedelta(weeks=1)
-    elif period == 'monthly':
-        start_date = now - timedelta(days=30)
-    else:
-        start_date = now - timedelta(days=1)
-    return Activity.query.filter(Activity.user_id == user_id, Activity.date >= start_date).all()
-
-def get_nutritions_by_period(user_id, period):
-    """
-    Helper function to get nutrition data based on the specified period.
-    """
-    now = datetime.utcnow()
-    if period == 'daily':
-        start_date = now - timedelta(days=1)
-    elif period == 'weekly':
-        start_date = now - timedelta(weeks=1)
-    elif period == 'monthly':
-        start_date = now - timedelta(days=30)
-    else:
-        start_date = now - timedelta(days=1)
-    return Nutrition.query.filter(Nutrition.user_id == user_id, Nutrition.date >= start_date).all()
-
-def get_sleeps_by_period(user_id, period):
-    """
-    Helper function to get sleep data based on the specified period.
-    """
-    now = datetime.utcnow()
-    if period == 'daily':
-        start_date = now - timedelta(days=1)
-    elif period == 'weekly':
-        start_date = now - timedelta(weeks=1)
-    elif period == 'monthly':
-        start_date = now - timedelta(days=30)
-    else:
-        start_date = now - timedelta(days=1)
-    return Sleep.query.filter(Sleep.user_id == user_id, Sleep.date >= start_date).all()
-
-def get_moods_by_period(user_id, period):
-    """
-    Helper function to get mood data based on the specified period.
-    """
-    now = datetime.utcnow()
-    if period == 'daily':
-        start_date = now - timedelta(days=1)
-    elif period == 'weekly':
-        start_date = now - timedelta(weeks=1)
-    elif period == 'monthly':
-        start_date = now - timedelta(days=30)
-    else:
-        start_date = now - timedelta(days=1)
-    return Mood.query.filter(Mood.user_id == user_id, Mood.date >= start_date).all()
+    API route to get nutrition data for the current user based on the period,
+    an explicit start/end range, and an optional bucket granularity.
+    """
+    return series_data(*SERIES['nutrition'])
+
+def parse_datetime_arg(args, name, end=False):
+    """
+    Helper function to parse an ISO date or datetime query parameter.
+    A date-only end bound covers the whole day.
+    """
+    value = args.get(name)
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise QueryError(f"Invalid {name} '{value}', expected YYYY-MM-DD or an ISO datetime") from None
+    if end and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+def series_data(model, fields, aggregates):
+    """
+    Helper function shared by the *_data endpoints.
+    Responses are cached per user and query until the user next writes.
+
+    Query parameters:
+        period: 'daily', 'weekly' or 'monthly' lookback window (default 'daily').
+        start, end: Explicit range, overriding period. A date-only end is inclusive.
+        granularity: 'hour', 'day', 'week' or 'month' to aggregate rows into buckets in SQL.
+            Day and coarser buckets are read from the daily rollup.
+        fields: Comma-separated subset of fields to return.
+        stream: When set, rows are streamed as they are read instead of being
+            built into one response, so memory stays flat for long ranges.
+        max_points: Downsample the series to at most this many points with
+            Largest-Triangle-Three-Buckets. Takes precedence over stream.
+        format: 'columnar' returns one array per field, with epoch-day dates and
+            categorical fields as a dictionary plus codes. Takes precedence over stream.
+
+    Args:
+        model: The log model to query.
+        fields (tuple): The fields the endpoint serializes for each row.
+        aggregates (dict): How each numeric field is aggregated into a bucket.
+    """
+    try:
+        if request.args.get('stream') and not request.args.get('max_points') \
+                and request.args.get('format') != 'columnar':
+            statement, _, serialize = plan_series(model, fields, aggregates, current_user.id)
+            return streamed_json(lambda: json_array_chunks(
+                db.session.execute(statement.execution_options(yield_per=STREAM_BATCH_SIZE)), serialize))
+        return cached_json(lambda: build_series(model, fields, aggregates, current_user.id))
+    except QueryError as e:
+        return jsonify({'error': str(e)}), 400
+
+def plan_series(model, fields, aggregates, user_id, args=None):
+    """
+    Helper function to turn the query parameters of a *_data endpoint, the current request's
+    by default, into a statement, the keys of each serialized point and a function
+    serializing each row. Raises QueryError for invalid parameters.
+    """
+    args = request.args if args is None else args
+    start, end = resolve_range(args.get('period'),
+                               parse_datetime_arg(args, 'start'), parse_datetime_arg(args, 'end', end=True))
+    requested = args.get('fields')
+    if requested:
+        unknown = set(requested.split(',')) - set(fields)
+        if unknown:
+            raise QueryError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        fields = tuple(f for f in fields if f in requested.split(','))
+
+    granularity = args.get('granularity')
+    if granularity:
+        if granularity in rollup.ROLLUP_GRANULARITIES:
+            fields = tuple(f for f in fields if f in rollup.SERIES[model])
+            statement = rollup.bucket_statement(model, user_id, granularity, fields, start, end)
+        else:
+            fields = tuple(f for f in fields if f in aggregates)
+            statement = bucket_statement(model, user_id, granularity,
+                                         {f: aggregates[f] for f in fields}, start, end)
+        return statement, ['date', 'count', *fields], lambda row: {'date': row.bucket, 'count': row.count,
+                                       **{f: getattr(row, f) for f in fields}}
+
+    statement = range_statement(model, user_id, start, end, columns=(*fields, 'date'))
+    return statement, [*fields, 'date'], lambda row: {**{f: getattr(row, f) for f in fields},
+                                   'date': row.date.strftime('%Y-%m-%d')}
+
+def build_series(model, fields, aggregates, user_id, args=None):
+    """
+    Helper function to build the payload of a *_data endpoint as a list,
+    downsampled on the series' first numeric field when max_points is given,
+    or as one array per field when format is 'columnar'.
+    """
+    args = request.args if args is None else args
+    max_points = parse_max_points(args)
+    statement, columns, serialize = plan_series(model, fields, aggregates, user_id, args)
+    data = [serialize(row) for row in db.session.execute(statement)]
+    if max_points and data:
+        field = next((f for f in fields if f in aggregates and f in columns), 'count')
+        data = downsample(data, field, max_points)
+    if args.get('format') == 'columnar':
+        return to_columnar(data, columns, 'hour' if args.get('granularity') == 'hour' else 'day')
+    return data
+
+def parse_max_points(args):
+    """
+    Helper function to parse the max_points query parameter.
+    """
+    value = args.get('max_points')
+    if not value:
+        return None
+    try:
+        max_points = int(value)
+    except ValueError:
+        max_points = 0
+    if max_points < 3:
+        raise QueryError(f"Invalid max_points '{value}', expected an integer of at least 3")
+    return max_points
+
+def build_dashboard_bundle(user_id, fmt=None):
+    """
+    Helper function to build the dashboard summary and all four chart series in one go,
+    sharing the request's database session. The period, start, end, granularity,
+    max_points and format query parameters apply to every series; fmt overrides format.
+    """
+    args = {name: request.args[name] for name in ('period', 'start', 'end', 'granularity', 'max_points', 'format')
+            if name in request.args}
+    if fmt:
+        args['format'] = fmt
+    bundle = {'summary': get_dashboard_summary(user_id)}
+    for name, (model, fields, aggregates) in SERIES.items():
+        bundle[name] = build_series(model, fields, aggregates, user_id, args)
+    return bundle
+
+def save_log_entry(entry):
+    """
+    Helper function to save a new log entry: adds it to the daily rollup and bumps the
+    user's data version in the same transaction, commits, and drops the user's cached responses.
+    """
+    db.session.add(entry)
+    rollup.record_entry(entry)
+    DataVersion.bump(entry.user_id)
+    db.session.commit()
+    response_cache.invalidate_user(entry.user_id)
+
+def history_serializer():
+    """
+    Helper function returning the serializer that signs history cursors, so they stay opaque to clients.
+    """
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='history-cursor')
+
+def encode_history_cursor(kind, row):
+    """
+    Helper function to encode the (date, id) position of a row as a continuation token.
+    """
+    return history_serializer().dumps([kind, row.date.isoformat(), row.id])
+
+def decode_history_cursor(kind, model, token):
+    """
+    Helper function to decode a continuation token into a (date, id) position.
+    Raises BadData if the token is malformed, tampered with or belongs to another kind.
+    """
+    if not token:
+        return None
+    try:
+        token_kind, value, row_id = history_serializer().loads(token)
+        parse = datetime.fromisoformat if isinstance(model.date.type, db.DateTime) else date.fromisoformat
+        position = (parse(value), int(row_id))
+    except (TypeError, ValueError) as e:
+        raise BadData('Malformed cursor') from e
+    if token_kind != kind:
+        raise BadData('Cursor belongs to another history')
+    return position
+
+def wants_json():
+    """
+    Helper function to check whether the client asked for a JSON response,
+    either with ?format=json or an Accept header preferring application/json.
+    """
+    if request.args.get('format') == 'json':
+        return True
+    return request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json'
+
+def dashboard_queries(user_id):
+    """
+    Helper function to build the aggregate queries behind the dashboard summary.
+    Every figure is read from the daily rollup, so each costs one row per day logged.
+    """
+    ratings = [func.sum(DailySummary.__table__.c[f'mood_rating_{rating}']) for rating in rollup.MOOD_RATINGS]
+    return {
+        'avg_sleep_hours': select(func.sum(DailySummary.sleep_hours) / func.nullif(func.sum(DailySummary.sleep_count), 0))
+                           .where(DailySummary.user_id == user_id),
+        'total_calories': select(func.sum(DailySummary.nutrition_calories)).where(DailySummary.user_id == user_id),
+        'mood_counts': select(*ratings).where(DailySummary.user_id == user_id),
+    }
+
+def get_dashboard_summary(user_id):
+    """
+    Helper function to compute the dashboard summary for a user in SQL.
+    """
+    queries = dashboard_queries(user_id)
+    avg_sleep_hours = db.session.execute(queries['avg_sleep_hours']).scalar()
+    total_calories = db.session.execute(queries['total_calories']).scalar()
+    mood_counts = db.session.execute(queries['mood_counts']).one()
+    return {
+        'avg_sleep_hours': avg_sleep_hours or 0,
+        'total_calories': total_calories or 0,
+        'mood_counts': {str(rating): count for rating, count in zip(rollup.MOOD_RATINGS, mood_counts) if count},
+    }
@@ -1,7 +1,9 @@
 from . import db
+import json
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from flask_login import UserMixin
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from .passwords import password_hasher
 
 class User(UserMixin, db.Model):
     """
@@ -11,28 +13,33 @@ class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password = db.Column(db.String(128), nullable=False)
+    password = db.Column(db.String(255), nullable=False)
     first_name = db.Column(db.String(100))
     last_name = db.Column(db.String(100))
     bio = db.Column(db.Text)
     location = db.Column(db.String(100))
     date_of_birth = db.Column(db.Date)
-    activities = db.relationship('Activity', backref='user', lazy=True)
-    nutrition_entries = db.relationship('Nutrition', backref='user', lazy=True)
-    sleep_entries = db.relationship('Sleep', backref='user', lazy=True)
-    mood_entries = db.relationship('Mood', backref='user', lazy=True)
+    # Set when the profile is deleted; the user is hidden at once and their rows are purged in the background
+    deleted_at = db.Column(db.DateTime, index=True)
+    # Shard holding the user's log data (see app/sharding.py); None means this directory database
+    shard_id = db.Column(db.Integer, index=True)
+    # Log rows are removed by ON DELETE CASCADE or app.purge, never loaded to be deleted one by one
+    activities = db.relationship('Activity', backref='user', lazy=True, passive_deletes=True)
+    nutrition_entries = db.relationship('Nutrition', backref='user', lazy=True, passive_deletes=True)
+    sleep_entries = db.relationship('Sleep', backref='user', lazy=True, passive_deletes=True)
+    mood_entries = db.relationship('Mood', backref='user', lazy=True, passive_deletes=True)
 
     def set_password(self, password):
         """
         Sets the user's password to a hashed version of the provided password.
         """
-        self.password = generate_password_hash(password)
+        self.password = password_hasher.hash(password)
 
     def check_password(self, password):
         """
         Checks if the provided password matches the hashed password stored in the database.
         """
-        return check_password_hash(self.password, password)
+        return password_hasher.verify(self.password, password)
 
     def __repr__(self):
         return f'<User {self.username}>'
@@ -52,13 +59,43 @@ class User(UserMixin, db.Model):
             'date_of_birth': self.date_of_birth.strftime('%Y-%m-%d') if self.date_of_birth else None,
         }
 
+class DataVersion(db.Model):
+    """
+    Defines a DataVersion class that inherits from db.Model, making it a model class for SQLAlchemy.
+    This class holds the version of a user's log data, bumped on every write to it and used to build
+    ETags for chart responses. It lives on the user's shard next to the data it versions, so a log
+    write commits to that one database and never touches the directory.
+    """
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def bump(user_id):
+        """
+        Increments a user's data version in the current transaction, on the session's selected shard.
+        The increment happens in SQL so concurrent writers never reuse a version.
+        """
+        statement = sqlite_insert(DataVersion).values(user_id=user_id, version=1)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=[DataVersion.user_id], set_={'version': DataVersion.version + 1}
+        ))
+        from .identity import forget_on_commit  # app.identity needs the models
+        forget_on_commit(db.session, user_id)
+
+    def __repr__(self):
+        return f'<DataVersion {self.user_id} {self.version}>'
+
 class Activity(db.Model):
     """
     Defines an Activity class that inherits from db.Model, making it a model class for SQLAlchemy.
     This class represents physical activities logged by users.
     """
+    # AUTOINCREMENT ids are never reused, so rows added after the newest ones were sealed into a
+    # partition (see app/partitions.py) cannot take the ids of partitioned rows
+    __table_args__ = (db.Index('ix_activity_user_id_date', 'user_id', 'date'), {'sqlite_autoincrement': True})
+
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     steps = db.Column(db.Integer, nullable=False)
     distance = db.Column(db.Float, nullable=False)
@@ -89,8 +126,10 @@ class Nutrition(db.Model):
     Defines a Nutrition class that inherits from db.Model, making it a model class for SQLAlchemy.
     This class represents nutrition entries logged by users.
     """
+    __table_args__ = (db.Index('ix_nutrition_user_id_date', 'user_id', 'date'), {'sqlite_autoincrement': True})
+
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     date = db.Column(db.Date, nullable=False, default=datetime.utcnow)
     calories = db.Column(db.Integer, nullable=False)
     protein = db.Column(db.Float, nullable=False)
@@ -119,8 +158,10 @@ class Sleep(db.Model):
     Defines a Sleep class that inherits from db.Model, making it a model class for SQLAlchemy.
     This class represents sleep data logged by users.
     """
+    __table_args__ = (db.Index('ix_sleep_user_id_date', 'user_id', 'date'), {'sqlite_autoincrement': True})
+
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     date = db.Column(db.Date, nullable=False, default=datetime.utcnow)
     hours = db.Column(db.Float, nullable=False)
     quality = db.Column(db.String(50), nullable=False)
@@ -145,8 +186,10 @@ class Mood(db.Model):
     Defines a Mood class that inherits from db.Model, making it a model class for SQLAlchemy.
     This class represents mood entries logged by users.
     """
+    __table_args__ = (db.Index('ix_mood_user_id_date', 'user_id', 'date'), {'sqlite_autoincrement': True})
+
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     date = db.Column(db.Date, nullable=False, default=datetime.utcnow)
     rating = db.Column(db.Integer, nullable=False)  # Scale of 1-10
     notes = db.Column(db.String(255), nullable=True)
@@ -165,3 +208,158 @@ class Mood(db.Model):
             'rating': self.rating,
             'notes': self.notes
         }
+
+
+class DailySummary(db.Model):
+    """
+    Defines a DailySummary class that inherits from db.Model, making it a model class for SQLAlchemy.
+    This class holds per-user, per-day totals of the log tables. It is kept up to date by
+    app.rollup in the same transaction as each log entry, so reads scale with days, not entries.
+    """
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    steps = db.Column(db.Integer, nullable=False, default=0)
+    distance = db.Column(db.Float, nullable=False, default=0)
+    activity_calories = db.Column(db.Integer, nullable=False, default=0)
+    duration = db.Column(db.Integer, nullable=False, default=0)
+    activity_count = db.Column(db.Integer, nullable=False, default=0)
+    nutrition_calories = db.Column(db.Integer, nullable=False, default=0)
+    protein = db.Column(db.Float, nullable=False, default=0)
+    carbs = db.Column(db.Float, nullable=False, default=0)
+    fats = db.Column(db.Float, nullable=False, default=0)
+    nutrition_count = db.Column(db.Integer, nullable=False, default=0)
+    sleep_hours = db.Column(db.Float, nullable=False, default=0)
+    sleep_count = db.Column(db.Integer, nullable=False, default=0)
+    mood_sum = db.Column(db.Integer, nullable=False, default=0)
+    mood_count = db.Column(db.Integer, nullable=False, default=0)
+    mood_rating_1 = db.Column(db.Integer, nullable=False, default=0)
+    mood_rating_2 = db.Column(db.Integer, nullable=False, default=0)
+    mood_rating_3 = db.Column(db.Integer, nullable=False, default=0)
+    mood_rating_4 = db.Column(db.Integer, nullable=False, default=0)
+    mood_rating_5 = db.Column(db.Integer, nullable=False, default=0)
+    mood_rating_6 = db.Column(db.Integer, nullable=False, default=0)
+    mood_rating_7 = db.Column(db.Integer, nullable=False, default=0)
+    mood_rating_8 = db.Column(db.Integer, nullable=False, default=0)
+    mood_rating_9 = db.Column(db.Integer, nullable=False, default=0)
+    mood_rating_10 = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<DailySummary {self.user_id} {self.day}>'
+
+class ImportJob(db.Model):
+    """
+    Defines an ImportJob class that inherits from db.Model, making it a model class for SQLAlchemy.
+    This class tracks a CSV or NDJSON import of log entries. The byte offset of the last committed
+    chunk is saved in the same transaction as the chunk's rows, so an interrupted import resumes
+    exactly where it stopped.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    path = db.Column(db.String(255), nullable=False)
+    format = db.Column(db.String(10), nullable=False)  # 'csv' or 'ndjson'
+    kind = db.Column(db.String(20))  # Default kind for records without a 'kind' field
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, done, failed
+    offset = db.Column(db.Integer, nullable=False, default=0)
+    rows_read = db.Column(db.Integer, nullable=False, default=0)
+    rows_imported = db.Column(db.Integer, nullable=False, default=0)
+    rows_rejected = db.Column(db.Integer, nullable=False, default=0)
+    errors = db.Column(db.Text)  # JSON list of the first rejected records
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ImportJob {self.id} {self.status}>'
+
+    def to_dict(self):
+        """
+        Returns a dictionary representation of the import job.
+        """
+        return {
+            'id': self.id,
+            'format': self.format,
+            'kind': self.kind,
+            'status': self.status,
+            'rows_read': self.rows_read,
+            'rows_imported': self.rows_imported,
+            'rows_rejected': self.rows_rejected,
+            'errors': json.loads(self.errors) if self.errors else [],
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat(),
+        }
+
+class Shard(db.Model):
+    """
+    Defines a Shard class that inherits from db.Model, making it a model class for SQLAlchemy.
+    This class lists the database files users' log data is spread over. It lives in the
+    directory database next to User; each user's shard_id points at one of these rows.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    url = db.Column(db.String(255), unique=True, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<Shard {self.id} {self.url}>'
+
+class ShardMove(db.Model):
+    """
+    Defines a ShardMove class that inherits from db.Model, making it a model class for SQLAlchemy.
+    This class records a move of a user's data to another shard (see app/rebalance.py) from its
+    start until the old shard is cleared. It lives in the directory and is switched together with
+    the user's shard_id, so a move interrupted at any point can be finished without losing rows.
+    """
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    source = db.Column(db.Integer)  # Shard ids; None is the directory database
+    target = db.Column(db.Integer)
+    marks = db.Column(db.Text)  # JSON: table name -> last id on the old shard copied to the new one
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    switched_at = db.Column(db.DateTime)  # When the user was pointed at the new shard
+
+    def __repr__(self):
+        return f'<ShardMove {self.user_id} {self.source} -> {self.target}>'
+
+class LogPartition(db.Model):
+    """
+    Defines a LogPartition class that inherits from db.Model, making it a model class for SQLAlchemy.
+    This class catalogs the sealed monthly partitions older log rows were moved to (see app/partitions.py).
+    Each database holding log tables, the directory or a shard, has its own catalog.
+    """
+    __table_args__ = (db.UniqueConstraint('parent', 'month'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    parent = db.Column(db.String(50), nullable=False)  # Name of the partitioned table, e.g. 'activity'
+    month = db.Column(db.Date, nullable=False)  # First day of the month the partition holds
+    rows = db.Column(db.Integer, nullable=False)
+    sealed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    compacted_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime)  # Set once the partition moved to the archive database
+
+    def __repr__(self):
+        return f'<LogPartition {self.parent} {self.month:%Y-%m}>'
+
+class RevokedToken(db.Model):
+    """
+    Defines a RevokedToken class that inherits from db.Model, making it a model class for SQLAlchemy.
+    This class lists API tokens revoked before they expire (see app/tokens.py). Each worker keeps
+    the ids of the unexpired ones in memory and reloads them every API_TOKEN_REVOCATION_REFRESH seconds.
+    """
+    jti = db.Column(db.String(32), primary_key=True)  # The token's id
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    revoked_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<RevokedToken {self.jti}>'
+
+class RevokedUser(db.Model):
+    """
+    Defines a RevokedUser class that inherits from db.Model, making it a model class for SQLAlchemy.
+    This class lists users all of whose API tokens were revoked, e.g. when they deleted their profile:
+    tokens issued up to revoked_at are refused until expires_at, when the last of them has expired.
+    There is no foreign key to user, since the entry must outlive the purged user row.
+    """
+    user_id = db.Column(db.Integer, primary_key=True)
+    revoked_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<RevokedUser {self.user_id}>'
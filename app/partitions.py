@@ -0,0 +1,267 @@
+import threading
+from datetime import date, datetime
+from flask import current_app
+from sqlalchemy import Column, Index, MetaData, Table, select, insert, delete, func, text
+from .models import Activity, Nutrition, Sleep, Mood, LogPartition
+from .sqlite import ARCHIVE_SCHEMA
+from . import db
+
+# Log models split into monthly partitions. New rows always go to the model's own table;
+# once a month is older than the hot window its rows move to a table of their own, which
+# is sealed: it only ever loses rows again, to app.purge.
+PARTITIONED_MODELS = (Activity, Nutrition, Sleep, Mood)
+
+# Partition tables are kept out of db.metadata so create_all, drop_all and Alembic leave them alone
+_metadata = MetaData()
+_lock = threading.Lock()
+
+def month_start(value):
+    """
+    Returns the first day of the month of a date or datetime.
+    """
+    return date(value.year, value.month, 1)
+
+def add_months(month, count):
+    """
+    Returns the first day of the month count months after (or before, if negative) a month.
+    """
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(model, month):
+    """
+    Returns the name of a model's partition table for a month, e.g. 'activity_2024_05'.
+    """
+    return f'{model.__tablename__}_{month:%Y_%m}'
+
+def partition_table(model, month, archived=False):
+    """
+    Returns the Table of a model's partition for a month: the model's columns under a new name,
+    with its own (user_id, date) index and no foreign keys. Archived partitions live in the
+    archive database, under the same name.
+    """
+    name = partition_name(model, month)
+    schema = ARCHIVE_SCHEMA if archived else None
+    key = f'{schema}.{name}' if schema else name
+    with _lock:
+        if key not in _metadata.tables:
+            columns = [Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable)
+                       for c in model.__table__.c]
+            Table(name, _metadata, *columns, Index(f'ix_{name}_user_id_date', 'user_id', 'date'),
+                  schema=schema, info={'parent': model.__tablename__})
+        return _metadata.tables[key]
+
+def sealed_partitions(model, start=None, end=None):
+    """
+    Returns (month, archived) for each of a model's sealed partitions that overlap [start, end], newest first.
+    """
+    statement = select(LogPartition.month, LogPartition.archived_at.is_not(None)) \
+        .where(LogPartition.parent == model.__tablename__)
+    if start is not None:
+        statement = statement.where(LogPartition.month >= month_start(start))
+    if end is not None:
+        statement = statement.where(LogPartition.month <= end)
+    return db.session.execute(statement.order_by(LogPartition.month.desc())).all()
+
+def sealed_months(model, start=None, end=None):
+    """
+    Returns the months of a model's sealed partitions that overlap [start, end], newest first.
+    """
+    return [month for month, _ in sealed_partitions(model, start, end)]
+
+def tables(model, start=None, end=None):
+    """
+    Returns the tables holding a model's rows dated in [start, end]: the model's own table,
+    which takes every write including back-dated ones, then the sealed partitions overlapping
+    the range, live or archived. Partitions outside the range are never read, so the archive
+    is only opened for ranges that reach back that far.
+    """
+    if model not in PARTITIONED_MODELS:
+        return [model.__table__]
+    return [model.__table__, *(partition_table(model, month, archived)
+                               for month, archived in sealed_partitions(model, start, end))]
+
+def _connection(model):
+    return db.session.connection(bind_arguments={'mapper': model.__mapper__})
+
+def _trigger_names(table):
+    prefix = f'{table.schema}.' if table.schema else ''
+    return {event: f'{prefix}{table.name}_sealed_{event.lower()}' for event in ('INSERT', 'UPDATE')}
+
+def _seal(connection, table):
+    # Sealed partitions refuse new and changed rows; deletes stay allowed so profiles can be purged
+    for event, trigger in _trigger_names(table).items():
+        connection.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {trigger} BEFORE {event} ON {table.name} "
+            f"BEGIN SELECT RAISE(ABORT, '{table.name} is a sealed partition'); END"
+        )
+
+def _unseal(connection, table):
+    for trigger in _trigger_names(table).values():
+        connection.exec_driver_sql(f'DROP TRIGGER IF EXISTS {trigger}')
+
+def _bound(column, month):
+    return datetime(month.year, month.month, 1) if isinstance(column.type, db.DateTime) else month
+
+def _copy_ordered(connection, source, target, *filters):
+    # Rows are written in (user_id, date) order, so each user's rows end up on neighbouring pages
+    names = [column.name for column in source.c]
+    statement = select(source).where(*filters).order_by(source.c.user_id, source.c.date)
+    return connection.execute(insert(target).from_select(names, statement)).rowcount
+
+def _uses_autoincrement(connection, table):
+    sql = connection.execute(
+        text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': table.name}
+    ).scalar()
+    return sql is None or 'AUTOINCREMENT' in sql.upper()
+
+def ensure_autoincrement(model):
+    """
+    Rebuilds a model's own table with AUTOINCREMENT ids if it predates them, as on shards
+    created before the models asked for them, and starts its id sequence after the highest id
+    in its partitions. A plain rowid table hands out max(id) + 1, so once its newest rows were
+    sealed away, new rows would take their ids.
+
+    Returns:
+        bool: True if the table was rebuilt.
+    """
+    parent = model.__table__
+    connection = _connection(model)
+    if _uses_autoincrement(connection, parent):
+        return False
+    old = f'{parent.name}_rowid'
+    connection.exec_driver_sql(f'ALTER TABLE {parent.name} RENAME TO {old}')
+    for index in parent.indexes:
+        connection.exec_driver_sql(f'DROP INDEX IF EXISTS {index.name}')
+    parent.create(connection)
+    names = ', '.join(column.name for column in parent.c)
+    connection.exec_driver_sql(f'INSERT INTO {parent.name} ({names}) SELECT {names} FROM {old}')
+    connection.exec_driver_sql(f'DROP TABLE {old}')
+    high = max(connection.execute(select(func.max(table.c.id))).scalar() or 0 for table in tables(model))
+    bounds = {'name': parent.name, 'high': high}
+    if not connection.execute(text('UPDATE sqlite_sequence SET seq = max(seq, :high) WHERE name = :name'), bounds).rowcount:
+        connection.execute(text('INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :high)'), bounds)
+    db.session.commit()
+    return True
+
+def seal_month(model, month):
+    """
+    Moves a model's rows dated in a month from its own table into a new sealed partition,
+    in one transaction. Rows keep their ids, which the model's own table never hands out again
+    (see ensure_autoincrement).
+
+    Returns:
+        int: The number of rows moved.
+    """
+    ensure_autoincrement(model)
+    parent = model.__table__
+    table = partition_table(model, month)
+    connection = _connection(model)
+    table.create(connection, checkfirst=True)
+    start, end = _bound(parent.c.date, month), _bound(parent.c.date, add_months(month, 1))
+    moved = _copy_ordered(connection, parent, table, parent.c.date >= start, parent.c.date < end)
+    connection.execute(delete(parent).where(parent.c.id.in_(select(table.c.id))))
+    _seal(connection, table)
+    db.session.add(LogPartition(parent=model.__tablename__, month=month, rows=moved))
+    db.session.commit()
+    return moved
+
+def unsealed_months(model, before):
+    """
+    Returns the months before a cutoff that still have rows in a model's own table
+    and no partition yet, oldest first.
+    """
+    parent = model.__table__
+    months = db.session.execute(
+        select(func.strftime('%Y-%m-01', parent.c.date).distinct()).where(parent.c.date < _bound(parent.c.date, before))
+    ).scalars().all()
+    sealed = set(sealed_months(model))
+    return sorted(m for m in (date.fromisoformat(value) for value in months) if m not in sealed)
+
+def partition_model(model, hot_months=None, now=None):
+    """
+    Seals every month of a model that has fallen out of the hot window of hot_months
+    months, counting the current one (default PARTITION_HOT_MONTHS).
+    Rows logged later for an already sealed month stay in the model's own table, where
+    every query still finds them.
+
+    Returns:
+        dict: Mapping of each newly sealed month to the number of rows moved.
+    """
+    if hot_months is None:
+        hot_months = current_app.config['PARTITION_HOT_MONTHS']
+    ensure_autoincrement(model)  # Even with nothing to seal, earlier partitions may hold the highest ids
+    cutoff = add_months(month_start(now or datetime.utcnow()), 1 - hot_months)
+    return {month: seal_month(model, month) for month in unsealed_months(model, cutoff)}
+
+def archive_month(model, month):
+    """
+    Moves a sealed partition into the archive database. The copy is committed before the
+    live partition is dropped, so a crash in between leaves the live partition in use and
+    the next run simply copies it again.
+
+    Returns:
+        int: The number of rows archived.
+    """
+    table = partition_table(model, month)
+    archived = partition_table(model, month, archived=True)
+    connection = _connection(model)
+    archived.create(connection, checkfirst=True)
+    _unseal(connection, archived)
+    connection.execute(delete(archived))  # Rows an interrupted run copied already
+    rows = _copy_ordered(connection, table, archived)
+    _seal(connection, archived)
+    db.session.commit()
+
+    partition = db.session.execute(
+        select(LogPartition).where(LogPartition.parent == model.__tablename__, LogPartition.month == month)
+    ).scalar_one()
+    partition.archived_at = datetime.utcnow()
+    db.session.flush()
+    table.drop(_connection(model))
+    db.session.commit()
+    return rows
+
+def archive_model(model, after_months=None, now=None):
+    """
+    Moves every sealed partition of a model older than after_months (default ARCHIVE_AFTER_MONTHS)
+    to the archive database.
+
+    Returns:
+        dict: Mapping of each archived month to the number of rows moved.
+    """
+    if after_months is None:
+        after_months = current_app.config['ARCHIVE_AFTER_MONTHS']
+    cutoff = add_months(month_start(now or datetime.utcnow()), -after_months)
+    months = [month for month, archived in sealed_partitions(model, end=add_months(cutoff, -1)) if not archived]
+    return {month: archive_month(model, month) for month in sorted(months)}
+
+def compact_partition(model, month):
+    """
+    Rebuilds one live sealed partition in (user_id, date) order, reclaiming the holes purges
+    left in it. Only that partition is rewritten, unlike VACUUM, which rewrites the whole
+    database file; the pages it frees are reused by later writes. Archived partitions are
+    compacted together with `VACUUM archive` instead.
+
+    Returns:
+        int: The number of rows in the partition.
+    """
+    table = partition_table(model, month)
+    staging = Table(f'{table.name}_compact', MetaData(),
+                    *(Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable) for c in table.c))
+    connection = _connection(model)
+    staging.drop(connection, checkfirst=True)
+    staging.create(connection)
+    rows = _copy_ordered(connection, table, staging)
+    table.drop(connection)
+    connection.exec_driver_sql(f'ALTER TABLE {staging.name} RENAME TO {table.name}')
+    for index in table.indexes:
+        index.create(connection)
+    _seal(connection, table)
+    partition = db.session.execute(
+        select(LogPartition).where(LogPartition.parent == model.__tablename__, LogPartition.month == month)
+    ).scalar_one()
+    partition.rows = rows
+    partition.compacted_at = datetime.utcnow()
+    db.session.commit()
+    return rows
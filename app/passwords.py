@@ -0,0 +1,147 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Werkzeug method used for new password hashes; `manage.py calibrate_password_hash` picks the
+# cost for a target verification time on the machine it runs on
+PASSWORD_HASH_METHOD = 'scrypt:32768:8:1'
+
+# Hashes computed at once per process, and logins allowed to wait for one before new ones are turned away
+PASSWORD_HASH_WORKERS = os.cpu_count() or 1
+PASSWORD_HASH_QUEUE = 16
+
+class HashingBusy(RuntimeError):
+    """
+    Raised when the password hashing pool already has as many logins waiting as it accepts.
+    """
+
+@lru_cache(maxsize=8)
+def _parameters(method):
+    # A method without explicit costs, like 'scrypt', stands for Werkzeug's defaults; hashing
+    # once tells us what they are, so stored hashes can be compared against them
+    return generate_password_hash('', method).split('$', 1)[0]
+
+class PasswordHasher:
+    """
+    Hashes and verifies passwords on a bounded thread pool.
+
+    hashlib releases the GIL while it hashes, so the pool's threads run on separate cores.
+    The calling request thread still waits for its hash: the pool does not free it, it bounds
+    the work. At most workers hashes run at once and at most queue more wait for a thread;
+    beyond that verify() raises HashingBusy at once, which the views answer with 503, so a
+    login storm is turned away instead of queuing on every request thread and allocating
+    scrypt's memory for each of them. Each worker process has its own pool.
+    """
+
+    def __init__(self, method=PASSWORD_HASH_METHOD, workers=PASSWORD_HASH_WORKERS, queue=PASSWORD_HASH_QUEUE):
+        self.method = method
+        self.workers = workers
+        self.queue = queue
+        self._executor = None
+        self._slots = None
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def init_app(self, app):
+        """
+        Configures the hasher from PASSWORD_HASH_METHOD, PASSWORD_HASH_WORKERS and PASSWORD_HASH_QUEUE.
+        """
+        self.method = app.config.get('PASSWORD_HASH_METHOD', self.method)
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', self.workers)
+        self.queue = app.config.get('PASSWORD_HASH_QUEUE', self.queue)
+        app.extensions['password_hasher'] = self
+
+    def _submit(self, function, *args):
+        # The pool is created on first use, so gunicorn workers forked from a preloaded app get their own
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='password-hash')
+                self._slots = threading.BoundedSemaphore(self.workers + self.queue)
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HashingBusy('Too many password checks in progress')
+        try:
+            future = self._executor.submit(function, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        # Admitted checks wait for their result; only the ones beyond the queue are turned away
+        return future.result()
+
+    def hash(self, password):
+        """
+        Returns a new hash of a password with the configured method.
+        """
+        return self._submit(generate_password_hash, password, self.method)
+
+    def verify(self, stored, password):
+        """
+        Checks a password against a stored hash of any method Werkzeug supports.
+
+        Raises:
+            HashingBusy: When the pool is saturated.
+        """
+        return self._submit(check_password_hash, stored, password)
+
+    def needs_rehash(self, stored):
+        """
+        Checks whether a stored hash was made with other parameters than the configured method.
+        """
+        return stored.split('$', 1)[0] != _parameters(self.method)
+
+    def stats(self):
+        """
+        Returns the configured parameters and the number of checks turned away.
+        """
+        return {'method': self.method, 'workers': self.workers, 'queue': self.queue, 'rejected': self.rejected}
+
+password_hasher = PasswordHasher()
+
+def check_and_upgrade(user, password):
+    """
+    Verifies a user's password and, when it matches but was hashed with outdated parameters,
+    replaces the stored hash with one made with the configured method. The new hash is
+    saved when the caller commits.
+
+    Raises:
+        HashingBusy: When the pool is saturated.
+    """
+    if not password_hasher.verify(user.password, password):
+        return False
+    if password_hasher.needs_rehash(user.password):
+        user.password = password_hasher.hash(password)
+    return True
+
+def calibrate(family, target, limit=2.0):
+    """
+    Finds the cost for a method family ('pbkdf2' or 'scrypt') whose verification takes about
+    target seconds on this machine. pbkdf2 iterations are scaled linearly; scrypt's N is
+    doubled, since it must be a power of two.
+
+    Returns:
+        tuple: The method string and the measured seconds per verification.
+    """
+    def measure(method):
+        stored = generate_password_hash('calibration', method)
+        start = time.perf_counter()
+        check_password_hash(stored, 'calibration')
+        return time.perf_counter() - start
+
+    if family == 'pbkdf2':
+        iterations = 10000
+        elapsed = measure(f'pbkdf2:sha256:{iterations}')
+        iterations = max(10000, round(iterations * target / elapsed, -3))
+        method = f'pbkdf2:sha256:{int(iterations)}'
+        return method, measure(method)
+    if family == 'scrypt':
+        n, elapsed = 2 ** 14, measure(f'scrypt:{2 ** 14}:8:1')
+        while elapsed * 2 <= target * 1.4 and elapsed * 2 <= limit:
+            n *= 2
+            elapsed = measure(f'scrypt:{n}:8:1')
+        return f'scrypt:{n}:8:1', elapsed
+    raise ValueError(f'Unknown method family {family!r}')
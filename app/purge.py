@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import select, delete
+from .models import User, DataVersion, Activity, Nutrition, Sleep, Mood, DailySummary, ImportJob
+from .cache import response_cache
+from .sharding import use_user_shard
+from .tokens import revoke_user_tokens
+from . import db, partitions
+
+# Rows deleted per transaction, and the pause between transactions that lets other writers in
+PURGE_BATCH_SIZE = 1000
+PURGE_PAUSE = 0.01
+
+# Tables holding a user's rows, purged before the user row itself
+PURGE_MODELS = (Activity, Nutrition, Sleep, Mood, DailySummary, ImportJob, DataVersion)
+
+def batch_delete_statement(model, user_id, batch_size=PURGE_BATCH_SIZE):
+    """
+    Builds a DELETE of at most batch_size of a user's rows from one table, a model's
+    or one of its partitions. The rows are picked through the (user_id, ...) index,
+    so each batch is a short seek.
+    """
+    table = getattr(model, '__table__', model)
+    if table is DataVersion.__table__:
+        # A single row per user
+        return delete(table).where(table.c.user_id == user_id)
+    if table is DailySummary.__table__:
+        # day is only unique per user, so the outer filter keeps to the (user_id, day) key
+        batch = select(table.c.day).where(table.c.user_id == user_id).limit(batch_size)
+        return delete(table).where(table.c.user_id == user_id, table.c.day.in_(batch))
+    # Filtering the outer DELETE on user_id too would make SQLite walk all of the user's rows every batch
+    batch = select(table.c.id).where(table.c.user_id == user_id).limit(batch_size)
+    return delete(table).where(table.c.id.in_(batch))
+
+def soft_delete_user(user):
+    """
+    Marks a user as deleted, in the current session's transaction. From then on they cannot
+    log in, existing sessions are logged out, their API tokens are revoked, and their data is
+    no longer served.
+    """
+    user.deleted_at = datetime.utcnow()
+    revoke_user_tokens(user.id)
+
+def purge_rows(user_id, batch_size=PURGE_BATCH_SIZE, pause=PURGE_PAUSE):
+    """
+    Deletes all of a user's rows from the per-user tables on the session's selected shard,
+    sealed partitions included, one small transaction at a time.
+
+    Returns:
+        int: The number of rows deleted.
+    """
+    deleted = 0
+    for model in PURGE_MODELS:
+        for table in partitions.tables(model):
+            while True:
+                count = db.session.execute(batch_delete_statement(table, user_id, batch_size)).rowcount
+                db.session.commit()
+                deleted += count
+                if count < batch_size:
+                    break
+                time.sleep(pause)
+    return deleted
+
+def purge_user(user_id, batch_size=PURGE_BATCH_SIZE, pause=PURGE_PAUSE):
+    """
+    Deletes a soft-deleted user and all their rows, one small transaction at a time.
+
+    Each batch commits and then sleeps for pause seconds, so the SQLite write lock is
+    never held for long and other users' writes go through while a large account is purged.
+    The last step deletes the user row; ON DELETE CASCADE removes anything written meanwhile.
+
+    Returns:
+        int: The number of rows deleted, not counting the user row.
+    """
+    use_user_shard(db.session, user_id)
+    paths = db.session.execute(select(ImportJob.path).where(ImportJob.user_id == user_id)).scalars().all()
+    deleted = purge_rows(user_id, batch_size, pause)
+    db.session.execute(delete(User.__table__).where(User.id == user_id))
+    db.session.commit()
+    response_cache.invalidate_user(user_id)
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+    return deleted
+
+def pending_purges():
+    """
+    Returns the ids of soft-deleted users whose rows have not been purged yet.
+    """
+    return db.session.execute(select(User.id).where(User.deleted_at.is_not(None))).scalars().all()
+
+def purge_in_background(app, user_id, batch_size=PURGE_BATCH_SIZE, pause=PURGE_PAUSE):
+    """
+    Purges a soft-deleted user in a daemon thread with its own application context.
+    A purge interrupted by a restart is finished by `manage.py purge_deleted_users`.
+    """
+    def run():
+        with app.app_context():
+            purge_user(user_id, batch_size, pause)
+    thread = threading.Thread(target=run, name=f'purge-{user_id}', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,191 @@
+from datetime import datetime, time, timedelta
+from sqlalchemy import select, func, or_, union_all
+from . import db, partitions
+
+# Lookback windows for the legacy 'period' query parameter
+PERIODS = {
+    'daily': timedelta(days=1),
+    'weekly': timedelta(weeks=1),
+    'monthly': timedelta(days=30),
+}
+
+# SQL expressions that truncate a date column to the start of its bucket
+GRANULARITIES = {
+    'hour': lambda column: func.strftime('%Y-%m-%d %H:00', column),
+    'day': lambda column: func.date(column),
+    'week': lambda column: func.date(column, 'weekday 0', '-6 days'),
+    'month': lambda column: func.strftime('%Y-%m-01', column),
+}
+
+AGGREGATES = {
+    'sum': func.sum,
+    'avg': func.avg,
+    'min': func.min,
+    'max': func.max,
+    'count': func.count,
+}
+
+class QueryError(ValueError):
+    """
+    Raised when a time-range query is given an invalid range, granularity, column or aggregate.
+    """
+
+def resolve_range(period=None, start=None, end=None, now=None):
+    """
+    Resolves the time range to query.
+
+    An explicit start/end wins over a period. A period is a lookback window ending now;
+    a missing or unrecognised period falls back to 'daily'.
+
+    Args:
+        period (str): One of the keys of PERIODS.
+        start (datetime): Inclusive lower bound.
+        end (datetime): Exclusive upper bound, or None for no upper bound.
+        now (datetime): The current time, for testing.
+
+    Returns:
+        tuple: (start, end) datetimes, end may be None.
+    """
+    if start is not None or end is not None:
+        if start is not None and end is not None and start >= end:
+            raise QueryError('start must be before end')
+        return start, end
+    now = now or datetime.utcnow()
+    return now - PERIODS.get(period, PERIODS['daily']), None
+
+def _is_date_only(column):
+    return isinstance(column.type, db.Date) and not isinstance(column.type, db.DateTime)
+
+def _table(source):
+    # Models and the partition tables split from them are queried alike
+    return getattr(source, '__table__', source)
+
+def _combine(arms):
+    # One SELECT per table; a UNION ALL ordered on its result columns is merged by SQLite
+    # from the already index-ordered arms, without sorting them again
+    return arms[0] if len(arms) == 1 else union_all(*arms)
+
+def range_filters(model, user_id, start, end, column=None):
+    """
+    Builds the WHERE clauses for a user and a half-open [start, end) range.
+    Date-only columns are compared against whole days so the (user_id, date) index is used either way.
+
+    Args:
+        model: The model, or partition table, to filter.
+        user_id (int): The user whose rows to keep.
+        start (datetime): Inclusive lower bound, or None.
+        end (datetime): Exclusive upper bound, or None.
+        column: The date column to filter on; defaults to model.date.
+    """
+    columns = _table(model).c
+    column = columns.date if column is None else column
+    filters = [columns.user_id == user_id]
+    if _is_date_only(column):
+        if start is not None:
+            filters.append(column >= start.date())
+        if end is not None:
+            last_day = end.date() if end.time() != time.min else end.date() - timedelta(days=1)
+            filters.append(column <= last_day)
+    else:
+        if start is not None:
+            filters.append(column >= start)
+        if end is not None:
+            filters.append(column < end)
+    return filters
+
+def _columns(model, names):
+    table = _table(model)
+    try:
+        return [getattr(table.c, name) for name in names]
+    except AttributeError as e:
+        raise QueryError(f"Unknown column for {table.name}: {e}") from None
+
+def range_statement(model, user_id, start=None, end=None, columns=None):
+    """
+    Builds a SELECT of a user's rows in a time range, ordered by date.
+    Only the partitions overlapping the range are read.
+
+    Args:
+        model: The log model to query (Activity, Nutrition, Sleep, Mood).
+        user_id (int): The user whose rows to select.
+        start (datetime): Inclusive lower bound, or None.
+        end (datetime): Exclusive upper bound, or None.
+        columns (list): Column names to load; all columns when omitted.
+
+    Returns:
+        Select: The statement.
+    """
+    arms = [select(*(_columns(table, columns) if columns else [table]))
+            .where(*range_filters(table, user_id, start, end))
+            for table in partitions.tables(model, start, end)]
+    statement = _combine(arms)
+    return statement.order_by(statement.selected_columns.date)
+
+def bucket_statement(model, user_id, granularity, aggregates, start=None, end=None):
+    """
+    Builds a SELECT that groups a user's rows into time buckets and aggregates them in SQL.
+
+    Args:
+        model: The log model to query.
+        user_id (int): The user whose rows to aggregate.
+        granularity (str): One of the keys of GRANULARITIES.
+        aggregates (dict): Mapping of column name to aggregate name, e.g. {'steps': 'sum'}.
+        start (datetime): Inclusive lower bound, or None.
+        end (datetime): Exclusive upper bound, or None.
+
+    Returns:
+        Select: The statement, yielding a 'bucket' label, a 'count' and one column per aggregate.
+    """
+    if granularity not in GRANULARITIES:
+        raise QueryError(f"Unknown granularity '{granularity}'")
+    for aggregate in aggregates.values():
+        if aggregate not in AGGREGATES:
+            raise QueryError(f"Unknown aggregate '{aggregate}'")
+    _columns(model, aggregates)
+    tables = partitions.tables(model, start, end)
+    if len(tables) == 1:
+        source, filters = tables[0], range_filters(tables[0], user_id, start, end)
+    else:
+        names = ['date', *aggregates]
+        source = union_all(*(select(*_columns(table, names)).where(*range_filters(table, user_id, start, end))
+                             for table in tables)).subquery()
+        filters = []
+    bucket = GRANULARITIES[granularity](source.c.date).label('bucket')
+    selected = [bucket, func.count().label('count')]
+    for name, aggregate in aggregates.items():
+        selected.append(AGGREGATES[aggregate](source.c[name]).label(name))
+    return (select(*selected)
+            .where(*filters)
+            .group_by(bucket)
+            .order_by(bucket))
+
+def page_statement(model, user_id, limit, after=None, columns=None):
+    """
+    Builds a keyset-paginated SELECT of a user's rows, newest first.
+
+    Rows are ordered by (date, id) descending and a page starts strictly after the last
+    row of the previous one, so every page is an index seek no matter how deep it is.
+
+    Args:
+        model: The log model to query.
+        user_id (int): The user whose rows to select.
+        limit (int): Maximum number of rows to return.
+        after (tuple): (date, id) of the last row of the previous page, or None for the first page.
+        columns (list): Column names to load; all columns when omitted. id and date are always included.
+
+    Returns:
+        Select: The statement.
+    """
+    names = ['id', 'date', *(c for c in columns if c not in ('id', 'date'))] if columns else None
+    arms = []
+    for table in partitions.tables(model, end=after[0] if after is not None else None):
+        arm = select(*(_columns(table, names) if names else [table])).where(table.c.user_id == user_id)
+        if after is not None:
+            after_date, after_id = after
+            # The redundant date <= bound lets SQLite seek into the index instead of filtering from the top
+            arm = arm.where(table.c.date <= after_date,
+                            or_(table.c.date < after_date, table.c.id < after_id))
+        arms.append(arm)
+    statement = _combine(arms)
+    columns = statement.selected_columns
+    return statement.order_by(columns.date.desc(), columns.id.desc()).limit(limit)
@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+from .models import Activity, Nutrition, Sleep, Mood
+from .main import dashboard_queries
+from .queries import resolve_range, range_statement, bucket_statement, page_statement
+from .purge import PURGE_MODELS, batch_delete_statement
+from .sharding import select_shard
+from . import db, rollup
+
+LOG_MODELS = (Activity, Nutrition, Sleep, Mood)
+
+def hot_queries(user_id=1):
+    """
+    Returns the statements issued by the hot read paths in main.py, keyed by a descriptive name.
+
+    Args:
+        user_id (int): The user ID to bind into the statements.
+
+    Returns:
+        dict: Mapping of query name to SQLAlchemy statement.
+    """
+    start, end = resolve_range('monthly')
+    year_start, year_end = datetime.utcnow() - timedelta(days=365), datetime.utcnow()
+    queries = {}
+    for model in LOG_MODELS:
+        name = model.__tablename__
+        queries[f'{name}_by_period'] = range_statement(model, user_id, start, end)
+        queries[f'{name}_year_by_hour'] = bucket_statement(model, user_id, 'hour', {}, year_start, year_end)
+        queries[f'{name}_year_by_week'] = rollup.bucket_statement(model, user_id, 'week', (), year_start, year_end)
+        queries[f'{name}_history_page'] = page_statement(model, user_id, 50, after=(datetime.utcnow(), 1))
+    for model in PURGE_MODELS:
+        queries[f'purge_{model.__tablename__}'] = batch_delete_statement(model, user_id)
+    for name, statement in dashboard_queries(user_id).items():
+        queries[f'dashboard_{name}'] = statement
+    return queries
+
+def explain(statement):
+    """
+    Runs EXPLAIN QUERY PLAN for a statement against the current database.
+
+    Args:
+        statement: The SQLAlchemy statement to explain.
+
+    Returns:
+        list: The detail column of each plan row, e.g. 'SEARCH activity USING INDEX ...'.
+    """
+    compiled = statement.compile(dialect=db.engine.dialect)
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    with db.engine.connect() as connection:
+        rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}', params).all()
+    return [row[-1] for row in rows]
+
+def full_scans(plan):
+    """
+    Returns the plan steps that read a table without using any index. Scans of a subquery
+    SQLite runs as a CO-ROUTINE or MATERIALIZEs first, e.g. the UNION ALL of a log table's
+    partitions, only read rows that step already produced, so they do not count.
+    """
+    subqueries = {step.split()[1] for step in plan if step.startswith(('CO-ROUTINE ', 'MATERIALIZE '))}
+    return [step for step in plan
+            if step.startswith('SCAN ') and ' USING ' not in step and step.split()[1] not in subqueries]
+
+def check_query_plans(user_id=1):
+    """
+    Explains every hot query and collects the ones that fall back to a full table scan.
+
+    Returns:
+        tuple: (plans, failures) where plans maps query names to their plan steps and
+        failures maps query names to the offending steps.
+    """
+    select_shard(db.session, None)  # explain() runs on the directory database, so read its partition catalog
+    plans = {name: explain(statement) for name, statement in hot_queries(user_id).items()}
+    failures = {name: full_scans(plan) for name, plan in plans.items() if full_scans(plan)}
+    return plans, failures
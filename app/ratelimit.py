@@ -0,0 +1,190 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, jsonify, request, session
+from .tokens import signed_claims
+
+# Methods that are never limited; rate limits only guard logins and writes
+SAFE_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS'))
+
+# Buckets kept by the in-memory backend; the least recently used are dropped, which refills them
+RATE_LIMIT_MAX_KEYS = 100000
+
+def _refill(tokens, updated, capacity, rate, now):
+    # Token bucket: rate tokens per second flow in up to capacity, and each request takes one.
+    # Returns the new token count and how long to wait, or 0 if the request may go ahead.
+    tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+class MemoryBuckets:
+    """
+    Token buckets in a dict shared by the threads of one process. Each gunicorn worker counts
+    on its own, so a client spread over N workers gets up to N times the limit.
+    """
+
+    def __init__(self, max_keys=RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate):
+        """
+        Takes a token from a bucket, which starts full.
+
+        Returns:
+            float: Seconds until a token is available, or 0 if one was taken.
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens, wait = _refill(tokens, updated, capacity, rate, now)
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+class SQLiteBuckets:
+    """
+    Token buckets in a small SQLite file shared by every worker process on the host.
+    Each take is one short write transaction; the file is not durable, since losing it
+    only refills the buckets.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._takes = 0
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS rate_bucket (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)'
+            )
+            self._local.connection = connection
+        return connection
+
+    def take(self, key, capacity, rate):
+        """
+        Takes a token from a bucket, which starts full.
+
+        Returns:
+            float: Seconds until a token is available, or 0 if one was taken.
+        """
+        connection = self._connection()
+        now = time.time()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT tokens, updated FROM rate_bucket WHERE key = ?', (key,)).fetchone()
+            tokens, wait = _refill(*(row or (capacity, now)), capacity, rate, now)
+            connection.execute(
+                'INSERT INTO rate_bucket (key, tokens, updated) VALUES (?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated',
+                (key, tokens, now),
+            )
+            self._takes += 1
+            if self._takes % 10000 == 0:
+                # Buckets untouched for an hour are full again under any sensible limit
+                connection.execute('DELETE FROM rate_bucket WHERE updated < ?', (now - 3600,))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return wait
+
+def _user_key():
+    # Read from the signed session cookie or API token, without loading the user or the token
+    # revocation list; the request loader still turns revoked tokens away after this
+    user_id = session.get('_user_id')
+    if user_id is None:
+        kind, _, token = request.headers.get('Authorization', '').partition(' ')
+        claims = signed_claims(token.strip()) if kind.lower() == 'bearer' and token else None
+        user_id = claims and claims['sub']
+    return None if user_id is None else str(user_id)
+
+def _account_key():
+    # The account a login or token request is for, so guessing one password from many addresses is limited too
+    if request.is_json:
+        data = request.get_json(silent=True)
+        email = data.get('email') if isinstance(data, dict) else None
+    else:
+        email = request.form.get('email')
+    return email.strip().lower() if isinstance(email, str) and email.strip() else None
+
+# Functions returning the key a limit counts by, or None when the request has none
+KEY_FUNCTIONS = {
+    'ip': lambda: request.remote_addr or 'unknown',
+    'user': _user_key,
+    'account': _account_key,
+}
+
+class RateLimiter:
+    """
+    Rejects requests beyond the token-bucket limits in RATE_LIMITS with 429, in a
+    before_request hook that runs ahead of the other extensions' hooks, so over-limit
+    requests never reach the database or the password hasher.
+
+    RATE_LIMITS maps an endpoint ('auth.login') or a blueprint ('main') to a list of
+    (key, requests, seconds) limits, where key is 'ip', 'user' or 'account'. A limit allows
+    bursts of requests and refills at requests per seconds. A request must pass both its
+    endpoint's limits and its blueprint's, and a blueprint's limits are one budget shared by
+    all of its endpoints. Only non-GET requests count.
+    """
+
+    def __init__(self):
+        self.limits = {}
+        self.backend = None
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """
+        Configures the limiter from RATE_LIMIT_ENABLED, RATE_LIMITS, RATE_LIMIT_BACKEND and
+        RATE_LIMIT_DATABASE, and registers its before_request hook. Call it before the other
+        extensions' init_app, so the hook runs first.
+        """
+        self.limits = app.config.get('RATE_LIMITS', {})
+        if app.config.get('RATE_LIMIT_BACKEND', 'memory') == 'sqlite':
+            path = app.config.get('RATE_LIMIT_DATABASE') or os.path.join(app.instance_path, 'ratelimit.db')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.backend = SQLiteBuckets(path)
+        else:
+            self.backend = MemoryBuckets(app.config.get('RATE_LIMIT_MAX_KEYS', RATE_LIMIT_MAX_KEYS))
+        app.extensions['rate_limiter'] = self
+        app.before_request(self._check)
+
+    def _limits_for(self, endpoint):
+        # (bucket scope, key, requests, seconds) for the endpoint's own limits, then its blueprint's
+        blueprint = endpoint.rpartition('.')[0]
+        for scope in (endpoint, blueprint) if blueprint else (endpoint,):
+            for kind, requests, seconds in self.limits.get(scope, ()):
+                yield scope, kind, requests, seconds
+
+    def _check(self):
+        if not current_app.config.get('RATE_LIMIT_ENABLED', True):
+            return None
+        if request.method in SAFE_METHODS or not request.endpoint:
+            return None
+        for scope, kind, requests, seconds in self._limits_for(request.endpoint):
+            key = KEY_FUNCTIONS[kind]()
+            if key is None:
+                continue
+            # The first limit to reject answers; the ones after it keep their tokens
+            wait = self.backend.take(f'{scope}:{kind}:{key}', requests, requests / seconds)
+            if wait:
+                with self._lock:
+                    self.rejected += 1
+                response = jsonify({'error': 'Too many requests', 'retry_after': round(wait, 1)})
+                response.status_code = 429
+                response.headers['Retry-After'] = str(max(1, round(wait)))
+                return response
+        return None
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,175 @@
+import json
+import time
+from datetime import datetime
+from sqlalchemy import select, insert, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from .models import User, DataVersion, ImportJob, ShardMove
+from .sharding import shard_for, shard_engines, select_shard
+from .purge import purge_rows
+from .cache import response_cache
+from .identity import user_cache
+from . import db, partitions, rollup
+
+# Rows copied per transaction, and how long in-flight requests get to finish writing
+# to the old shard once the user points at the new one
+REBALANCE_BATCH_SIZE = 1000
+REBALANCE_GRACE = 5.0
+
+# Tables copied to the new shard; daily_summary is rebuilt there from the log rows instead
+COPIED_MODELS = (*rollup.ROLLUP_COLUMNS, ImportJob)
+
+def _copy_rows(model, table, user_id, source, target, after, batch_size, copied=None):
+    # Copies a user's rows with an id above `after` from the model's table, or one of its
+    # partitions, into the model's table on the target, and returns the last id copied.
+    # Ids are not kept: the target shard hands out its own. copied(last id) is called
+    # after each batch commits.
+    columns = [column for column in table.c if column.name != 'id']
+    while True:
+        select_shard(db.session, source)
+        batch = db.session.execute(
+            select(table.c.id, *columns).where(table.c.user_id == user_id, table.c.id > after)
+            .order_by(table.c.id).limit(batch_size)
+        ).mappings().all()
+        if not batch:
+            return after
+        rows = [{column.name: row[column.name] for column in columns} for row in batch]
+        select_shard(db.session, target)
+        db.session.execute(insert(model.__table__), rows)
+        if model in rollup.ROLLUP_COLUMNS:
+            rollup.record_entries(model, rows)
+        db.session.commit()
+        after = batch[-1]['id']
+        if copied is not None:
+            copied(after)
+
+def _carry_version(user_id, source, target):
+    # Versions are counted on each shard (see DataVersion), so the user's count continues on
+    # the target past anything the source has served, and cached responses from before the
+    # move never match again
+    versions = []
+    for shard_id in (source, target):
+        select_shard(db.session, shard_id)
+        versions.append(db.session.execute(
+            select(DataVersion.version).where(DataVersion.user_id == user_id)
+        ).scalar() or 0)
+    version = max(versions) + 1
+    db.session.execute(
+        sqlite_insert(DataVersion).values(user_id=user_id, version=version)
+        .on_conflict_do_update(index_elements=[DataVersion.user_id], set_={'version': version})
+    )
+    db.session.commit()
+
+def _record_mark(move, table_name, after):
+    # Saves how far the final copy got, so a resumed move does not copy those rows again
+    marks = json.loads(move.marks)
+    marks[table_name] = after
+    move.marks = json.dumps(marks)
+    db.session.commit()
+
+def _run_move(move, batch_size, grace):
+    # Runs a move from wherever it stopped; see move_user
+    user_id, source, target = move.user_id, move.source, move.target
+    if move.switched_at is None:
+        # Nothing on the target is served yet, so an interrupted first copy simply starts over
+        select_shard(db.session, target)
+        purge_rows(user_id, batch_size)
+        select_shard(db.session, source)
+        sources = [(model, table) for model in COPIED_MODELS for table in partitions.tables(model)]
+        marks = {table: _copy_rows(model, table, user_id, source, target, 0, batch_size) for model, table in sources}
+        _carry_version(user_id, source, target)
+        # The switch and the marks the final copy starts from commit together
+        db.session.get(User, user_id).shard_id = target
+        move.marks = json.dumps({model.__tablename__: marks[model.__table__] for model in COPIED_MODELS})
+        move.switched_at = datetime.utcnow()
+        db.session.commit()
+        response_cache.invalidate_user(user_id)
+    # Workers that cached the user's identity keep using the old shard until the entry expires
+    waited = (datetime.utcnow() - move.switched_at).total_seconds()
+    time.sleep(max(max(grace, user_cache.ttl) - waited, 0))
+
+    # Sealed partitions take no writes, so only the models' own tables can have new rows
+    copied = 0
+    for model in COPIED_MODELS:
+        name = model.__tablename__
+        _copy_rows(model, model.__table__, user_id, source, target, json.loads(move.marks)[name], batch_size,
+                   lambda after: _record_mark(move, name, after))
+        select_shard(db.session, target)
+        copied += db.session.execute(select(func.count()).where(model.user_id == user_id)).scalar()
+    _carry_version(user_id, source, target)
+    select_shard(db.session, source)
+    purge_rows(user_id, batch_size)
+    select_shard(db.session, target)
+    db.session.delete(move)
+    db.session.commit()
+    return copied
+
+def move_user(user_id, target, batch_size=REBALANCE_BATCH_SIZE, grace=REBALANCE_GRACE):
+    """
+    Moves a user's data to another shard while the app keeps serving them.
+
+    Log entries are append-only, so the move needs no lock: the rows are copied in batches,
+    the user is switched to the new shard, and after a grace period for requests that
+    loaded the user before the switch, rows they added meanwhile are copied too.
+    Only then are the rows deleted from the old shard.
+
+    The move is recorded in a ShardMove row from start to finish, and the switch commits the
+    marks the final copy starts from with it, so an interrupted move is finished by running
+    it again: before the switch it starts over, after it the final copy picks up from the
+    marks. A user with an unfinished move to another shard has that move finished first.
+
+    Args:
+        user_id (int): The user to move.
+        target (int): The shard to move them to; None is the directory database.
+        batch_size (int): Rows per transaction.
+        grace (float): Seconds to wait between the switch and the final copy; at least USER_CACHE_TTL.
+
+    Returns:
+        int: The number of rows copied, not counting daily summaries.
+    """
+    copied = 0
+    move = db.session.get(ShardMove, user_id)
+    if move is not None:
+        finished = move.target
+        copied = _run_move(move, batch_size, grace)
+        if finished == target:
+            return copied
+    source = db.session.execute(select(User.shard_id).where(User.id == user_id)).scalar_one()
+    if source == target:
+        return copied
+    move = ShardMove(user_id=user_id, source=source, target=target)
+    db.session.add(move)
+    db.session.commit()
+    return _run_move(move, batch_size, grace)
+
+def unfinished_moves():
+    """
+    Returns (user id, old shard, new shard) for every move that was interrupted.
+    """
+    return db.session.execute(
+        select(ShardMove.user_id, ShardMove.source, ShardMove.target).order_by(ShardMove.user_id)
+    ).all()
+
+def misplaced_users():
+    """
+    Returns (user id, current shard, wanted shard) for every user not on the shard
+    rendezvous hashing picks for them among the registered shards.
+    """
+    shard_ids = list(shard_engines(refresh=True))
+    users = db.session.execute(
+        select(User.id, User.shard_id).where(User.deleted_at.is_(None)).order_by(User.id)
+    ).all()
+    moves = []
+    for user_id, shard_id in users:
+        wanted = shard_for(user_id, shard_ids)
+        if wanted != shard_id:
+            moves.append((user_id, shard_id, wanted))
+    return moves
+
+def has_running_import(user_id, shard_id):
+    """
+    Checks whether a user has an import job writing to their shard, which a move would race with.
+    """
+    select_shard(db.session, shard_id)
+    return db.session.execute(
+        select(ImportJob.id).where(ImportJob.user_id == user_id, ImportJob.status == 'running').limit(1)
+    ).first() is not None
@@ -0,0 +1,242 @@
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import select, func, delete, union_all, case
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from .models import Activity, Nutrition, Sleep, Mood, DailySummary
+from .queries import GRANULARITIES, QueryError, range_filters
+from . import db, partitions
+
+# Mood ratings run from 1 to 10 (see MoodForm); the rollup counts each one for the dashboard histogram
+MOOD_RATINGS = range(1, 11)
+
+# For each log model, the daily_summary columns it feeds and the source column
+# they total. A source of None counts entries, and (column, value) counts the
+# entries whose column holds value.
+ROLLUP_COLUMNS = {
+    Activity: {
+        'steps': 'steps',
+        'distance': 'distance',
+        'activity_calories': 'calories',
+        'duration': 'duration',
+        'activity_count': None,
+    },
+    Nutrition: {
+        'nutrition_calories': 'calories',
+        'protein': 'protein',
+        'carbs': 'carbs',
+        'fats': 'fats',
+        'nutrition_count': None,
+    },
+    Sleep: {
+        'sleep_hours': 'hours',
+        'sleep_count': None,
+    },
+    Mood: {
+        'mood_sum': 'rating',
+        'mood_count': None,
+        **{f'mood_rating_{rating}': ('rating', rating) for rating in MOOD_RATINGS},
+    },
+}
+
+# Column counting each model's entries, used to skip days that have none
+COUNT_COLUMNS = {
+    Activity: DailySummary.activity_count,
+    Nutrition: DailySummary.nutrition_count,
+    Sleep: DailySummary.sleep_count,
+    Mood: DailySummary.mood_count,
+}
+
+def _ratio(total, count):
+    return func.sum(total) / func.nullif(func.sum(count), 0)
+
+# How each chart field is rebuilt from the rollup when it is bucketed
+SERIES = {
+    Activity: {
+        'steps': func.sum(DailySummary.steps),
+        'distance': func.sum(DailySummary.distance),
+        'calories': func.sum(DailySummary.activity_calories),
+        'duration': func.sum(DailySummary.duration),
+    },
+    Nutrition: {
+        'calories': func.sum(DailySummary.nutrition_calories),
+        'protein': func.sum(DailySummary.protein),
+        'carbs': func.sum(DailySummary.carbs),
+        'fats': func.sum(DailySummary.fats),
+    },
+    Sleep: {
+        'hours': _ratio(DailySummary.sleep_hours, DailySummary.sleep_count),
+    },
+    Mood: {
+        # Multiply first so SQLite does not fall back to integer division
+        'rating': _ratio(DailySummary.mood_sum * 1.0, DailySummary.mood_count),
+    },
+}
+
+# Granularities the rollup can answer; anything finer has to read the log tables
+ROLLUP_GRANULARITIES = ('day', 'week', 'month')
+
+def _day(value):
+    return value.date() if isinstance(value, datetime) else value
+
+def _getter(entry):
+    return entry.get if isinstance(entry, dict) else lambda name: getattr(entry, name)
+
+def _source_name(source):
+    return source[0] if isinstance(source, tuple) else source
+
+def _value(source, get):
+    # An entry's contribution to a rollup column
+    if source is None:
+        return 1
+    if isinstance(source, tuple):
+        return int(get(source[0]) == source[1])
+    return get(source)
+
+def _total(table, source):
+    # The SQL aggregate recomputing a rollup column from log rows
+    if source is None:
+        return func.count()
+    if isinstance(source, tuple):
+        return func.sum(case((table.c[source[0]] == source[1], 1), else_=0))
+    return func.sum(table.c[source])
+
+def _upsert(model):
+    columns = ROLLUP_COLUMNS[model]
+    statement = sqlite_insert(DailySummary)
+    return statement.on_conflict_do_update(
+        index_elements=['user_id', 'day'],
+        set_={column: DailySummary.__table__.c[column] + statement.excluded[column] for column in columns},
+    )
+
+def record_entries(model, entries):
+    """
+    Adds log entries to the rollup in the current session's transaction.
+
+    Entries are combined per (user_id, day) first, so a batch costs one upsert per
+    day touched rather than one per entry.
+
+    Args:
+        model: The log model the entries belong to.
+        entries (iterable): ORM instances or dicts with user_id, date and the model's fields.
+    """
+    totals = defaultdict(lambda: defaultdict(int))
+    for entry in entries:
+        get = _getter(entry)
+        key = (get('user_id'), _day(get('date')))
+        for column, source in ROLLUP_COLUMNS[model].items():
+            totals[key][column] += _value(source, get)
+    if not totals:
+        return
+    rows = [{'user_id': user_id, 'day': day, **values} for (user_id, day), values in totals.items()]
+    db.session.execute(_upsert(model), rows)
+
+def record_entry(entry):
+    """
+    Adds a single ORM log entry to the rollup in the current session's transaction.
+    """
+    record_entries(type(entry), [entry])
+
+def bucket_statement(model, user_id, granularity, fields, start=None, end=None):
+    """
+    Builds a bucketed SELECT of a log model's chart fields from the rollup.
+
+    Args:
+        model: The log model whose series to build.
+        user_id (int): The user whose data to aggregate.
+        granularity (str): One of ROLLUP_GRANULARITIES.
+        fields (iterable): Chart fields to include; they must be keys of SERIES[model].
+        start (datetime): Inclusive lower bound, or None.
+        end (datetime): Exclusive upper bound, or None.
+
+    Returns:
+        Select: The statement, yielding 'bucket', 'count' and one column per field.
+    """
+    if granularity not in ROLLUP_GRANULARITIES:
+        raise QueryError(f"Granularity '{granularity}' is not available from the daily rollup")
+    count = COUNT_COLUMNS[model]
+    bucket = GRANULARITIES[granularity](DailySummary.day).label('bucket')
+    selected = [bucket, func.sum(count).label('count')]
+    selected += [SERIES[model][field].label(field) for field in fields]
+    return (select(*selected)
+            .where(*range_filters(DailySummary, user_id, start, end, column=DailySummary.day), count > 0)
+            .group_by(bucket)
+            .order_by(bucket))
+
+def _expected_statement(model, user_id=None):
+    tables = partitions.tables(model)
+    if len(tables) == 1:
+        table = tables[0]
+    else:
+        names = ['user_id', 'date', *dict.fromkeys(_source_name(source) for source in ROLLUP_COLUMNS[model].values() if source)]
+        arms = [select(*(t.c[name] for name in names)) for t in tables]
+        if user_id is not None:
+            arms = [arm.where(t.c.user_id == user_id) for arm, t in zip(arms, tables)]
+        table = union_all(*arms).subquery()
+    day = func.date(table.c.date).label('day')
+    selected = [table.c.user_id, day]
+    for column, source in ROLLUP_COLUMNS[model].items():
+        selected.append(_total(table, source).label(column))
+    statement = select(*selected).group_by(table.c.user_id, day)
+    if user_id is not None:
+        statement = statement.where(table.c.user_id == user_id)
+    return statement
+
+def expected_totals(user_id=None):
+    """
+    Recomputes the rollup from the raw log tables.
+
+    Returns:
+        dict: Mapping of (user_id, day) to a dict of daily_summary column totals.
+    """
+    totals = defaultdict(dict)
+    for model in ROLLUP_COLUMNS:
+        for row in db.session.execute(_expected_statement(model, user_id)):
+            values = row._asdict()
+            key = (values.pop('user_id'), datetime.strptime(values.pop('day'), '%Y-%m-%d').date())
+            totals[key].update(values)
+    return totals
+
+def rebuild(user_id=None):
+    """
+    Rebuilds the rollup from the raw log tables, for one user or everyone, and commits.
+
+    Returns:
+        int: The number of daily_summary rows written.
+    """
+    totals = expected_totals(user_id)
+    statement = delete(DailySummary)
+    if user_id is not None:
+        statement = statement.where(DailySummary.user_id == user_id)
+    db.session.execute(statement)
+    columns = [column for columns in ROLLUP_COLUMNS.values() for column in columns]
+    rows = [{'user_id': key[0], 'day': key[1], **{c: values.get(c, 0) for c in columns}}
+            for key, values in totals.items()]
+    if rows:
+        db.session.execute(sqlite_insert(DailySummary), rows)
+    db.session.commit()
+    return len(rows)
+
+def find_drift(user_id=None, tolerance=1e-6):
+    """
+    Compares the stored rollup against the raw log tables.
+
+    Returns:
+        list: (user_id, day, column, stored, expected) for every mismatch.
+    """
+    expected = expected_totals(user_id)
+    statement = select(DailySummary.__table__)
+    if user_id is not None:
+        statement = statement.where(DailySummary.user_id == user_id)
+    columns = [column for columns in ROLLUP_COLUMNS.values() for column in columns]
+    drift = []
+    for summary in db.session.execute(statement):
+        values = expected.pop((summary.user_id, summary.day), {})
+        for column in columns:
+            stored, wanted = getattr(summary, column), values.get(column, 0) or 0
+            if abs(stored - wanted) > tolerance:
+                drift.append((summary.user_id, summary.day, column, stored, wanted))
+    for (missing_user, day), values in expected.items():
+        for column in columns:
+            if values.get(column):
+                drift.append((missing_user, day, column, 0, values[column]))
+    return drift
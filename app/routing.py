@@ -0,0 +1,117 @@
+import random
+import time
+from functools import wraps
+from flask import current_app, g, has_request_context, session
+from flask_login import current_user
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, select
+
+# Flask-SQLAlchemy bind keys of the read replicas are REPLICA_PREFIX followed by their position
+REPLICA_PREFIX = 'replica_'
+
+# Key in the Flask session holding the time until which the user reads from the primary
+PIN_KEY = 'primary_until'
+
+class RoutingSession(Session):
+    """
+    A Flask-SQLAlchemy session that sends statements on per-user tables to the user's shard
+    (see app.sharding), and other SELECTs to a read replica while replica reads are switched
+    on for it (see replica_reads). Writes, flushes and everything else use the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        from .sharding import shard_bind  # Imported here; app.sharding needs the models, which need db
+
+        if bind is None:
+            shard = shard_bind(self, mapper, clause)
+            if shard is not None:
+                return shard
+        replica = self.info.get('replica')
+        if replica is not None and bind is None and not self._flushing and getattr(clause, 'is_select', False):
+            return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def replica_binds(urls):
+    """
+    Returns the SQLALCHEMY_BINDS entries for a list of replica database URLs.
+    """
+    return {f'{REPLICA_PREFIX}{i}': url for i, url in enumerate(urls)}
+
+def replica_engines(db):
+    """
+    Returns the engines of the configured read replicas.
+    """
+    return [engine for key, engine in db.engines.items() if key and key.startswith(REPLICA_PREFIX)]
+
+def pin_to_primary():
+    """
+    Sends the current user's reads to the primary for REPLICA_PIN_SECONDS, so they see their own writes.
+    """
+    session[PIN_KEY] = time.time() + current_app.config.get('REPLICA_PIN_SECONDS', 5)
+
+def is_pinned():
+    """
+    Checks whether the current user wrote recently enough to be reading from the primary.
+    """
+    return session.get(PIN_KEY, 0) > time.time()
+
+def _replica_is_current(engine, user):
+    # A replica that has not yet seen the user's latest write would serve stale data
+    # under a fresh ETag, so compare the data versions first. Replicas copy the directory
+    # database only; a sharded user's log data is always read from their shard.
+    from .models import DataVersion
+
+    if user.shard_id is not None:
+        return True
+    with engine.connect() as connection:
+        version = connection.execute(select(DataVersion.version).where(DataVersion.user_id == user.id)).scalar()
+    return (version or 0) >= user.data_version
+
+def use_replica(db):
+    """
+    Switches the request's session to a random read replica for SELECTs, unless there is none,
+    the user is pinned to the primary, or the replica lags behind the user's data.
+
+    Returns:
+        bool: Whether reads now go to a replica.
+    """
+    engines = replica_engines(db)
+    if not engines or is_pinned():
+        return False
+    engine = random.choice(engines)
+    if current_user.is_authenticated and not _replica_is_current(engine, current_user):
+        return False
+    db.session.info['replica'] = engine
+    return True
+
+def replica_reads(view):
+    """
+    Decorator for read-only views whose SELECTs may be served by a read replica.
+    Apply it below login_required so the user itself is loaded from the primary.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        use_replica(current_app.extensions['sqlalchemy'])
+        return view(*args, **kwargs)
+    return wrapper
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _flushed(db_session, flush_context):
+    db_session.info['wrote'] = True
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _executed(execute_state):
+    if execute_state.is_insert or execute_state.is_update or execute_state.is_delete:
+        execute_state.session.info['wrote'] = True
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _committed(db_session):
+    # Any write committed during a request pins that browser session to the primary;
+    # background jobs have no session to pin, and API token clients send no cookie to carry
+    # the pin, so they get no Set-Cookie either
+    if db_session.info.pop('wrote', False) and has_request_context() and g.get('api_token') is None:
+        pin_to_primary()
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _rolled_back(db_session):
+    db_session.info.pop('wrote', None)
@@ -0,0 +1,142 @@
+import hashlib
+import threading
+from flask import current_app
+from sqlalchemy import create_engine, event, inspect, select, update
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.sql.util import find_tables
+from .models import User, Shard, DataVersion, Activity, Nutrition, Sleep, Mood, DailySummary, ImportJob, LogPartition
+from . import sqlite
+
+# Tables holding a user's data and its version, which live on the user's shard, along with
+# the catalog of the shard's log partitions. Everything else, including the user table itself, stays in the
+# directory database (SQLALCHEMY_DATABASE_URI).
+SHARDED_MODELS = (DataVersion, Activity, Nutrition, Sleep, Mood, DailySummary, ImportJob, LogPartition)
+SHARDED_TABLES = frozenset(model.__tablename__ for model in SHARDED_MODELS)
+
+class ShardingError(RuntimeError):
+    """
+    Raised when a sharded table is queried without choosing whose shard to use.
+    """
+
+def shard_for(user_id, shard_ids):
+    """
+    Picks a user's shard by rendezvous hashing: every shard gets a stable pseudo-random score
+    for the user and the highest one wins. Adding a shard only moves the users it now wins,
+    about 1/N of them, and every process agrees on the result without coordination.
+
+    Args:
+        user_id (int): The user to place.
+        shard_ids (iterable): The ids of the registered shards.
+
+    Returns:
+        int: The chosen shard id, or None when there are no shards.
+    """
+    def score(shard_id):
+        return hashlib.blake2b(f'{user_id}:{shard_id}'.encode(), digest_size=8).digest()
+    return max(shard_ids, key=score, default=None)
+
+class _Registry:
+    # Engines of the shards known to this process, reloaded from the shard table when
+    # a user points at a shard added since
+    def __init__(self):
+        self.engines = {}
+        self.loaded = False
+        self.lock = threading.Lock()
+
+def _registry():
+    return current_app.extensions.setdefault('shards', _Registry())
+
+def shard_engines(refresh=False):
+    """
+    Returns the engines of all registered shards, keyed by shard id.
+    Engines are created once per process, with the SQLite tuning profile but without
+    foreign keys, since the user table they reference lives in the directory, and any
+    sharded table added since the shard was created is created then.
+    """
+    registry = _registry()
+    if refresh or not registry.loaded:
+        with registry.lock:
+            db = current_app.extensions['sqlalchemy']
+            with db.engine.connect() as connection:
+                shards = connection.execute(select(Shard.id, Shard.url)).all()
+            for shard_id, url in shards:
+                if shard_id not in registry.engines:
+                    engine = create_engine(url)
+                    sqlite.configure_engine(current_app, engine, foreign_keys=False)
+                    create_shard_schema(engine)
+                    registry.engines[shard_id] = engine
+            registry.loaded = True
+    return registry.engines
+
+def shard_engine(shard_id):
+    """
+    Returns the engine of a shard, or the directory engine for None.
+    """
+    if shard_id is None:
+        return current_app.extensions['sqlalchemy'].engine
+    engines = shard_engines()
+    if shard_id not in engines:
+        engines = shard_engines(refresh=True)
+    if shard_id not in engines:
+        raise ShardingError(f'Unknown shard {shard_id}')
+    return engines[shard_id]
+
+def shard_locations():
+    """
+    Returns every place user data can live: None for the directory database, then each shard id.
+    """
+    return [None, *sorted(shard_engines(refresh=True))]
+
+def select_shard(db_session, shard_id):
+    """
+    Sends the session's queries on sharded tables to a shard; None selects the directory database.
+    """
+    db_session.info['shard'] = shard_id
+
+def use_user_shard(db_session, user_id):
+    """
+    Sends the session's queries on sharded tables to a user's shard.
+
+    Returns:
+        int: The user's shard id, or None if their data is in the directory database.
+    """
+    shard_id = db_session.execute(select(User.shard_id).where(User.id == user_id)).scalar()
+    select_shard(db_session, shard_id)
+    return shard_id
+
+def shard_bind(db_session, mapper=None, clause=None):
+    """
+    Returns the engine a statement on a sharded table must use, or None to let the
+    session choose as usual. Called by RoutingSession.get_bind.
+    """
+    if mapper is not None:
+        tables = [inspect(mapper).local_table]
+    elif clause is not None:
+        tables = find_tables(clause, include_crud=True)
+    else:
+        return None
+    # Partition tables (see app.partitions) go wherever the table they were split from does
+    if not any(table.info.get('parent', table.name) in SHARDED_TABLES for table in tables):
+        return None
+    if 'shard' not in db_session.info:
+        if shard_engines():
+            raise ShardingError('Select a shard before querying per-user tables')
+        return None
+    shard_id = db_session.info['shard']
+    return None if shard_id is None else shard_engine(shard_id)
+
+def create_shard_schema(engine):
+    """
+    Creates the sharded tables, and their indexes, in a new shard database.
+    """
+    tables = [model.__table__ for model in SHARDED_MODELS]
+    current_app.extensions['sqlalchemy'].metadata.create_all(engine, tables=tables)
+
+@event.listens_for(User, 'after_insert')
+def _place_new_user(mapper, connection, user):
+    # New users go straight to the shard rendezvous hashing picks for them
+    shard_ids = connection.execute(select(Shard.id)).scalars().all()
+    if shard_ids and user.shard_id is None:
+        shard_id = shard_for(user.id, shard_ids)
+        connection.execute(update(User.__table__).where(User.id == user.id).values(shard_id=shard_id))
+        set_committed_value(user, 'shard_id', shard_id)
@@ -0,0 +1,91 @@
+import os
+import time
+from sqlalchemy import event
+
+# Schema name the archive database is attached under (see SQLITE_ARCHIVE and app.partitions)
+ARCHIVE_SCHEMA = 'archive'
+
+def _is_sqlite(engine):
+    return engine.dialect.name == 'sqlite'
+
+def _execute_pragmas(dbapi_connection, statements):
+    cursor = dbapi_connection.cursor()
+    for statement in statements:
+        cursor.execute(statement)
+    cursor.close()
+
+def pragma_statements(pragmas, foreign_keys=True):
+    """
+    Turns a mapping of pragma names to values into PRAGMA statements.
+    Foreign keys are switched on first: SQLite ignores them, and so ON DELETE CASCADE,
+    unless asked on every connection.
+
+    Args:
+        pragmas (dict): e.g. {'journal_mode': 'WAL', 'busy_timeout': 5000}.
+        foreign_keys (bool): False for shard databases, which hold no user table to reference.
+
+    Returns:
+        list: The statements, in order.
+    """
+    statements = ['PRAGMA foreign_keys=ON'] if foreign_keys else []
+    for name, value in pragmas.items():
+        if not name.isidentifier():
+            raise ValueError(f"Invalid SQLite pragma name '{name}'")
+        statements.append(f'PRAGMA {name}={value}')
+    return statements
+
+def archive_path(database):
+    """
+    Returns the path of the archive database kept next to a SQLite database file,
+    e.g. instance/health_tracker.db -> instance/health_tracker-archive.db.
+    """
+    root, ext = os.path.splitext(database)
+    return f'{root}-archive{ext}'
+
+def attach_statement(database):
+    """
+    Returns the ATTACH statement that opens a database file's archive as ARCHIVE_SCHEMA.
+    The archive file is created on first use.
+    """
+    path = archive_path(database).replace("'", "''")
+    return f"ATTACH DATABASE '{path}' AS {ARCHIVE_SCHEMA}"
+
+def _on_connect(statements):
+    def on_connect(dbapi_connection, connection_record):
+        _execute_pragmas(dbapi_connection, statements)
+        connection_record.info['optimized_at'] = time.monotonic()
+    return on_connect
+
+def _on_checkout(interval):
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        # Long-lived pooled connections refresh the planner statistics now and then
+        if time.monotonic() - connection_record.info.get('optimized_at', 0) >= interval:
+            _execute_pragmas(dbapi_connection, ['PRAGMA optimize'])
+            connection_record.info['optimized_at'] = time.monotonic()
+    return on_checkout
+
+def configure_engine(app, engine, foreign_keys=True):
+    """
+    Registers a connect event on a SQLite engine that applies the SQLITE_PRAGMAS tuning
+    profile to every new connection, and attaches the archive database when SQLITE_ARCHIVE
+    is set, and a checkout event that runs PRAGMA optimize on a connection once every
+    SQLITE_OPTIMIZE_INTERVAL seconds (0 disables it). Other databases are left alone.
+    """
+    if not _is_sqlite(engine):
+        return
+    statements = pragma_statements(app.config.get('SQLITE_PRAGMAS', {}), foreign_keys)
+    database = engine.url.database
+    if app.config.get('SQLITE_ARCHIVE') and database and database != ':memory:':
+        statements.append(attach_statement(database))
+    event.listen(engine, 'connect', _on_connect(statements))
+    interval = app.config.get('SQLITE_OPTIMIZE_INTERVAL', 0)
+    if interval:
+        event.listen(engine, 'checkout', _on_checkout(interval))
+
+def init_app(app, db):
+    """
+    Applies the SQLite tuning profile to the app's configured engines.
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            configure_engine(app, engine)
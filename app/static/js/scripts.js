@@ -1,146 +1,237 @@
 console.log("Custom scripts loaded.");
 
-document.addEventListener("DOMContentLoaded", function() {
-    // Fetch and display average data
-    fetch('/dashboard_data')
-        .then(response => response.json())
-        .then(data => {
-            console.log('Dashboard Data:', data);
-            document.getElementById('averageSleepHours').textContent = data.avg_sleep_hours.toFixed(2) + " hours";
-            document.getElementById('totalCalories').textContent = data.total_calories + " kcal";
-            document.getElementById('moodTrends').textContent = JSON.stringify(data.mood_counts);
-        })
-        .catch(error => console.error('Error fetching dashboard data:', error));
-
-    // Chart configurations
-    const chartConfig = {
-        type: 'line',
+// Fetch JSON, revalidating with the browser's cached ETag so unchanged data comes back as a 304
+function fetchJSON(url) {
+    return fetch(url, { cache: 'no-cache', headers: { 'Accept': 'application/json' } })
+        .then(response => response.json());
+}
+
+// Chart series arrive in the columnar format: one array per field, dates as days
+// (or hours, for hour buckets) since 1970-01-01, categorical fields as a dictionary plus codes
+function columnDates(data) {
+    const unit = data.date_unit === 'hour' ? 3600000 : 86400000;
+    return data.date.map(value => {
+        const iso = new Date(value * unit).toISOString();
+        return data.date_unit === 'hour' ? iso.slice(0, 13) + ':00' : iso.slice(0, 10);
+    });
+}
+
+function columnSum(values) {
+    return values.reduce((sum, value) => sum + value, 0);
+}
+
+// Chart configurations
+const chartConfig = {
+    type: 'line',
+    options: {
+        responsive: true,
+        maintainAspectRatio: false,
+        scales: {
+            y: {
+                beginAtZero: true
+            }
+        }
+    }
+};
+
+// Display average data
+function renderSummary(data) {
+    console.log('Dashboard Data:', data);
+    document.getElementById('averageSleepHours').textContent = data.avg_sleep_hours.toFixed(2) + " hours";
+    document.getElementById('totalCalories').textContent = data.total_calories + " kcal";
+    document.getElementById('moodTrends').textContent = JSON.stringify(data.mood_counts);
+}
+
+// Display activity data
+function renderActivity(data) {
+    console.log('Activity Data:', data);
+    const ctx = document.getElementById('activityChart').getContext('2d');
+    new Chart(ctx, {
+        ...chartConfig,
+        data: {
+            labels: columnDates(data),
+            datasets: [{
+                label: 'Steps',
+                data: data.steps,
+                backgroundColor: 'rgba(75, 192, 192, 0.2)',
+                borderColor: 'rgba(75, 192, 192, 1)',
+                borderWidth: 1
+            }]
+        }
+    });
+}
+
+// Display nutrition data
+function renderNutrition(data) {
+    console.log('Nutrition Data:', data);
+    const ctx = document.getElementById('nutritionChart').getContext('2d');
+    new Chart(ctx, {
+        type: 'pie',
+        data: {
+            labels: ['Calories', 'Protein', 'Carbs', 'Fats'],
+            datasets: [{
+                label: 'Nutrition',
+                data: [
+                    columnSum(data.calories),
+                    columnSum(data.protein),
+                    columnSum(data.carbs),
+                    columnSum(data.fats)
+                ],
+                backgroundColor: [
+                    'rgba(255, 99, 132, 0.2)',
+                    'rgba(54, 162, 235, 0.2)',
+                    'rgba(255, 206, 86, 0.2)',
+                    'rgba(75, 192, 192, 0.2)'
+                ],
+                borderColor: [
+                    'rgba(255, 99, 132, 1)',
+                    'rgba(54, 162, 235, 1)',
+                    'rgba(255, 206, 86, 1)',
+                    'rgba(75, 192, 192, 1)'
+                ],
+                borderWidth: 1
+            }]
+        },
+        options: {
+            responsive: true,
+            maintainAspectRatio: false
+        }
+    });
+}
+
+// Display sleep data
+function renderSleep(data) {
+    console.log('Sleep Data:', data);
+    const ctx = document.getElementById('sleepChart').getContext('2d');
+    new Chart(ctx, {
+        ...chartConfig,
+        data: {
+            labels: columnDates(data),
+            datasets: [{
+                label: 'Sleep Hours',
+                data: data.hours,
+                backgroundColor: 'rgba(153, 102, 255, 0.2)',
+                borderColor: 'rgba(153, 102, 255, 1)',
+                borderWidth: 1
+            }]
+        }
+    });
+}
+
+// Display mood data
+function renderMood(data) {
+    console.log('Mood Data:', data);
+    const ctx = document.getElementById('moodChart').getContext('2d');
+    new Chart(ctx, {
+        ...chartConfig,
+        data: {
+            labels: columnDates(data),
+            datasets: [{
+                label: 'Mood',
+                data: data.rating,
+                backgroundColor: 'rgba(255, 159, 64, 0.2)',
+                borderColor: 'rgba(255, 159, 64, 1)',
+                borderWidth: 1
+            }]
+        },
         options: {
             responsive: true,
             maintainAspectRatio: false,
             scales: {
-                y: {
+                r: {
                     beginAtZero: true
                 }
             }
         }
-    };
-
-    // Fetch and display activity data
-    fetch('/activity_data')
-        .then(response => response.json())
-        .then(data => {
-            console.log('Activity Data:', data);
-            const ctx = document.getElementById('activityChart').getContext('2d');
-            new Chart(ctx, {
-                ...chartConfig,
-                data: {
-                    labels: data.map(item => item.date),
-                    datasets: [{
-                        label: 'Steps',
-                        data: data.map(item => item.steps),
-                        backgroundColor: 'rgba(75, 192, 192, 0.2)',
-                        borderColor: 'rgba(75, 192, 192, 1)',
-                        borderWidth: 1
-                    }]
-                }
-            });
-        })
-        .catch(error => console.error('Error fetching activity data:', error));
-
-    // Fetch and display nutrition data
-    fetch('/nutrition_data')
-        .then(response => response.json())
-        .then(data => {
-            console.log('Nutrition Data:', data);
-            const ctx = document.getElementById('nutritionChart').getContext('2d');
-            new Chart(ctx, {
-                type: 'pie',
-                data: {
-                    labels: ['Calories', 'Protein', 'Carbs', 'Fats'],
-                    datasets: [{
-                        label: 'Nutrition',
-                        data: [
-                            data.reduce((sum, n) => sum + n.calories, 0),
-                            data.reduce((sum, n) => sum + n.protein, 0),
-                            data.reduce((sum, n) => sum + n.carbs, 0),
-                            data.reduce((sum, n) => sum + n.fats, 0)
-                        ],
-                        backgroundColor: [
-                            'rgba(255, 99, 132, 0.2)',
-                            'rgba(54, 162, 235, 0.2)',
-                            'rgba(255, 206, 86, 0.2)',
-                            'rgba(75, 192, 192, 0.2)'
-                        ],
-                        borderColor: [
-                            'rgba(255, 99, 132, 1)',
-                            'rgba(54, 162, 235, 1)',
-                            'rgba(255, 206, 86, 1)',
-                            'rgba(75, 192, 192, 1)'
-                        ],
-                        borderWidth: 1
-                    }]
-                },
-                options: {
-                    responsive: true,
-                    maintainAspectRatio: false
-                }
-            });
-        })
-        .catch(error => console.error('Error fetching nutrition data:', error));
-
-    // Fetch and display sleep data
-    fetch('/sleep_data')
-        .then(response => response.json())
-        .then(data => {
-            console.log('Sleep Data:', data);
-            const ctx = document.getElementById('sleepChart').getContext('2d');
-            new Chart(ctx, {
-                ...chartConfig,
-                data: {
-                    labels: data.map(item => item.date),
-                    datasets: [{
-                        label: 'Sleep Hours',
-                        data: data.map(item => item.hours),
-                        backgroundColor: 'rgba(153, 102, 255, 0.2)',
-                        borderColor: 'rgba(153, 102, 255, 1)',
-                        borderWidth: 1
-                    }]
-                }
-            });
-        })
-        .catch(error => console.error('Error fetching sleep data:', error));
-
-    // Fetch and display mood data
-    fetch('/mood_data')
-        .then(response => response.json())
-        .then(data => {
-            console.log('Mood Data:', data);
-            const ctx = document.getElementById('moodChart').getContext('2d');
-            new Chart(ctx, {
-                ...chartConfig,
-                data: {
-                    labels: data.map(item => item.date),
-                    datasets: [{
-                        label: 'Mood',
-                        data: data.map(item => item.rating),
-                        backgroundColor: 'rgba(255, 159, 64, 0.2)',
-                        borderColor: 'rgba(255, 159, 64, 1)',
-                        borderWidth: 1
-                    }]
-                },
-                options: {
-                    responsive: true,
-                    maintainAspectRatio: false,
-                    scales: {
-                        r: {
-                            beginAtZero: true
-                        }
+    });
+}
+
+// Use the bundle embedded in the dashboard page, falling back to one request for all of it
+function loadDashboardBundle() {
+    const embedded = document.getElementById('dashboardBundle');
+    if (embedded) {
+        return Promise.resolve(JSON.parse(embedded.textContent));
+    }
+    return fetchJSON('/dashboard_bundle?format=columnar');
+}
+
+// Page through a history list, appending each page as it arrives
+function initHistoryList(list) {
+    const moreButton = document.getElementById('historyMore');
+    let cursor = null;
+
+    function loadPage() {
+        const url = list.dataset.url + (cursor ? '?cursor=' + encodeURIComponent(cursor) : '');
+        moreButton.disabled = true;
+        return fetchJSON(url)
+            .then(page => {
+                page.items.forEach(item => {
+                    const entry = document.createElement('li');
+                    entry.className = 'list-group-item';
+                    entry.textContent = item.date.slice(0, 10) + ' - ' + item.type + ' - ' + item.duration +
+                        ' minutes, ' + item.steps + ' steps, ' + item.distance + ' km';
+                    list.appendChild(entry);
+                });
+                cursor = page.next_cursor;
+                moreButton.hidden = !cursor;
+                moreButton.disabled = false;
+                document.getElementById('historyEmpty').hidden = list.children.length > 0;
+            })
+            .catch(error => console.error('Error fetching history:', error));
+    }
+
+    moreButton.addEventListener('click', loadPage);
+    loadPage();
+}
+
+// Tell the user whether a username is free while they type, once they pause
+function initUsernameCheck(input) {
+    const status = document.getElementById('usernameStatus');
+    let timer = null;
+
+    input.addEventListener('input', function() {
+        clearTimeout(timer);
+        status.textContent = '';
+        const username = input.value.trim();
+        if (username.length < 2) {
+            return;
+        }
+        timer = setTimeout(function() {
+            fetchJSON(input.dataset.availabilityUrl + '?username=' + encodeURIComponent(username))
+                .then(result => {
+                    if (result.username !== input.value.trim()) {
+                        return;
                     }
-                }
-            });
-        })
-        .catch(error => console.error('Error fetching mood data:', error));
+                    status.textContent = result.available ? 'Username is available' : 'Username is taken';
+                    status.className = 'form-text ' + (result.available ? 'text-success' : 'text-danger');
+                })
+                .catch(error => console.error('Error checking username:', error));
+        }, 300);
+    });
+}
+
+document.addEventListener("DOMContentLoaded", function() {
+    const usernameInput = document.querySelector('[data-availability-url]');
+    if (usernameInput) {
+        initUsernameCheck(usernameInput);
+    }
+
+    const historyList = document.getElementById('historyList');
+    if (historyList) {
+        initHistoryList(historyList);
+    }
+
+    if (document.getElementById('activityChart')) {
+        loadDashboardBundle()
+            .then(bundle => {
+                renderSummary(bundle.summary);
+                renderActivity(bundle.activity);
+                renderNutrition(bundle.nutrition);
+                renderSleep(bundle.sleep);
+                renderMood(bundle.mood);
+            })
+            .catch(error => console.error('Error loading dashboard data:', error));
+    }
 
     // Smooth scroll for internal links
     document.querySelectorAll('a[href^="#"]').forEach(anchor => {
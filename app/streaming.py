@@ -0,0 +1,33 @@
+import json
+
+# Rows fetched from the cursor per round trip when streaming
+STREAM_BATCH_SIZE = 1000
+
+def json_array_chunks(rows, serialize, chunk_size=STREAM_BATCH_SIZE):
+    """
+    Writes rows as a JSON array, one chunk of up to chunk_size elements at a time.
+
+    Only one chunk is held in memory, so the cost of a response does not grow
+    with the number of rows.
+
+    Args:
+        rows (iterable): Result rows, typically from a statement executed with yield_per.
+        serialize (callable): Turns a row into a JSON-serializable value.
+        chunk_size (int): Number of rows written per chunk.
+
+    Yields:
+        str: Consecutive pieces of the JSON document.
+    """
+    encoder = json.JSONEncoder(separators=(', ', ': '), sort_keys=True)
+    yield '['
+    chunk = []
+    separator = ''
+    for row in rows:
+        chunk.append(encoder.encode(serialize(row)))
+        if len(chunk) >= chunk_size:
+            yield separator + ', '.join(chunk)
+            separator = ', '
+            chunk = []
+    if chunk:
+        yield separator + ', '.join(chunk)
+    yield ']'
@@ -0,0 +1,190 @@
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import abort, current_app, g, jsonify, make_response, request
+from itsdangerous import URLSafeSerializer, BadData
+from sqlalchemy import select, delete
+from .models import RevokedToken, RevokedUser
+from . import db, csrf
+
+# Scopes an API token can carry: reading log data, and writing it
+TOKEN_SCOPES = ('read', 'write')
+
+# Default and longest lifetime of a token, in seconds
+API_TOKEN_LIFETIME = 30 * 24 * 3600
+
+# Seconds between reloads of the revocation list
+API_TOKEN_REVOCATION_REFRESH = 30
+
+class TokenError(ValueError):
+    """
+    Raised when a token cannot be issued as requested.
+    """
+
+def _serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='api-token')
+
+def issue_token(user_id, scopes=TOKEN_SCOPES, lifetime=None):
+    """
+    Issues a signed API token for a user. The token carries everything needed to check it
+    (user id, scopes, issue time, expiry and a token id for revocation), so verifying it is
+    an HMAC and lookups in the in-memory revocation list.
+
+    Args:
+        user_id (int): The user the token acts for.
+        scopes (iterable): Scopes from TOKEN_SCOPES.
+        lifetime (int): Seconds until the token expires, at most API_TOKEN_LIFETIME.
+
+    Returns:
+        tuple: The token string and its claims.
+    """
+    scopes = sorted(set(scopes))
+    unknown = [scope for scope in scopes if scope not in TOKEN_SCOPES]
+    if unknown or not scopes:
+        raise TokenError(f'Scopes must be a non-empty subset of {", ".join(TOKEN_SCOPES)}')
+    longest = current_app.config.get('API_TOKEN_LIFETIME', API_TOKEN_LIFETIME)
+    lifetime = longest if lifetime is None else lifetime
+    if not 0 < lifetime <= longest:
+        raise TokenError(f'Lifetime must be between 1 and {longest} seconds')
+    now = int(time.time())
+    claims = {'sub': user_id, 'scp': scopes, 'iat': now, 'exp': now + lifetime, 'jti': uuid.uuid4().hex}
+    return _serializer().dumps(claims), claims
+
+class _RevocationList:
+    # Ids of revoked, unexpired tokens, and the time up to which each revoked user's tokens are
+    # refused, reloaded from the revoked_token and revoked_user tables every refresh seconds by
+    # whichever request notices first; the others keep using the current ones
+    def __init__(self):
+        self.jtis = frozenset()
+        self.users = {}
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+def _revocations():
+    revocations = current_app.extensions.setdefault('revoked_tokens', _RevocationList())
+    refresh = current_app.config.get('API_TOKEN_REVOCATION_REFRESH', API_TOKEN_REVOCATION_REFRESH)
+    stale = revocations.loaded_at is None or time.monotonic() - revocations.loaded_at >= refresh
+    if stale and revocations.lock.acquire(blocking=revocations.loaded_at is None):
+        try:
+            now = datetime.utcnow()
+            with db.engine.connect() as connection:
+                jtis = connection.execute(
+                    select(RevokedToken.jti).where(RevokedToken.expires_at > now)
+                ).scalars().all()
+                users = connection.execute(
+                    select(RevokedUser.user_id, RevokedUser.revoked_at).where(RevokedUser.expires_at > now)
+                ).all()
+            revocations.jtis = frozenset(jtis)
+            revocations.users = {user_id: _timestamp(revoked_at) for user_id, revoked_at in users}
+            revocations.loaded_at = time.monotonic()
+        finally:
+            revocations.lock.release()
+    return revocations
+
+def _timestamp(moment):
+    return (moment - datetime(1970, 1, 1)).total_seconds()
+
+def signed_claims(token):
+    """
+    Checks a token's signature and expiry only. The token may still have been revoked, so
+    this is for uses like rate limiting that need the user without the revocation list.
+
+    Returns:
+        dict: The token's claims, or None if it is forged or expired.
+    """
+    try:
+        claims = _serializer().loads(token)
+    except BadData:
+        return None
+    if not isinstance(claims, dict) or claims.get('exp', 0) <= time.time():
+        return None
+    return claims
+
+def verify_token(token, scope=None):
+    """
+    Checks a token's signature, expiry, scope and revocation, without touching the database
+    except for the periodic reload of the revocation list. Tokens of deleted users are revoked
+    (see revoke_user_tokens), so a valid token's user exists.
+
+    Returns:
+        dict: The token's claims, or None if it is not valid for the scope.
+    """
+    claims = signed_claims(token)
+    if claims is None:
+        return None
+    if scope is not None and scope not in claims.get('scp', ()):
+        return None
+    revocations = _revocations()
+    if claims.get('jti') in revocations.jtis:
+        return None
+    revoked_at = revocations.users.get(claims.get('sub'))
+    if revoked_at is not None and claims.get('iat', 0) <= revoked_at:
+        return None
+    return claims
+
+def revoke_token(claims):
+    """
+    Revokes a token until it expires. This worker stops accepting it at once, the others
+    within API_TOKEN_REVOCATION_REFRESH seconds. Revocations of expired tokens are dropped.
+    """
+    now = datetime.utcnow()
+    db.session.execute(delete(RevokedToken).where(RevokedToken.expires_at <= now))
+    db.session.merge(RevokedToken(jti=claims['jti'], user_id=claims['sub'],
+                                  expires_at=datetime.utcfromtimestamp(claims['exp'])))
+    db.session.commit()
+    revocations = _revocations()
+    revocations.jtis = revocations.jtis | {claims['jti']}
+
+def revoke_user_tokens(user_id):
+    """
+    Revokes every token issued to a user so far, in the current session's transaction, until
+    the last of them has expired. This worker stops accepting them at once, the others within
+    API_TOKEN_REVOCATION_REFRESH seconds.
+    """
+    now = datetime.utcnow()
+    lifetime = current_app.config.get('API_TOKEN_LIFETIME', API_TOKEN_LIFETIME)
+    db.session.execute(delete(RevokedUser).where(RevokedUser.expires_at <= now))
+    db.session.merge(RevokedUser(user_id=user_id, revoked_at=now, expires_at=now + timedelta(seconds=lifetime)))
+    # A rollback leaves this worker refusing the tokens until the next reload, which is harmless
+    revocations = _revocations()
+    revocations.users = {**revocations.users, user_id: _timestamp(now)}
+
+def request_token_claims():
+    """
+    Returns the claims of the bearer token sent with the current request, or None when there
+    is none or the view does not accept tokens (see token_auth). An invalid token is answered
+    with a JSON 401 rather than the login page redirect.
+    """
+    kind, _, token = request.headers.get('Authorization', '').partition(' ')
+    if kind.lower() != 'bearer' or not token:
+        return None
+    view = current_app.view_functions.get(request.endpoint)
+    if not getattr(view, 'accepts_token', False):
+        return None
+    claims = verify_token(token.strip(), view.token_scope)
+    if claims is None:
+        abort(make_response(jsonify({'error': 'Invalid, expired or revoked token'}), 401))
+    return claims
+
+def token_auth(scope=None):
+    """
+    Decorator for API views that also accept an `Authorization: Bearer <token>` header
+    carrying scope (any valid token if None). Apply it below login_required.
+
+    Token requests are exempt from CSRF protection: a forged cross-site request cannot
+    attach the header. Requests authenticated by the session cookie are still checked.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            config = current_app.config
+            if g.get('api_token') is None and config['WTF_CSRF_ENABLED'] and config['WTF_CSRF_CHECK_DEFAULT']:
+                csrf.protect()
+            return view(*args, **kwargs)
+        wrapper.accepts_token = True
+        wrapper.token_scope = scope
+        csrf.exempt(wrapper)
+        return wrapper
+    return decorator
@@ -0,0 +1,4 @@
+"""
+Benchmarks for the performance work on the hot paths. Each module runs on its own against a
+throwaway database, e.g. `python -m benchmarks.login_storm`, and prints what it measured.
+"""
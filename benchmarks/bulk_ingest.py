@@ -0,0 +1,81 @@
+"""
+Bulk ingest throughput: POST /entries/bulk against logging the same entries through the form.
+
+The form path (POST /log_sleep) costs a request, a validation and a commit per entry; the bulk
+path validates a whole batch and inserts it with one executemany per kind in one transaction.
+The target is at least 50x the form path's rows per second.
+
+    python -m benchmarks.bulk_ingest
+    python -m benchmarks.bulk_ingest --form-entries 500 --batches 20 --batch-size 5000
+"""
+import argparse
+import time
+from datetime import date, timedelta
+from app import db
+from app.models import User
+from app.passwords import password_hasher
+from .common import benchmark_app
+
+# Wanted speed-up of the bulk path over the form path
+TARGET_SPEEDUP = 50
+
+def logged_in_client(app, i):
+    """
+    Creates a user and returns a test client logged in as them.
+    """
+    with app.app_context():
+        db.session.add(User(username=f'user{i}', email=f'user{i}@example.com', password=password_hasher.hash('secret1')))
+        db.session.commit()
+    client = app.test_client()
+    client.post('/auth/login', data={'email': f'user{i}@example.com', 'password': 'secret1'})
+    return client
+
+def form_rate(client, entries):
+    """
+    Logs entries one form post at a time and returns the rows per second.
+    """
+    began = time.perf_counter()
+    for i in range(entries):
+        response = client.post('/log_sleep', data={'hours': 5 + i % 5, 'quality': 'Good'})
+        assert response.status_code == 302, response.status_code
+    return entries / (time.perf_counter() - began)
+
+def bulk_rate(client, batches, batch_size):
+    """
+    Logs batches of mixed entries through /entries/bulk and returns the rows per second.
+    """
+    today = date.today()
+    payloads = []
+    for batch in range(batches):
+        entries = []
+        for i in range(batch_size):
+            day = (today - timedelta(days=(batch * batch_size + i) % 3650)).isoformat()
+            if i % 2:
+                entries.append({'kind': 'sleep', 'hours': 5 + i % 5, 'quality': 'Good', 'date': day})
+            else:
+                entries.append({'kind': 'activity', 'steps': 1000 + i, 'distance': 1.5, 'calories': 120,
+                                'type': 'Running', 'duration': 30, 'date': day})
+        payloads.append({'entries': entries})
+    began = time.perf_counter()
+    for payload in payloads:
+        response = client.post('/entries/bulk', json=payload)
+        assert response.status_code == 200 and response.get_json()['rejected'] == 0, response.get_data(as_text=True)
+    return batches * batch_size / (time.perf_counter() - began)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--form-entries', type=int, default=300, help='Entries logged through the form.')
+    parser.add_argument('--batches', type=int, default=10, help='Bulk requests.')
+    parser.add_argument('--batch-size', type=int, default=5000, help='Entries per bulk request, at most BULK_MAX_ENTRIES.')
+    args = parser.parse_args()
+
+    app = benchmark_app(RESPONSE_CACHE_ENABLED=False)
+    form = form_rate(logged_in_client(app, 0), args.form_entries)
+    bulk = bulk_rate(logged_in_client(app, 1), args.batches, args.batch_size)
+    speedup = bulk / form
+    print(f'form: {form:9.0f} rows/s ({args.form_entries} posts)')
+    print(f'bulk: {bulk:9.0f} rows/s ({args.batches} x {args.batch_size} entries)')
+    print(f'speed-up {speedup:.0f}x (target {TARGET_SPEEDUP}x): {"met" if speedup >= TARGET_SPEEDUP else "missed"}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+import os
+import statistics
+import tempfile
+import time
+import config
+from app import create_app, db
+
+def benchmark_app(directory=None, create_schema=True, **settings):
+    """
+    Creates an application under TestingConfig with the schema built in a fresh database.
+
+    Args:
+        directory (str): Where to put the database; a new temporary directory if None.
+        create_schema (bool): False for worker processes opening a database already built.
+        **settings: Configuration values overriding TestingConfig.
+
+    Returns:
+        Flask: The application.
+    """
+    directory = directory or tempfile.mkdtemp(prefix='healthtrack-bench-')
+    settings.setdefault('SQLALCHEMY_DATABASE_URI', 'sqlite:///' + os.path.join(directory, 'bench.db'))
+    config.config['benchmark'] = type('BenchmarkConfig', (config.TestingConfig,), settings)
+    app = create_app('benchmark')
+    if create_schema:
+        with app.app_context():
+            db.create_all()
+    return app
+
+def timed(function, *args, repeat=5, **kwargs):
+    """
+    Calls a function repeat times and returns the median seconds per call and its last result.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+def percentile(values, share):
+    """
+    Returns the value below which share (0 to 1) of the values fall.
+    """
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))] if values else 0.0
@@ -0,0 +1,110 @@
+"""
+Concurrent writes from several processes, with SQLite's default pragmas and with SQLITE_PRAGMAS.
+
+Each writer process logs sleep entries for its own user the way the log_* views do (insert,
+rollup upsert and data version bump in one commit) while reader processes run the dashboard
+queries, as gunicorn workers would. Every mode gets a fresh database, since WAL mode is stored
+in the file.
+
+    python -m benchmarks.concurrent_writes
+    python -m benchmarks.concurrent_writes --writers 1,4,8 --readers 4 --commits 300
+"""
+import argparse
+import multiprocessing
+import tempfile
+import time
+from datetime import date
+from sqlalchemy.exc import OperationalError
+from config import Config
+from app import db
+from app.main import get_dashboard_summary, save_log_entry
+from app.models import User, Sleep
+from .common import benchmark_app, percentile
+
+# SQLite's own defaults: rollback journal, synchronous=FULL, no mmap; the Python driver's
+# 5 second timeout still applies
+MODES = {
+    'default': {},
+    'tuned': Config.SQLITE_PRAGMAS,
+}
+
+def write(directory, pragmas, user_id, commits, start, results):
+    app = benchmark_app(directory, create_schema=False, SQLITE_PRAGMAS=pragmas)
+    latencies, errors = [], 0
+    with app.app_context():
+        start.wait()
+        for i in range(commits):
+            began = time.perf_counter()
+            try:
+                save_log_entry(Sleep(user_id=user_id, date=date.today(), hours=7 + i % 3, quality='Good'))
+            except OperationalError:  # database is locked
+                db.session.rollback()
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - began)
+    results.put((latencies, errors))
+
+def read(directory, pragmas, user_id, start, stop):
+    app = benchmark_app(directory, create_schema=False, SQLITE_PRAGMAS=pragmas)
+    with app.app_context():
+        start.wait()
+        while not stop.is_set():
+            try:
+                get_dashboard_summary(user_id)
+            except OperationalError:
+                db.session.rollback()
+            db.session.remove()
+
+def run(mode, writers, readers, commits):
+    """
+    Runs writers writer and readers reader processes on a fresh database and returns
+    (commits per second, commit latencies, lock errors).
+    """
+    directory = tempfile.mkdtemp(prefix=f'healthtrack-bench-{mode}-')
+    pragmas = MODES[mode]
+    app = benchmark_app(directory, SQLITE_PRAGMAS=pragmas)
+    with app.app_context():
+        users = [User(username=f'user{i}', email=f'user{i}@example.com', password='x') for i in range(writers)]
+        db.session.add_all(users)
+        db.session.commit()
+        user_ids = [user.id for user in users]
+        db.engine.dispose()
+
+    context = multiprocessing.get_context('spawn')
+    start, stop, results = context.Barrier(writers + readers + 1), context.Event(), context.Queue()
+    processes = [context.Process(target=write, args=(directory, pragmas, user_id, commits, start, results))
+                 for user_id in user_ids]
+    processes += [context.Process(target=read, args=(directory, pragmas, user_ids[i % writers], start, stop))
+                  for i in range(readers)]
+    for process in processes:
+        process.start()
+    start.wait()
+    began = time.perf_counter()
+    latencies, errors = [], 0
+    for _ in range(writers):
+        values, failed = results.get()
+        latencies += values
+        errors += failed
+    elapsed = time.perf_counter() - began
+    stop.set()
+    for process in processes:
+        process.join()
+    return len(latencies) / elapsed, latencies, errors
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--writers', default='1,4,8', help='Writer process counts to try, comma-separated.')
+    parser.add_argument('--readers', type=int, default=4, help='Reader processes alongside more than one writer.')
+    parser.add_argument('--commits', type=int, default=300, help='Commits per writer.')
+    args = parser.parse_args()
+
+    for writers in (int(count) for count in args.writers.split(',')):
+        readers = args.readers if writers > 1 else 0
+        print(f'{writers} writer(s), {readers} reader(s), {args.commits} commits each')
+        for mode in MODES:
+            rate, latencies, errors = run(mode, writers, readers, args.commits)
+            print(f'  {mode:>8}: {rate:6.0f} commits/s, p50 {percentile(latencies, 0.5) * 1e3:6.1f} ms, '
+                  f'p99 {percentile(latencies, 0.99) * 1e3:6.1f} ms, {errors} lock errors')
+
+if __name__ == '__main__':
+    main()
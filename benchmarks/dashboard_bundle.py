@@ -0,0 +1,74 @@
+"""
+Dashboard load: the page plus one request per chart against the page with the bundle inlined.
+
+Before /dashboard_bundle, the dashboard page was followed by five XHRs: the JSON summary and
+the activity, nutrition, sleep and mood series. The page now inlines the same data in
+columnar form, so it draws with no further requests. Times are server time through the
+Flask test client with the response cache off, the mean over --loads loads; the old page is
+gone, so its template rendering is not part of the '5 XHRs' figure.
+
+    python -m benchmarks.dashboard_bundle
+    python -m benchmarks.dashboard_bundle --entries 1000 --loads 100
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+from app import db
+from app.models import User
+from app.passwords import password_hasher
+from .common import benchmark_app
+
+# The requests the dashboard used to make after loading the page
+SEPARATE_REQUESTS = ('/dashboard_data?format=json', '/activity_data', '/nutrition_data', '/sleep_data', '/mood_data')
+
+def load_time(client, paths, loads):
+    """
+    Returns the mean seconds to request every path in turn.
+    """
+    began = time.perf_counter()
+    for _ in range(loads):
+        for path in paths:
+            response = client.get(path, headers={'Accept': 'text/html'})
+            assert response.status_code == 200, (path, response.status_code)
+    return (time.perf_counter() - began) / loads
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--entries', type=int, default=10, help='Entries of each kind in the last day.')
+    parser.add_argument('--loads', type=int, default=50, help='Dashboard loads timed per variant.')
+    args = parser.parse_args()
+
+    app = benchmark_app(RESPONSE_CACHE_ENABLED=False)
+    with app.app_context():
+        db.session.add(User(username='alice', email='alice@example.com', password=password_hasher.hash('secret1')))
+        db.session.commit()
+    client = app.test_client()
+    client.post('/auth/login', data={'email': 'alice@example.com', 'password': 'secret1'})
+    now = datetime.utcnow()
+    entries = []
+    for i in range(args.entries):
+        moment = (now - timedelta(minutes=10 * i + 1)).isoformat()
+        entries += [
+            {'kind': 'activity', 'steps': 1000 + i, 'distance': 1.0, 'calories': 80, 'type': 'Walking',
+             'duration': 15, 'date': moment},
+            {'kind': 'nutrition', 'calories': 500, 'protein': 20, 'carbs': 60, 'fats': 15, 'date': moment},
+            {'kind': 'sleep', 'hours': 7, 'quality': 'Good', 'date': moment},
+            {'kind': 'mood', 'rating': 1 + i % 10, 'date': moment},
+        ]
+    client.post('/entries/bulk', json={'entries': entries})
+
+    # The page itself now carries the bundle, so the XHRs are timed on their own: they are
+    # what the page used to cost on top of rendering the template
+    variants = (
+        ('5 XHRs', list(SEPARATE_REQUESTS)),
+        ('bundle endpoint', ['/dashboard_bundle']),
+        ('page, inlined bundle', ['/dashboard_data']),
+    )
+    print(f'{args.entries} entries of each kind, mean of {args.loads} loads, response cache off')
+    for label, paths in variants:
+        load_time(client, paths, 3)  # Warm-up
+        seconds = load_time(client, paths, args.loads)
+        print(f'  {label:21}: {seconds * 1e3:6.2f} ms in {len(paths)} request(s)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Dashboard summary latency as a user's history grows.
+
+Times GET /dashboard_data?format=json (SQL aggregates over the daily rollup, with the response
+cache off) against the original path that loaded every sleep, nutrition and mood row as ORM
+objects, for a user with 100 up to 1,000,000 rows per log table. The summary's queries, the
+sleep average and calorie total ('rollup') and the mood histogram ('mood'), are also timed on
+their own; all of them read the daily rollup, one row per day logged.
+
+    python -m benchmarks.dashboard_summary
+    python -m benchmarks.dashboard_summary --sizes 100,10000,100000 --naive-max 10000
+"""
+import argparse
+from datetime import date, timedelta
+from sqlalchemy import insert
+from app import db, rollup
+from app.main import dashboard_queries, get_dashboard_summary
+from app.models import User, Sleep, Nutrition, Mood
+from app.passwords import password_hasher
+from app.sharding import select_shard
+from .common import benchmark_app, timed
+
+# Days the synthetic history is spread over; the rollup holds one row per day logged
+HISTORY_DAYS = 3650
+
+def add_history(user_id, first, last, batch=100000):
+    """
+    Adds log rows numbered first to last - 1 to each of sleep, nutrition and mood, several per day.
+    """
+    today = date.today()
+    for start in range(first, last, batch):
+        numbers = range(start, min(start + batch, last))
+        days = [today - timedelta(days=i % HISTORY_DAYS) for i in numbers]
+        db.session.execute(insert(Sleep), [
+            {'user_id': user_id, 'date': day, 'hours': 5 + i % 5, 'quality': 'Good'} for i, day in zip(numbers, days)])
+        db.session.execute(insert(Nutrition), [
+            {'user_id': user_id, 'date': day, 'calories': 300 + i % 700, 'protein': 20, 'fats': 10, 'carbs': 50}
+            for i, day in zip(numbers, days)])
+        db.session.execute(insert(Mood), [
+            {'user_id': user_id, 'date': day, 'rating': 1 + i % 10} for i, day in zip(numbers, days)])
+        db.session.commit()
+    rollup.rebuild(user_id)
+
+def naive_summary(user_id):
+    """
+    The dashboard summary as computed before it moved into SQL.
+    """
+    sleep_data = Sleep.query.filter_by(user_id=user_id).all()
+    avg_sleep_hours = sum(s.hours for s in sleep_data) / len(sleep_data) if sleep_data else 0
+    total_calories = sum(n.calories for n in Nutrition.query.filter_by(user_id=user_id).all())
+    mood_counts = {}
+    for mood in Mood.query.filter_by(user_id=user_id).all():
+        mood_counts[mood.rating] = mood_counts.get(mood.rating, 0) + 1
+    db.session.expunge_all()
+    return {'avg_sleep_hours': avg_sleep_hours, 'total_calories': total_calories, 'mood_counts': mood_counts}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='100,1000,10000,100000,1000000', help='Rows per log table, comma-separated.')
+    parser.add_argument('--naive-max', type=int, default=100000, help='Largest size to time the ORM path at.')
+    parser.add_argument('--repeat', type=int, default=5, help='Requests timed per size; the median is shown.')
+    args = parser.parse_args()
+    sizes = sorted(int(size) for size in args.sizes.split(','))
+
+    app = benchmark_app(RESPONSE_CACHE_ENABLED=False)
+    with app.app_context():
+        user = User(username='bench', email='bench@example.com', password=password_hasher.hash('secret1'))
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+    client = app.test_client()
+    client.post('/auth/login', data={'email': 'bench@example.com', 'password': 'secret1'})
+
+    print(f"{'rows':>9} {'days':>6} {'endpoint':>10} {'summary':>10} {'rollup':>10} {'mood':>10} {'ORM rows':>10}")
+    rows = 0
+    for size in sizes:
+        with app.app_context():
+            add_history(user_id, rows, size)
+            rows = size
+            select_shard(db.session, None)
+            aggregates, summary = timed(get_dashboard_summary, user_id, repeat=args.repeat)
+            queries = {name: timed(lambda: db.session.execute(statement).all(), repeat=args.repeat)[0]
+                       for name, statement in dashboard_queries(user_id).items()}
+            naive = timed(naive_summary, user_id, repeat=min(args.repeat, 3))[0] if size <= args.naive_max else None
+        endpoint, response = timed(client.get, '/dashboard_data?format=json', repeat=args.repeat)
+        assert response.get_json()['total_calories'] == summary['total_calories']
+        naive_ms = f'{naive * 1e3:8.1f}ms' if naive is not None else f"{'-':>10}"
+        rollup_ms = (queries['avg_sleep_hours'] + queries['total_calories']) * 1e3
+        print(f"{size:>9} {min(size, HISTORY_DAYS):>6} {endpoint * 1e3:8.1f}ms {aggregates * 1e3:8.1f}ms "
+              f"{rollup_ms:8.1f}ms {queries['mood_counts'] * 1e3:8.1f}ms {naive_ms}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+Largest-Triangle-Three-Buckets: the numpy implementation against the per-point Python one.
+
+Both are timed on the same random-walk series and must keep the same points. numpy wins once
+buckets hold about VECTORIZE_BUCKET_SIZE points, which is when lttb_indices switches to it.
+
+    python -m benchmarks.downsample
+    python -m benchmarks.downsample --sizes 1000,5000,20000 --max-points 300
+"""
+import argparse
+import random
+from app import downsample
+from .common import timed
+
+def random_walk(count, seed=0):
+    """
+    Returns count step-like values that drift up and down, like daily activity totals.
+    """
+    generator = random.Random(seed)
+    value, values = 5000.0, []
+    for _ in range(count):
+        value = max(0.0, value + generator.gauss(0, 400))
+        values.append(value)
+    return values
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='1000,2000,10000,100000,1000000', help='Series lengths, comma-separated.')
+    parser.add_argument('--max-points', type=int, default=500, help='Points kept.')
+    args = parser.parse_args()
+    if downsample.np is None:
+        parser.exit(1, 'numpy is not installed; only the Python path is available.\n')
+
+    print(f'{args.max_points} points kept (VECTORIZE_BUCKET_SIZE {downsample.VECTORIZE_BUCKET_SIZE})')
+    print(f"{'points':>9} {'python':>10} {'numpy':>10} {'speedup':>8}  chosen")
+    for size in sorted(int(size) for size in args.sizes.split(',')):
+        values = random_walk(size)
+        repeat = 3 if size >= 100000 else 10
+        python, expected = timed(downsample._lttb_python, values, args.max_points, repeat=repeat)
+        vectorized, indices = timed(downsample._lttb_numpy, values, args.max_points, repeat=repeat)
+        assert indices == expected, f'the implementations disagree at {size} points'
+        chosen = 'numpy' if size >= downsample.VECTORIZE_BUCKET_SIZE * args.max_points else 'python'
+        print(f'{size:>9} {python * 1e3:8.1f}ms {vectorized * 1e3:8.1f}ms {python / vectorized:7.1f}x  {chosen}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Login storm: many concurrent logins while a logged-in user keeps reading their data.
+
+Shows what the password hashing pool (app.passwords) buys: the logins admitted still take
+as long as their hashes, but those beyond PASSWORD_HASH_QUEUE are answered with 503 at once,
+and the reads of users already logged in are not starved.
+
+    python -m benchmarks.login_storm --logins 32 --queue 16
+    python -m benchmarks.login_storm --logins 32 --queue 4
+"""
+import argparse
+import threading
+import time
+from werkzeug.security import generate_password_hash
+from app import db
+from app.models import User
+from .common import benchmark_app, percentile
+
+def storm(app, probe, logins):
+    """
+    Sends logins concurrent logins while probe reads /sleep_data, and returns what happened.
+    """
+    codes, latencies, probes = [], [], []
+    stop = threading.Event()
+
+    def login(i):
+        client = app.test_client()
+        start = time.perf_counter()
+        response = client.post('/auth/login', data={'email': f'user{i}@example.com', 'password': 'secret1'})
+        latencies.append(time.perf_counter() - start)
+        codes.append(response.status_code)
+
+    def read():
+        while not stop.is_set():
+            start = time.perf_counter()
+            probe.get('/sleep_data', headers={'Accept': 'application/json'})
+            probes.append(time.perf_counter() - start)
+            time.sleep(0.01)
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    threads = [threading.Thread(target=login, args=(i,)) for i in range(logins)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    reader.join()
+    return {
+        'elapsed': elapsed,
+        'logged_in': codes.count(302),
+        'busy': codes.count(503),
+        'login_p50': percentile(latencies, 0.5),
+        'login_max': percentile(latencies, 1.0),
+        'probe_p50': percentile(probes, 0.5),
+        'probe_p99': percentile(probes, 0.99),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--logins', type=int, default=32, help='Concurrent logins per storm.')
+    parser.add_argument('--queue', type=int, default=16, help='PASSWORD_HASH_QUEUE.')
+    parser.add_argument('--workers', type=int, default=None, help='PASSWORD_HASH_WORKERS (default: CPU count).')
+    parser.add_argument('--method', default='scrypt:32768:8:1', help='PASSWORD_HASH_METHOD.')
+    parser.add_argument('--stored-method', default='pbkdf2:sha256:600000',
+                        help='Method of the stored hashes; the first storm rehashes them to --method.')
+    args = parser.parse_args()
+
+    settings = {'PASSWORD_HASH_METHOD': args.method, 'PASSWORD_HASH_QUEUE': args.queue}
+    if args.workers:
+        settings['PASSWORD_HASH_WORKERS'] = args.workers
+    app = benchmark_app(**settings)
+    with app.app_context():
+        stored = generate_password_hash('secret1', args.stored_method)
+        db.session.add_all(User(username=f'user{i}', email=f'user{i}@example.com', password=stored)
+                           for i in range(args.logins + 1))
+        db.session.commit()
+    probe = app.test_client()
+    probe.post('/auth/login', data={'email': f'user{args.logins}@example.com', 'password': 'secret1'})
+
+    print(f'{args.logins} concurrent logins, {args.method}, queue {args.queue}')
+    for label in ('first storm (rehashing)', 'second storm'):
+        result = storm(app, probe, args.logins)
+        print(f"{label}: {result['elapsed']:.2f}s, {result['logged_in']} logged in, {result['busy']} got 503; "
+              f"login p50 {result['login_p50'] * 1e3:.0f} ms, max {result['login_max'] * 1e3:.0f} ms; "
+              f"reads p50 {result['probe_p50'] * 1e3:.1f} ms, p99 {result['probe_p99'] * 1e3:.1f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Other users' write latency while a large profile is deleted.
+
+A user with many activity rows is deleted while another thread commits one activity row every
+few milliseconds for a second user. The deletion runs either as one transaction, like
+delete_profile before app.purge, or as app.purge's batched purge.
+
+    python -m benchmarks.purge_contention
+    python -m benchmarks.purge_contention --rows 100000 --batch-size 500 --pause 0.005
+"""
+import argparse
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import delete, insert
+from app import db
+from app.models import User, Activity
+from app.purge import PURGE_BATCH_SIZE, PURGE_PAUSE, purge_user, soft_delete_user
+from .common import benchmark_app, percentile
+
+def add_activity(user_id, count, batch=100000):
+    """
+    Adds count activity rows for a user, one a minute going back from now.
+    """
+    now = datetime.utcnow()
+    for start in range(0, count, batch):
+        db.session.execute(insert(Activity), [
+            {'user_id': user_id, 'date': now - timedelta(minutes=i), 'steps': i % 10000, 'distance': 1.0,
+             'calories': 50, 'type': 'walk', 'duration': 10}
+            for i in range(start, min(start + batch, count))])
+        db.session.commit()
+
+def add_user(name):
+    user = User(username=name, email=f'{name}@example.com', password='x')
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+def delete_in_one_transaction(user_id):
+    """
+    Deletes a user and their rows the way delete_profile did before the batched purge.
+    """
+    db.session.execute(delete(Activity).where(Activity.user_id == user_id))
+    db.session.execute(delete(User.__table__).where(User.id == user_id))
+    db.session.commit()
+
+def run(app, mode, rows, interval, batch_size, pause):
+    """
+    Deletes a user with rows activity rows while timing another user's writes, and returns
+    the deletion's duration and the write latencies.
+    """
+    with app.app_context():
+        victim, writer = add_user(f'victim-{mode}'), add_user(f'writer-{mode}')
+        add_activity(victim, rows)
+    latencies = []
+    stop = threading.Event()
+
+    def write():
+        with app.app_context():
+            while not stop.is_set():
+                start = time.perf_counter()
+                db.session.add(Activity(user_id=writer, steps=1, distance=0.1, calories=1, type='walk', duration=1))
+                db.session.commit()
+                latencies.append(time.perf_counter() - start)
+                time.sleep(interval)
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    time.sleep(0.2)
+    start = time.perf_counter()
+    with app.app_context():
+        if mode == 'single':
+            delete_in_one_transaction(victim)
+        else:
+            soft_delete_user(db.session.get(User, victim))
+            db.session.commit()
+            purge_user(victim, batch_size, pause)
+    elapsed = time.perf_counter() - start
+    time.sleep(0.2)
+    stop.set()
+    thread.join()
+    return elapsed, latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000, help="Activity rows of the deleted user.")
+    parser.add_argument('--interval', type=float, default=0.005, help="Seconds between the other user's writes.")
+    parser.add_argument('--batch-size', type=int, default=PURGE_BATCH_SIZE, help='PURGE_BATCH_SIZE.')
+    parser.add_argument('--pause', type=float, default=PURGE_PAUSE, help='PURGE_PAUSE.')
+    args = parser.parse_args()
+
+    app = benchmark_app()
+    print(f'deleting a user with {args.rows} activity rows; another user writes every {args.interval * 1e3:.0f} ms')
+    for mode in ('single', 'batched'):
+        elapsed, latencies = run(app, mode, args.rows, args.interval, args.batch_size, args.pause)
+        print(f'{mode:>8}: deletion {elapsed:.2f}s; {len(latencies)} writes, p50 {percentile(latencies, 0.5) * 1e3:.1f} ms, '
+              f'p99 {percentile(latencies, 0.99) * 1e3:.1f} ms, max {percentile(latencies, 1.0) * 1e3:.1f} ms')
+
+if __name__ == '__main__':
+    main()
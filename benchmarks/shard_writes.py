@@ -0,0 +1,145 @@
+"""
+Multi-process write throughput against the number of shards, and how evenly users spread.
+
+Writer processes, one user each, commit batches of log entries through the bulk entries path
+(validate_entries and save_rows) into their user's shard, with 0 (everything in the directory
+database) up to N shard files. A log write commits to its shard alone (the data version lives
+there too, see app.models.DataVersion), which the report checks through the bytes written to
+the directory's WAL during the run. Per-file write locks stop being the limit once writers are
+spread over shards, so throughput grows with shards until the CPUs run out. With the app's
+synchronous=NORMAL a commit is CPU-bound, so on a single CPU throughput stays flat and only the
+tail latency improves. --synchronous FULL makes every commit wait for an fsync; where fsync is
+slow, as on a local disk without a write cache, writers on different shards overlap those waits
+even on one CPU.
+
+The balance check places many users with rendezvous hashing and reports each shard's share,
+and the share of users that move when one more shard is added.
+
+    python -m benchmarks.shard_writes
+    python -m benchmarks.shard_writes --shards 0,2,4,8 --writers 8 --commits 200
+    python -m benchmarks.shard_writes --synchronous FULL
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+import config
+from app import db
+from app.ingest import save_rows, validate_entries
+from app.models import Shard, User
+from app.sharding import create_shard_schema, shard_engine, shard_for, use_user_shard
+from .common import benchmark_app, percentile
+
+def write(directory, user_id, commits, batch, synchronous, start, results):
+    app = benchmark_app(directory, create_schema=False,
+                        SQLITE_PRAGMAS=dict(config.TestingConfig.SQLITE_PRAGMAS, synchronous=synchronous))
+    latencies = []
+    with app.app_context():
+        use_user_shard(db.session, user_id)
+        start.wait()
+        for i in range(commits):
+            entries = [{'kind': 'sleep', 'hours': 7, 'quality': 'Good', 'date': datetime.utcnow().isoformat()}
+                       for _ in range(batch)]
+            began = time.perf_counter()
+            rows, _ = validate_entries(entries, user_id)
+            save_rows(user_id, rows)
+            latencies.append(time.perf_counter() - began)
+    results.put(latencies)
+
+def setup(shards, writers):
+    """
+    Builds a directory database with shards shard files and enough users to pick writers
+    users spread evenly over them, and returns the directory and those users' (id, shard id).
+    """
+    directory = tempfile.mkdtemp(prefix=f'healthtrack-bench-shards{shards}-')
+    app = benchmark_app(directory)
+    with app.app_context():
+        for i in range(shards):
+            db.session.add(Shard(url='sqlite:///' + os.path.join(directory, f'shard{i}.db')))
+        db.session.commit()
+        for shard in Shard.query.all():
+            create_shard_schema(shard_engine(shard.id))
+        users = [User(username=f'user{i}', email=f'user{i}@example.com', password='x')
+                 for i in range(writers * max(shards, 1) * 4)]
+        db.session.add_all(users)
+        db.session.commit()
+        by_shard = {}
+        for user in users:
+            by_shard.setdefault(user.shard_id, []).append((user.id, user.shard_id))
+        # Take users from each shard in turn, so writers spread as evenly as they can
+        placed = [group[i] for i in range(writers) for group in by_shard.values() if i < len(group)][:writers]
+        db.engine.dispose()
+    return directory, placed
+
+def wal_size(directory):
+    """
+    Returns the size of the directory database's write-ahead log, 0 if there is none.
+    """
+    path = os.path.join(directory, 'bench.db-wal')
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+def run(shards, writers, commits, batch, synchronous):
+    """
+    Returns (rows per second, commit latencies, writers per shard, bytes written to the
+    directory's WAL) for one shard count.
+    """
+    directory, placed = setup(shards, writers)
+    context = multiprocessing.get_context('spawn')
+    start, results = context.Barrier(writers + 1), context.Queue()
+    processes = [context.Process(target=write, args=(directory, user_id, commits, batch, synchronous, start, results))
+                 for user_id, _ in placed]
+    for process in processes:
+        process.start()
+    start.wait()
+    wal_before = wal_size(directory)
+    began = time.perf_counter()
+    latencies = [latency for _ in processes for latency in results.get()]
+    elapsed = time.perf_counter() - began
+    wal_written = wal_size(directory) - wal_before
+    for process in processes:
+        process.join()
+    return len(latencies) * batch / elapsed, latencies, Counter(shard_id for _, shard_id in placed), wal_written
+
+def balance(shard_count, users):
+    """
+    Returns each shard's share of users under rendezvous hashing, and the share of users
+    that move when a shard is added.
+    """
+    shard_ids = list(range(1, shard_count + 1))
+    placed = [shard_for(user_id, shard_ids) for user_id in range(1, users + 1)]
+    grown = [shard_for(user_id, shard_ids + [shard_count + 1]) for user_id in range(1, users + 1)]
+    counts = Counter(placed)
+    moved = sum(before != after for before, after in zip(placed, grown))
+    return [counts[shard_id] / users for shard_id in shard_ids], moved / users
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--shards', default='0,1,2,4', help='Shard counts to try, comma-separated.')
+    parser.add_argument('--writers', type=int, default=8, help='Writer processes, one user each.')
+    parser.add_argument('--commits', type=int, default=200, help='Commits per writer.')
+    parser.add_argument('--batch', type=int, default=50, help='Entries per commit.')
+    parser.add_argument('--synchronous', default='NORMAL', help="SQLite synchronous setting; FULL fsyncs every commit.")
+    parser.add_argument('--balance-users', type=int, default=100000, help='Users placed for the balance check.')
+    args = parser.parse_args()
+    counts = [int(count) for count in args.shards.split(',')]
+
+    print(f'{args.writers} writers, {args.commits} commits of {args.batch} entries each, '
+          f'synchronous={args.synchronous}, {os.cpu_count()} CPU(s)')
+    for shards in counts:
+        rate, latencies, spread, wal_written = run(shards, args.writers, args.commits, args.batch, args.synchronous)
+        layout = ', '.join(f'{count}' for _, count in sorted(spread.items(), key=lambda item: item[0] or 0))
+        print(f'  {shards} shard(s): {rate:7.0f} rows/s, p50 {percentile(latencies, 0.5) * 1e3:6.1f} ms, '
+              f'p99 {percentile(latencies, 0.99) * 1e3:6.1f} ms; writers per file: {layout}; '
+              f'directory WAL +{wal_written // 1024} KiB')
+
+    print(f'balance over {args.balance_users} users')
+    for shards in (count for count in counts if count > 0):
+        shares, moved = balance(shards, args.balance_users)
+        print(f'  {shards} shard(s): shares {min(shares):.3f} to {max(shares):.3f} (ideal {1 / shards:.3f}); '
+              f'adding one moves {moved:.3f} (ideal {1 / (shards + 1):.3f})')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Token vs cookie authentication: read throughput and identity reads per request.
+
+Many users each read /sleep_data in turn, once authenticated by their session cookie and once
+by an API token. Both build their identity from the user row and the user's data version, which
+the user cache (app.identity) saves on a hit. Run with --ttl 0 to see every request miss the cache.
+
+    python -m benchmarks.token_auth
+    python -m benchmarks.token_auth --users 200 --requests 5000 --ttl 0
+"""
+import argparse
+import time
+from sqlalchemy import event
+from app import db
+from app.models import User
+from app.passwords import password_hasher
+from app.tokens import issue_token
+from .common import benchmark_app, percentile
+
+def load(app, clients, requests):
+    """
+    Sends requests reads round-robin over (client, headers) pairs, and returns the
+    requests per second, the latencies and the number of statements that read the user table
+    or the data version.
+    """
+    latencies = []
+    identity_reads = 0
+
+    def count(connection, cursor, statement, parameters, context, executemany):
+        nonlocal identity_reads
+        identity_reads += 'FROM user' in statement or 'FROM data_version' in statement
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        began = time.perf_counter()
+        for i in range(requests):
+            client, headers = clients[i % len(clients)]
+            start = time.perf_counter()
+            response = client.get('/sleep_data', headers=headers)
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.status_code
+        elapsed = time.perf_counter() - began
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+    return requests / elapsed, latencies, identity_reads
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=100, help='Users reading in turn.')
+    parser.add_argument('--requests', type=int, default=3000, help='Reads per run.')
+    parser.add_argument('--ttl', type=float, default=None, help='USER_CACHE_TTL (default: the configured one).')
+    args = parser.parse_args()
+
+    settings = {'RESPONSE_CACHE_ENABLED': False}
+    if args.ttl is not None:
+        settings['USER_CACHE_TTL'] = args.ttl
+    app = benchmark_app(**settings)
+    with app.app_context():
+        stored = password_hasher.hash('secret1')
+        users = [User(username=f'user{i}', email=f'user{i}@example.com', password=stored) for i in range(args.users)]
+        db.session.add_all(users)
+        db.session.commit()
+        tokens = [issue_token(user.id, ['read'])[0] for user in users]
+
+    cookie_clients = []
+    for i in range(args.users):
+        client = app.test_client()
+        client.post('/auth/login', data={'email': f'user{i}@example.com', 'password': 'secret1'})
+        cookie_clients.append((client, {'Accept': 'application/json'}))
+    token_client = app.test_client()
+    token_clients = [(token_client, {'Accept': 'application/json', 'Authorization': f'Bearer {token}'})
+                     for token in tokens]
+
+    print(f'{args.users} users, {args.requests} reads, user cache ttl {app.config.get("USER_CACHE_TTL")}')
+    for label, clients in (('cookie', cookie_clients), ('token', token_clients)):
+        load(app, clients, len(clients))  # Warms the caches and the revocation list
+        rate, latencies, identity_reads = load(app, clients, args.requests)
+        print(f'  {label:6}: {rate:7.0f} req/s, p50 {percentile(latencies, 0.5) * 1e3:5.2f} ms, '
+              f'p99 {percentile(latencies, 0.99) * 1e3:5.2f} ms; identity reads {identity_reads / args.requests:.2f}/req')
+
+if __name__ == '__main__':
+    main()
@@ -21,6 +21,86 @@ class Config:
     CORS_HEADERS = 'Content-Type'
     # Enable Cross-Site Request Forgery (CSRF) protection
     WTF_CSRF_ENABLED = True
+    # SQLite pragmas applied to every new connection by app/sqlite.py. WAL lets readers and
+    # the single writer work at once; synchronous=NORMAL is durable in WAL mode except for the
+    # last commits on power loss; busy_timeout makes writers wait for the lock instead of failing.
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'cache_size': -16000,  # Negative values are KiB: 16 MiB of page cache per connection
+        'mmap_size': 128 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+    }
+    # Read replicas serving dashboard, chart and export reads, as comma-separated database URLs
+    SQLALCHEMY_REPLICAS = [url for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url]
+    # After writing, a user reads from the primary for this many seconds so they see their own writes
+    REPLICA_PIN_SECONDS = 5
+    # Run PRAGMA optimize on each pooled connection at most this often, in seconds (0 disables it)
+    SQLITE_OPTIMIZE_INTERVAL = 3600
+    # Cache dashboard and chart JSON per user until they write; bounded by total body size
+    RESPONSE_CACHE_ENABLED = True
+    RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+    RESPONSE_CACHE_TTL = 300
+    # Expose the cache counters at /cache_stats
+    RESPONSE_CACHE_STATS = False
+    # Identity columns and data versions of logged-in users are cached per worker for
+    # USER_CACHE_TTL seconds, so authenticated requests skip loading the user row; other workers
+    # see changes once their entry expires. Keep it at most REPLICA_PIN_SECONDS: users pinned
+    # after a write re-read their data version, so they always see their own writes.
+    USER_CACHE_MAX_ENTRIES = 10000
+    USER_CACHE_TTL = 5
+    # Werkzeug method for new password hashes. Stored hashes with other parameters are replaced
+    # at the next successful login; `manage.py calibrate_password_hash` suggests a cost for this machine
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    # Password checks run on a pool of PASSWORD_HASH_WORKERS threads per process. The request
+    # still waits for its check; logins beyond PASSWORD_HASH_QUEUE waiting ones are answered
+    # with 503 at once instead of queuing (`python -m benchmarks.login_storm` shows the effect)
+    PASSWORD_HASH_WORKERS = os.cpu_count() or 1
+    PASSWORD_HASH_QUEUE = 16
+    # API tokens (`POST /auth/tokens`) are valid for at most API_TOKEN_LIFETIME seconds; revoked
+    # ones are rejected by other workers once they reload the revocation list
+    API_TOKEN_LIFETIME = 30 * 24 * 3600
+    API_TOKEN_REVOCATION_REFRESH = 30
+    # Token-bucket limits on logins and writes, per endpoint or blueprint: (key, requests, seconds)
+    # allows bursts of `requests` and refills at requests/seconds. Keys are the client 'ip', the
+    # logged-in 'user', or the 'account' a login names. A blueprint's limits are one budget shared
+    # by all of its endpoints, on top of each endpoint's own. GET requests are never limited.
+    RATE_LIMIT_ENABLED = True
+    RATE_LIMITS = {
+        'auth.login': [('ip', 20, 60), ('account', 10, 300)],
+        'auth.register': [('ip', 10, 3600)],
+        'auth.create_token': [('ip', 20, 60), ('account', 10, 300)],
+        'main.create_user': [('ip', 10, 3600)],
+        'main.bulk_entries': [('user', 30, 60)],
+        'main.create_import': [('user', 10, 3600)],
+        'main': [('ip', 120, 60), ('user', 60, 60)],
+    }
+    # 'memory' counts per worker process; 'sqlite' shares the buckets between the workers on a
+    # host through RATE_LIMIT_DATABASE (default instance/ratelimit.db)
+    RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+    RATE_LIMIT_DATABASE = os.environ.get('RATE_LIMIT_DATABASE')
+    # Each worker keeps a Bloom filter of taken usernames and emails, so most free names are
+    # confirmed without a query; it is sized for NAME_FILTER_CAPACITY names at this false positive rate
+    NAME_FILTER_CAPACITY = 100000
+    NAME_FILTER_ERROR_RATE = 0.01
+    # Largest batch accepted by the bulk entries endpoint
+    BULK_MAX_ENTRIES = 10000
+    # Uploaded CSV/NDJSON imports are stored here and committed IMPORT_CHUNK_SIZE records at a time
+    IMPORT_FOLDER = os.path.join(instance_dir, 'imports')
+    IMPORT_CHUNK_SIZE = 5000
+    # Run uploaded imports in a background thread instead of during the request
+    IMPORT_IN_BACKGROUND = True
+    # Deleted profiles are purged PURGE_BATCH_SIZE rows per transaction, pausing PURGE_PAUSE seconds in between
+    PURGE_BATCH_SIZE = 1000
+    PURGE_PAUSE = 0.01
+    PURGE_IN_BACKGROUND = True
+    # Months of log entries kept in the log tables themselves; `manage.py partition_logs` moves older ones out
+    PARTITION_HOT_MONTHS = 2
+    # Attach <database>-archive.db to every connection; `manage.py archive_logs` moves partitions
+    # older than ARCHIVE_AFTER_MONTHS there, out of the live database and its page cache
+    SQLITE_ARCHIVE = True
+    ARCHIVE_AFTER_MONTHS = 12
 
     @staticmethod
     def init_app(app):
@@ -31,6 +111,8 @@ class DevelopmentConfig(Config):
     """Development configuration."""
     # Enable debugging mode in development
     DEBUG = True
+    # Expose the cache counters at /cache_stats
+    RESPONSE_CACHE_STATS = True
 
 class TestingConfig(Config):
     """Testing configuration."""
@@ -40,11 +122,25 @@ class TestingConfig(Config):
     SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(instance_dir, 'test_health_tracker.db')
     # Disable CSRF protection in testing
     WTF_CSRF_ENABLED = False
+    # Tests log in and write far more often than any user
+    RATE_LIMIT_ENABLED = False
+    # Cheap password hashes keep tests fast
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'
+    # Run uploaded imports during the request so tests can check the result
+    IMPORT_IN_BACKGROUND = False
+    # Purge deleted profiles during the request so tests can check the result
+    PURGE_IN_BACKGROUND = False
 
 class ProductionConfig(Config):
     """Production configuration."""
     # Disable debugging mode in production
     DEBUG = False
+    # Larger page cache and memory map for the production database
+    SQLITE_PRAGMAS = dict(
+        Config.SQLITE_PRAGMAS,
+        cache_size=-64000,
+        mmap_size=int(os.environ.get('SQLITE_MMAP_SIZE', 512 * 1024 * 1024)),
+    )
 
 # Dictionary to map configuration names to configuration classes
 config = {
@@ -1,3 +1,6 @@
+import sys
+import click
+from flask import current_app
 from flask.cli import FlaskGroup
 from app import create_app, db
 
@@ -30,5 +33,339 @@ def drop_db():
         db.session.commit()  # Commit the changes to the database
         print("Database tables dropped successfully.")
 
+@cli.command("check_query_plans")
+def check_query_plans():
+    """
+    CLI command to verify that every hot query is served by an index.
+    Exits with a non-zero status if any of them falls back to a full table scan.
+    """
+    from app.queryplan import check_query_plans as run_checks
+
+    with create_my_app().app_context():
+        plans, failures = run_checks()
+        for name, plan in plans.items():
+            status = "FAIL" if name in failures else "ok"
+            print(f"[{status}] {name}: {'; '.join(plan)}")
+        if failures:
+            print(f"{len(failures)} query plan(s) do not use an index.")
+            sys.exit(1)
+        print("All hot queries use an index.")
+
+@cli.command("rebuild_rollup")
+@click.option("--check", is_flag=True, help="Only report drift between the rollup and the log tables.")
+@click.option("--user-id", type=int, default=None, help="Limit to a single user.")
+def rebuild_rollup(check, user_id):
+    """
+    CLI command to rebuild the daily_summary rollup from the log tables, or check it for drift.
+    """
+    from app import rollup
+    from app.sharding import select_shard, shard_locations, use_user_shard
+
+    with create_my_app().app_context():
+        if user_id is not None:
+            use_user_shard(db.session, user_id)
+            locations = [db.session.info["shard"]]
+        else:
+            locations = shard_locations()
+        if check:
+            drift = []
+            for shard_id in locations:
+                select_shard(db.session, shard_id)
+                drift.extend(rollup.find_drift(user_id))
+            for drift_user, day, column, stored, expected in drift:
+                print(f"user {drift_user} {day} {column}: stored {stored}, expected {expected}")
+            if drift:
+                print(f"{len(drift)} rollup value(s) drifted from the log tables.")
+                sys.exit(1)
+            print("Rollup matches the log tables.")
+        else:
+            rows = 0
+            for shard_id in locations:
+                select_shard(db.session, shard_id)
+                rows += rollup.rebuild(user_id)
+            print(f"Rollup rebuilt: {rows} daily summaries written.")
+
+@cli.command("import_entries")
+@click.argument("path", required=False)
+@click.option("--user-id", type=int, default=None, help="User to import the entries for.")
+@click.option("--format", "fmt", type=click.Choice(["csv", "ndjson"]), default=None,
+              help="File format; guessed from the file name when omitted.")
+@click.option("--kind", type=click.Choice(["activity", "nutrition", "sleep", "mood"]), default=None,
+              help="Kind of the records that have no 'kind' field.")
+@click.option("--chunk-size", type=int, default=None, help="Records per commit (default IMPORT_CHUNK_SIZE).")
+@click.option("--resume", "job_id", type=int, default=None, help="Resume an interrupted import job.")
+def import_entries(path, user_id, fmt, kind, chunk_size, job_id):
+    """
+    CLI command to import a CSV or NDJSON file of log entries, committing in chunks.
+    An interrupted import continues from its last committed chunk with --resume JOB_ID --user-id USER_ID.
+    """
+    from app.importer import ImportFormatError, create_job, run_import
+    from app.models import ImportJob
+    from app.sharding import use_user_shard
+
+    app = create_my_app()
+    with app.app_context():
+        if user_id is None:
+            print("--user-id is required.")
+            sys.exit(1)
+        use_user_shard(db.session, user_id)  # Import jobs live on the user's shard
+        if job_id is not None:
+            job = db.session.get(ImportJob, job_id)
+            if job is None or job.user_id != user_id:
+                print(f"Import job {job_id} not found for user {user_id}.")
+                sys.exit(1)
+            if job.status == "done":
+                print(f"Import job {job_id} is already done.")
+                return
+        else:
+            if path is None:
+                print("PATH is required unless --resume is given.")
+                sys.exit(1)
+            try:
+                job = create_job(user_id, path, fmt, kind)
+            except ImportFormatError as e:
+                print(e)
+                sys.exit(1)
+            print(f"Import job {job.id} created.")
+
+        def progress(job):
+            print(f"  {job.rows_read} records read, {job.rows_imported} imported, {job.rows_rejected} rejected")
+
+        job = run_import(job, chunk_size or app.config.get("IMPORT_CHUNK_SIZE", 5000), progress)
+        print(f"Import job {job.id} {job.status}: {job.rows_imported} imported, {job.rows_rejected} rejected.")
+        if job.status != "done":
+            sys.exit(1)
+
+@cli.command("export_entries")
+@click.option("--user-id", type=int, required=True, help="User whose entries to export.")
+@click.option("--format", "fmt", type=click.Choice(["csv", "ndjson", "zip"]), default="zip", show_default=True)
+@click.option("--kind", default=None, help="Comma-separated entry kinds; every kind when omitted.")
+@click.option("--output", type=click.Path(dir_okay=False, allow_dash=True), default="-",
+              help="File to write; standard output by default.")
+def export_entries(user_id, fmt, kind, output):
+    """
+    CLI command to export a user's entries as CSV, NDJSON or a zip bundle, streamed in constant memory.
+    """
+    from app.exporter import ExportError, parse_kinds, export_chunks
+    from app.sharding import use_user_shard
+
+    with create_my_app().app_context():
+        use_user_shard(db.session, user_id)
+        try:
+            kinds = parse_kinds(kind)
+            chunks = export_chunks(fmt, kinds, user_id)
+        except ExportError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+        with click.open_file(output, "wb") as stream:
+            for chunk in chunks:
+                stream.write(chunk if isinstance(chunk, bytes) else chunk.encode("utf-8"))
+
+@cli.command("purge_deleted_users")
+@click.option("--batch-size", type=int, default=None, help="Rows per transaction (default PURGE_BATCH_SIZE).")
+def purge_deleted_users(batch_size):
+    """
+    CLI command to finish purging deleted profiles, e.g. after a restart interrupted a background purge.
+    """
+    from app.purge import pending_purges, purge_user
+
+    app = create_my_app()
+    with app.app_context():
+        batch_size = batch_size or app.config.get("PURGE_BATCH_SIZE", 1000)
+        pause = app.config.get("PURGE_PAUSE", 0.01)
+        user_ids = pending_purges()
+        for user_id in user_ids:
+            rows = purge_user(user_id, batch_size, pause)
+            print(f"User {user_id} purged: {rows} rows deleted.")
+        print(f"{len(user_ids)} deleted profile(s) purged.")
+
+@cli.command("sync_replicas")
+def sync_replicas():
+    """
+    CLI command to refresh SQLite read replicas with a consistent copy of the primary database,
+    so replica routing can be tried locally with file copies standing in for real replicas.
+    """
+    import os
+    import sqlite3
+    from app.routing import replica_engines
+    from app.sqlite import archive_path
+
+    app = create_my_app()
+    with app.app_context():
+        engines = replica_engines(db)
+        if not engines:
+            print("No read replicas configured; set DATABASE_REPLICA_URLS.")
+            sys.exit(1)
+        if db.engine.dialect.name != "sqlite" or any(e.dialect.name != "sqlite" for e in engines):
+            print("sync_replicas only copies SQLite databases.")
+            sys.exit(1)
+        databases = [(db.engine.url.database, [engine.url.database for engine in engines])]
+        if app.config.get("SQLITE_ARCHIVE") and os.path.exists(archive_path(db.engine.url.database)):
+            databases.append((archive_path(db.engine.url.database),
+                              [archive_path(engine.url.database) for engine in engines]))
+        # The primary before its archive: partitions reach the archive before the primary points at them
+        for path, targets in databases:
+            source = sqlite3.connect(path)
+            for target_path in targets:
+                target = sqlite3.connect(target_path)
+                source.backup(target)  # Online backup: a consistent snapshot even while the app writes
+                target.close()
+                print(f"Replica {target_path} synced.")
+            source.close()
+
+@cli.command("partition_logs")
+@click.option("--hot-months", type=int, default=None, help="Months kept in the log tables (default PARTITION_HOT_MONTHS).")
+@click.option("--compact", "compact_month", default=None, metavar="YYYY-MM",
+              help="Rebuild the sealed partitions of a month instead, e.g. after large purges.")
+def partition_logs(hot_months, compact_month):
+    """
+    CLI command to move log rows older than the hot window into sealed monthly partitions,
+    in the directory database and on every shard. Meant to run once a month, e.g. from cron.
+    """
+    from datetime import datetime
+    from app.partitions import PARTITIONED_MODELS, compact_partition, partition_model, sealed_partitions
+    from app.sharding import create_shard_schema, select_shard, shard_engine, shard_locations
+
+    app = create_my_app()
+    with app.app_context():
+        if hot_months is None:
+            hot_months = app.config["PARTITION_HOT_MONTHS"]
+        if hot_months < 0:
+            print("--hot-months cannot be negative.")
+            sys.exit(1)
+        month = datetime.strptime(compact_month, "%Y-%m").date() if compact_month else None
+        for shard_id in shard_locations():
+            select_shard(db.session, shard_id)
+            location = "directory" if shard_id is None else f"shard {shard_id}"
+            if shard_id is not None:
+                create_shard_schema(shard_engine(shard_id))  # Adds the partition catalog to shards created before it
+            for model in PARTITIONED_MODELS:
+                if month is not None:
+                    if (month, False) in sealed_partitions(model, month, month):
+                        rows = compact_partition(model, month)
+                        print(f"{location}: {model.__tablename__} {month:%Y-%m} compacted, {rows} rows.")
+                    continue
+                for sealed, rows in partition_model(model, hot_months).items():
+                    print(f"{location}: {model.__tablename__} {sealed:%Y-%m} sealed, {rows} rows moved.")
+
+@cli.command("archive_logs")
+@click.option("--after-months", type=int, default=None, help="Archive months older than this (default ARCHIVE_AFTER_MONTHS).")
+@click.option("--vacuum", is_flag=True, help="VACUUM the live and archive databases afterwards to give the space back.")
+def archive_logs(after_months, vacuum):
+    """
+    CLI command to move sealed log partitions older than ARCHIVE_AFTER_MONTHS into the archive
+    database next to each database file, in the directory database and on every shard.
+    Months not partitioned yet are sealed first.
+    """
+    from app.partitions import PARTITIONED_MODELS, archive_model, partition_model
+    from app.sharding import create_shard_schema, select_shard, shard_engine, shard_locations
+    from app.sqlite import ARCHIVE_SCHEMA
+
+    app = create_my_app()
+    with app.app_context():
+        if not app.config.get("SQLITE_ARCHIVE"):
+            print("SQLITE_ARCHIVE is off; there is no archive database to move partitions to.")
+            sys.exit(1)
+        if after_months is None:
+            after_months = app.config["ARCHIVE_AFTER_MONTHS"]
+        if after_months < 0:
+            print("--after-months cannot be negative.")
+            sys.exit(1)
+        hot_months = app.config["PARTITION_HOT_MONTHS"]
+        for shard_id in shard_locations():
+            select_shard(db.session, shard_id)
+            location = "directory" if shard_id is None else f"shard {shard_id}"
+            engine = shard_engine(shard_id)
+            if shard_id is not None:
+                create_shard_schema(engine)
+            for model in PARTITIONED_MODELS:
+                partition_model(model, hot_months)
+                for month, rows in archive_model(model, after_months).items():
+                    print(f"{location}: {model.__tablename__} {month:%Y-%m} archived, {rows} rows.")
+            if vacuum:
+                db.session.close()
+                with engine.connect() as connection:
+                    for schema in ("main", ARCHIVE_SCHEMA):
+                        connection.exec_driver_sql(f"VACUUM {schema}")
+                print(f"{location}: vacuumed.")
+
+@cli.command("add_shard")
+@click.argument("url")
+def add_shard(url):
+    """
+    CLI command to register a new shard database and create the per-user tables in it.
+    New users are placed on it straight away; run rebalance_shards to move existing users.
+    """
+    from sqlalchemy import create_engine
+    from app.models import Shard
+    from app.sharding import create_shard_schema
+
+    with create_my_app().app_context():
+        if Shard.query.filter_by(url=url).first():
+            print(f"Shard {url} is already registered.")
+            sys.exit(1)
+        engine = create_engine(url)
+        create_shard_schema(engine)
+        engine.dispose()
+        shard = Shard(url=url)
+        db.session.add(shard)
+        db.session.commit()
+        print(f"Shard {shard.id} added: {url}")
+
+@cli.command("rebalance_shards")
+@click.option("--batch-size", type=int, default=None, help="Rows per transaction (default REBALANCE_BATCH_SIZE).")
+@click.option("--grace", type=float, default=None, help="Seconds to let in-flight requests finish (default REBALANCE_GRACE).")
+@click.option("--dry-run", is_flag=True, help="Only list the users that would move.")
+def rebalance_shards(batch_size, grace, dry_run):
+    """
+    CLI command to move users onto the shard rendezvous hashing picks for them, e.g. after add_shard.
+    Users keep using the app while they are moved; ones with a running import are skipped.
+    Moves an earlier run left unfinished are finished first.
+    """
+    from app.rebalance import (REBALANCE_BATCH_SIZE, REBALANCE_GRACE, has_running_import, misplaced_users,
+                               move_user, unfinished_moves)
+
+    with create_my_app().app_context():
+        batch_size = batch_size or REBALANCE_BATCH_SIZE
+        grace = REBALANCE_GRACE if grace is None else grace
+        for user_id, source, target in unfinished_moves():
+            if dry_run:
+                print(f"User {user_id}: unfinished move from shard {source} to {target}")
+                continue
+            rows = move_user(user_id, target, batch_size, grace)
+            print(f"User {user_id}: finished moving from shard {source} to {target}: {rows} rows copied.")
+        moves = misplaced_users()
+        moved = 0
+        for user_id, source, target in moves:
+            if dry_run:
+                print(f"User {user_id}: shard {source} -> {target}")
+                continue
+            if has_running_import(user_id, source):
+                print(f"User {user_id} skipped: an import is running.")
+                continue
+            rows = move_user(user_id, target, batch_size, grace)
+            moved += 1
+            print(f"User {user_id} moved from shard {source} to {target}: {rows} rows copied.")
+        print(f"{len(moves) if dry_run else moved} of {len(moves)} misplaced user(s) {'to move' if dry_run else 'moved'}.")
+
+@cli.command("calibrate_password_hash")
+@click.option("--target-ms", type=float, default=100.0, help="Wanted time per password check, in milliseconds.")
+@click.option("--family", type=click.Choice(["scrypt", "pbkdf2"]), default="scrypt", help="Hash family to calibrate.")
+def calibrate_password_hash(target_ms, family):
+    """
+    CLI command to measure password hashing on this machine and suggest a PASSWORD_HASH_METHOD
+    whose checks take about --target-ms. Stored hashes are upgraded as users log in.
+    """
+    from app.passwords import calibrate
+
+    with create_my_app().app_context():
+        current = current_app.config.get("PASSWORD_HASH_METHOD")
+        method, elapsed = calibrate(family, target_ms / 1000)
+        workers = current_app.config.get("PASSWORD_HASH_WORKERS", 1)
+        print(f"Current method: {current}")
+        print(f"Suggested method: {method} ({elapsed * 1000:.1f} ms per check, "
+              f"about {workers / elapsed:.0f} logins/s per process with {workers} hashing thread(s))")
+        print(f"Set PASSWORD_HASH_METHOD={method} to use it.")
+
 if __name__ == "__main__":
     cli()  # Run the Flask CLI
@@ -0,0 +1,39 @@
+"""Add revoked_user
+
+Revision ID: 1f7a3c9e5d82
+Revises: 8c4b2e6d0f19
+Create Date: 2024-07-29 09:26:44.871530
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1f7a3c9e5d82'
+down_revision = '8c4b2e6d0f19'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('revoked_user',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('revoked_at', sa.DateTime(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    with op.batch_alter_table('revoked_user', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_revoked_user_expires_at'), ['expires_at'], unique=False)
+    # Users deleted before this migration are still being purged; refuse their tokens too
+    op.execute(
+        "INSERT INTO revoked_user (user_id, revoked_at, expires_at) "
+        "SELECT id, deleted_at, datetime(deleted_at, '+30 days') FROM user WHERE deleted_at IS NOT NULL"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('revoked_user', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_revoked_user_expires_at'))
+
+    op.drop_table('revoked_user')
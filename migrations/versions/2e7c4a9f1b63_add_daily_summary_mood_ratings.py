@@ -0,0 +1,66 @@
+"""Add per-rating mood counts to daily_summary
+
+Revision ID: 2e7c4a9f1b63
+Revises: 9f4a6b2d8c15
+Create Date: 2024-07-24 11:02:37.184590
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2e7c4a9f1b63'
+down_revision = '9f4a6b2d8c15'
+branch_labels = None
+depends_on = None
+
+RATINGS = range(1, 11)
+ARCHIVE_SCHEMA = 'archive'
+
+
+def _mood_tables(bind):
+    # mood is created by `manage.py create_db` rather than by a migration, so it may be
+    # missing; its sealed partitions are listed in log_partition, archived ones in the
+    # archive database, which is attached when SQLITE_ARCHIVE is set
+    if 'mood' not in sa.inspect(bind).get_table_names():
+        return []
+    attached = {row[1] for row in bind.execute(sa.text('PRAGMA database_list'))}
+    tables = ['mood']
+    partitions = bind.execute(sa.text(
+        "SELECT month, archived_at IS NOT NULL FROM log_partition WHERE parent = 'mood'"
+    )).all()
+    for month, archived in partitions:
+        name = f"mood_{str(month)[:7].replace('-', '_')}"
+        if archived:
+            if ARCHIVE_SCHEMA not in attached:
+                raise RuntimeError(f'{name} lives in the archive database; set SQLITE_ARCHIVE to attach it')
+            name = f'{ARCHIVE_SCHEMA}.{name}'
+        tables.append(name)
+    return tables
+
+
+def _backfill(bind):
+    tables = _mood_tables(bind)
+    if not tables:
+        return
+    # Each table is counted on its own, so every lookup seeks its (user_id, date) index on user_id
+    def count(table, rating):
+        return (f'(SELECT count(*) FROM {table} WHERE rating = {rating} '
+                f'AND user_id = daily_summary.user_id AND date(date) = daily_summary.day)')
+    counts = ', '.join(f'mood_rating_{rating} = {" + ".join(count(table, rating) for table in tables)}'
+                       for rating in RATINGS)
+    op.execute(f'UPDATE daily_summary SET {counts} WHERE mood_count > 0')
+
+
+def upgrade():
+    with op.batch_alter_table('daily_summary') as batch_op:
+        for rating in RATINGS:
+            batch_op.add_column(sa.Column(f'mood_rating_{rating}', sa.Integer(), nullable=False, server_default='0'))
+    _backfill(op.get_bind())
+
+
+def downgrade():
+    with op.batch_alter_table('daily_summary') as batch_op:
+        for rating in RATINGS:
+            batch_op.drop_column(f'mood_rating_{rating}')
@@ -0,0 +1,39 @@
+"""Add (user_id, date) indexes to log tables
+
+Revision ID: 3c1f9a2b7d40
+Revises: 8249a1e7ec5f
+Create Date: 2024-06-20 10:12:41.218734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c1f9a2b7d40'
+down_revision = '8249a1e7ec5f'
+branch_labels = None
+depends_on = None
+
+LOG_TABLES = ('activity', 'nutrition', 'sleep', 'mood')
+
+
+def _existing_tables():
+    # nutrition, sleep and mood are created by `manage.py create_db` rather than
+    # by a migration, so only index the tables this database actually has.
+    return set(sa.inspect(op.get_bind()).get_table_names())
+
+
+def upgrade():
+    existing = _existing_tables()
+    for table in LOG_TABLES:
+        if table in existing:
+            op.create_index(f'ix_{table}_user_id_date', table, ['user_id', 'date'],
+                            unique=False, if_not_exists=True)
+
+
+def downgrade():
+    existing = _existing_tables()
+    for table in LOG_TABLES:
+        if table in existing:
+            op.drop_index(f'ix_{table}_user_id_date', table_name=table, if_exists=True)
@@ -0,0 +1,36 @@
+"""Add shard and user.shard_id
+
+Revision ID: 4b2d8e6f1a93
+Revises: e93b7a4c1d06
+Create Date: 2024-07-04 16:48:12.305871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b2d8e6f1a93'
+down_revision = 'e93b7a4c1d06'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('shard',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('url', sa.String(length=255), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('url')
+    )
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.add_column(sa.Column('shard_id', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_user_shard_id'), ['shard_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_shard_id'))
+        batch_op.drop_column('shard_id')
+    op.drop_table('shard')
@@ -0,0 +1,26 @@
+"""Add user.data_version
+
+Revision ID: 5e8b0c4d9a21
+Revises: a7d2e5c3f918
+Create Date: 2024-06-27 09:48:15.902417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e8b0c4d9a21'
+down_revision = 'a7d2e5c3f918'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.add_column(sa.Column('data_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.drop_column('data_version')
@@ -0,0 +1,45 @@
+"""Move the data version from user to a data_version table on each shard
+
+Revision ID: 6d8e1f3a5b27
+Revises: 2e7c4a9f1b63
+Create Date: 2024-07-26 10:14:52.306118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6d8e1f3a5b27'
+down_revision = '2e7c4a9f1b63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('data_version',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    # Only users whose data is in this database keep their version; shards get the table the
+    # next time the app opens them, and their users' versions restart there. ETags carry the
+    # shard id from now on, so no tag handed out before this migration can match again.
+    op.execute(
+        'INSERT INTO data_version (user_id, version) '
+        'SELECT id, data_version FROM user WHERE shard_id IS NULL AND data_version > 0'
+    )
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.drop_column('data_version')
+
+
+def downgrade():
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.add_column(sa.Column('data_version', sa.Integer(), nullable=False, server_default='0'))
+    op.execute(
+        'UPDATE user SET data_version = '
+        '(SELECT version FROM data_version WHERE data_version.user_id = user.id) '
+        'WHERE id IN (SELECT user_id FROM data_version)'
+    )
+    op.drop_table('data_version')
@@ -0,0 +1,98 @@
+"""Add log_partition and split activity into monthly partitions
+
+Revision ID: 7d3a9c51e2b8
+Revises: 4b2d8e6f1a93
+Create Date: 2024-07-09 11:36:05.184420
+
+Only activity, by far the largest log table, is split here. Nutrition, sleep and mood are
+split by `python manage.py partition_logs`, which also seals later months of all four tables
+and partitions the shard databases, which Alembic does not migrate.
+
+"""
+from datetime import datetime
+from alembic import op
+from flask import current_app
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d3a9c51e2b8'
+down_revision = '4b2d8e6f1a93'
+branch_labels = None
+depends_on = None
+
+COLUMNS = 'id, user_id, date, steps, distance, calories, type, duration'
+
+
+def _cutoff():
+    # Months left in the activity table count the current one, as in `manage.py partition_logs`
+    hot_months = current_app.config['PARTITION_HOT_MONTHS']
+    now = datetime.utcnow()
+    index = now.year * 12 + now.month - 1 - (hot_months - 1)
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def _next_month(month):
+    return datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def upgrade():
+    op.create_table('log_partition',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('parent', sa.String(length=50), nullable=False),
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('rows', sa.Integer(), nullable=False),
+    sa.Column('sealed_at', sa.DateTime(), nullable=False),
+    sa.Column('compacted_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('parent', 'month')
+    )
+
+    bind = op.get_bind()
+    # A throwaway date index turns each month's copy and delete into a range seek
+    op.create_index('ix_activity_date_split', 'activity', ['date'], unique=False)
+    months = bind.execute(sa.text(
+        "SELECT DISTINCT strftime('%Y-%m-01', date) FROM activity WHERE date < :cutoff"
+    ), {'cutoff': str(_cutoff())}).scalars().all()
+    for value in sorted(months):
+        month = datetime.strptime(value, '%Y-%m-%d')
+        name = f'activity_{month:%Y_%m}'
+        bounds = {'start': str(month), 'end': str(_next_month(month))}
+        op.create_table(name,
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('date', sa.DateTime(), nullable=False),
+        sa.Column('steps', sa.Integer(), nullable=False),
+        sa.Column('distance', sa.Float(), nullable=False),
+        sa.Column('calories', sa.Integer(), nullable=False),
+        sa.Column('type', sa.String(length=50), nullable=False),
+        sa.Column('duration', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index(f'ix_{name}_user_id_date', name, ['user_id', 'date'], unique=False)
+        rows = bind.execute(sa.text(
+            f'INSERT INTO {name} ({COLUMNS}) SELECT {COLUMNS} FROM activity '
+            'WHERE date >= :start AND date < :end ORDER BY user_id, date'
+        ), bounds).rowcount
+        bind.execute(sa.text('DELETE FROM activity WHERE date >= :start AND date < :end'), bounds)
+        for event in ('INSERT', 'UPDATE'):
+            op.execute(
+                f"CREATE TRIGGER {name}_sealed_{event.lower()} BEFORE {event} ON {name} "
+                f"BEGIN SELECT RAISE(ABORT, '{name} is a sealed partition'); END"
+            )
+        bind.execute(sa.text(
+            "INSERT INTO log_partition (parent, month, rows, sealed_at) VALUES ('activity', :month, :rows, :now)"
+        ), {'month': str(month.date()), 'rows': rows, 'now': str(datetime.utcnow())})
+    op.drop_index('ix_activity_date_split', table_name='activity')
+
+
+def downgrade():
+    bind = op.get_bind()
+    months = bind.execute(sa.text(
+        "SELECT month FROM log_partition WHERE parent = 'activity'"
+    )).scalars().all()
+    for value in months:
+        name = f"activity_{value[:7].replace('-', '_')}"
+        op.execute(f'INSERT INTO activity ({COLUMNS}) SELECT {COLUMNS} FROM {name}')
+        op.drop_table(name)
+    op.drop_table('log_partition')
@@ -0,0 +1,33 @@
+"""Add shard_move
+
+Revision ID: 8c4b2e6d0f19
+Revises: 6d8e1f3a5b27
+Create Date: 2024-07-26 16:41:09.528374
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c4b2e6d0f19'
+down_revision = '6d8e1f3a5b27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('shard_move',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('source', sa.Integer(), nullable=True),
+    sa.Column('target', sa.Integer(), nullable=True),
+    sa.Column('marks', sa.Text(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=False),
+    sa.Column('switched_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('shard_move')
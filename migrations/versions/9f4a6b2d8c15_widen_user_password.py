@@ -0,0 +1,28 @@
+"""Widen user.password for scrypt hashes
+
+Revision ID: 9f4a6b2d8c15
+Revises: 5c2e7f0a9d41
+Create Date: 2024-07-23 10:14:52.630184
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9f4a6b2d8c15'
+down_revision = '5c2e7f0a9d41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.alter_column('password', existing_type=sa.String(length=128),
+                              type_=sa.String(length=255), existing_nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.alter_column('password', existing_type=sa.String(length=255),
+                              type_=sa.String(length=128), existing_nullable=False)
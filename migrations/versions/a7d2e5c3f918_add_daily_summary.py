@@ -0,0 +1,88 @@
+"""Add daily_summary rollup table
+
+Revision ID: a7d2e5c3f918
+Revises: 3c1f9a2b7d40
+Create Date: 2024-06-24 14:37:02.551093
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d2e5c3f918'
+down_revision = '3c1f9a2b7d40'
+branch_labels = None
+depends_on = None
+
+# For each log table, the daily_summary columns it feeds and the log column they total;
+# None counts entries. A copy of app.rollup.ROLLUP_COLUMNS as of this revision.
+ROLLUP_SOURCES = {
+    'activity': {'steps': 'steps', 'distance': 'distance', 'activity_calories': 'calories',
+                 'duration': 'duration', 'activity_count': None},
+    'nutrition': {'nutrition_calories': 'calories', 'protein': 'protein', 'carbs': 'carbs',
+                  'fats': 'fats', 'nutrition_count': None},
+    'sleep': {'sleep_hours': 'hours', 'sleep_count': None},
+    'mood': {'mood_sum': 'rating', 'mood_count': None},
+}
+SUMMARY_COLUMNS = [column for sources in ROLLUP_SOURCES.values() for column in sources]
+
+
+def _existing_tables():
+    # nutrition, sleep and mood are created by `manage.py create_db` rather than
+    # by a migration, so only read the tables this database actually has.
+    return set(sa.inspect(op.get_bind()).get_table_names())
+
+
+def _backfill(existing):
+    # One pass over each log table: every row becomes a day's worth of totals,
+    # and summing them per (user_id, day) gives the rollup
+    arms = []
+    for table, sources in ROLLUP_SOURCES.items():
+        if table not in existing:
+            continue
+        values = []
+        for column in SUMMARY_COLUMNS:
+            if column not in sources:
+                value = '0'
+            elif sources[column] is None:
+                value = '1'
+            else:
+                value = sources[column]
+            values.append(f'{value} AS {column}')
+        arms.append(f'SELECT user_id, date(date) AS day, {", ".join(values)} FROM {table}')
+    if not arms:
+        return
+    totals = ', '.join(f'COALESCE(SUM({column}), 0)' for column in SUMMARY_COLUMNS)
+    op.execute(
+        f'INSERT INTO daily_summary (user_id, day, {", ".join(SUMMARY_COLUMNS)}) '
+        f'SELECT user_id, day, {totals} FROM ({" UNION ALL ".join(arms)}) GROUP BY user_id, day'
+    )
+
+
+def upgrade():
+    op.create_table('daily_summary',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('steps', sa.Integer(), nullable=False),
+    sa.Column('distance', sa.Float(), nullable=False),
+    sa.Column('activity_calories', sa.Integer(), nullable=False),
+    sa.Column('duration', sa.Integer(), nullable=False),
+    sa.Column('activity_count', sa.Integer(), nullable=False),
+    sa.Column('nutrition_calories', sa.Integer(), nullable=False),
+    sa.Column('protein', sa.Float(), nullable=False),
+    sa.Column('carbs', sa.Float(), nullable=False),
+    sa.Column('fats', sa.Float(), nullable=False),
+    sa.Column('nutrition_count', sa.Integer(), nullable=False),
+    sa.Column('sleep_hours', sa.Float(), nullable=False),
+    sa.Column('sleep_count', sa.Integer(), nullable=False),
+    sa.Column('mood_sum', sa.Integer(), nullable=False),
+    sa.Column('mood_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'day')
+    )
+    _backfill(_existing_tables())
+
+
+def downgrade():
+    op.drop_table('daily_summary')
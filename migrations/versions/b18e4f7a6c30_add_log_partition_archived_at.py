@@ -0,0 +1,31 @@
+"""Add log_partition.archived_at
+
+Revision ID: b18e4f7a6c30
+Revises: 7d3a9c51e2b8
+Create Date: 2024-07-12 09:14:52.661307
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b18e4f7a6c30'
+down_revision = '7d3a9c51e2b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('log_partition') as batch_op:
+        batch_op.add_column(sa.Column('archived_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    archived = op.get_bind().execute(sa.text(
+        'SELECT count(*) FROM log_partition WHERE archived_at IS NOT NULL'
+    )).scalar()
+    if archived:
+        raise RuntimeError(f'{archived} log partition(s) live in the archive database; move them back first')
+    with op.batch_alter_table('log_partition') as batch_op:
+        batch_op.drop_column('archived_at')
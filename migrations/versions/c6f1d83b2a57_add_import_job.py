@@ -0,0 +1,42 @@
+"""Add import_job
+
+Revision ID: c6f1d83b2a57
+Revises: 5e8b0c4d9a21
+Create Date: 2024-06-28 14:02:37.418205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6f1d83b2a57'
+down_revision = '5e8b0c4d9a21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('import_job',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('path', sa.String(length=255), nullable=False),
+    sa.Column('format', sa.String(length=10), nullable=False),
+    sa.Column('kind', sa.String(length=20), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('offset', sa.Integer(), nullable=False),
+    sa.Column('rows_read', sa.Integer(), nullable=False),
+    sa.Column('rows_imported', sa.Integer(), nullable=False),
+    sa.Column('rows_rejected', sa.Integer(), nullable=False),
+    sa.Column('errors', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_import_job_user_id'), 'import_job', ['user_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_import_job_user_id'), table_name='import_job')
+    op.drop_table('import_job')
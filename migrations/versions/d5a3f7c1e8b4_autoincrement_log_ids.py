@@ -0,0 +1,75 @@
+"""Give the log tables AUTOINCREMENT ids
+
+Revision ID: d5a3f7c1e8b4
+Revises: 1f7a3c9e5d82
+Create Date: 2024-08-02 10:18:27.403916
+
+Plain rowid tables hand out max(id) + 1, so once the newest rows of a log table were sealed
+into a partition, new rows took ids partitioned rows still hold. Each log table is rebuilt
+with AUTOINCREMENT and its id sequence starts after the highest id of its partitions.
+The shard databases, which Alembic does not migrate, are rebuilt the same way by the next
+`python manage.py partition_logs`.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5a3f7c1e8b4'
+down_revision = '1f7a3c9e5d82'
+branch_labels = None
+depends_on = None
+
+LOG_TABLES = ('activity', 'nutrition', 'sleep', 'mood')
+ARCHIVE_SCHEMA = 'archive'
+
+
+def _existing_tables():
+    # nutrition, sleep and mood are created by `manage.py create_db` rather than
+    # by a migration, so only rebuild the tables this database actually has.
+    return set(sa.inspect(op.get_bind()).get_table_names())
+
+
+def _partitions(bind, table):
+    # Sealed partitions are listed in log_partition, archived ones in the archive
+    # database, which is attached when SQLITE_ARCHIVE is set
+    attached = {row[1] for row in bind.execute(sa.text('PRAGMA database_list'))}
+    names = []
+    partitions = bind.execute(sa.text(
+        'SELECT month, archived_at IS NOT NULL FROM log_partition WHERE parent = :parent'
+    ), {'parent': table}).all()
+    for month, archived in partitions:
+        name = f"{table}_{str(month)[:7].replace('-', '_')}"
+        if archived:
+            if ARCHIVE_SCHEMA not in attached:
+                raise RuntimeError(f'{name} lives in the archive database; set SQLITE_ARCHIVE to attach it')
+            name = f'{ARCHIVE_SCHEMA}.{name}'
+        names.append(name)
+    return names
+
+
+def _recreate(autoincrement):
+    for table in LOG_TABLES:
+        if table in _existing_tables():
+            with op.batch_alter_table(table, recreate='always',
+                                      table_kwargs={'sqlite_autoincrement': autoincrement}):
+                pass
+
+
+def upgrade():
+    _recreate(True)
+    bind = op.get_bind()
+    for table in LOG_TABLES:
+        if table not in _existing_tables():
+            continue
+        high = max(bind.execute(sa.text(f'SELECT max(id) FROM {name}')).scalar() or 0
+                   for name in (table, *_partitions(bind, table)))
+        bounds = {'name': table, 'high': high}
+        if not bind.execute(sa.text('UPDATE sqlite_sequence SET seq = max(seq, :high) WHERE name = :name'),
+                            bounds).rowcount:
+            bind.execute(sa.text('INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :high)'), bounds)
+
+
+def downgrade():
+    _recreate(False)
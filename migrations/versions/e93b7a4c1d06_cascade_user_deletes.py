@@ -0,0 +1,55 @@
+"""Cascade user deletes and add user.deleted_at
+
+Revision ID: e93b7a4c1d06
+Revises: c6f1d83b2a57
+Create Date: 2024-07-01 10:21:44.730962
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e93b7a4c1d06'
+down_revision = 'c6f1d83b2a57'
+branch_labels = None
+depends_on = None
+
+# The foreign keys were created unnamed; this convention names them so batch mode can replace them
+naming_convention = {
+    'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s',
+}
+
+USER_TABLES = ('activity', 'nutrition', 'sleep', 'mood', 'daily_summary', 'import_job')
+
+
+def _existing_tables():
+    # nutrition, sleep and mood are created by `manage.py create_db` rather than
+    # by a migration, so only change the tables this database actually has.
+    return set(sa.inspect(op.get_bind()).get_table_names())
+
+
+def _replace_user_fk(table, ondelete):
+    with op.batch_alter_table(table, naming_convention=naming_convention) as batch_op:
+        batch_op.drop_constraint(f'fk_{table}_user_id_user', type_='foreignkey')
+        batch_op.create_foreign_key(f'fk_{table}_user_id_user', 'user', ['user_id'], ['id'], ondelete=ondelete)
+
+
+def upgrade():
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.add_column(sa.Column('deleted_at', sa.DateTime(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_user_deleted_at'), ['deleted_at'], unique=False)
+    existing = _existing_tables()
+    for table in USER_TABLES:
+        if table in existing:
+            _replace_user_fk(table, 'CASCADE')
+
+
+def downgrade():
+    existing = _existing_tables()
+    for table in USER_TABLES:
+        if table in existing:
+            _replace_user_fk(table, None)
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_deleted_at'))
+        batch_op.drop_column('deleted_at')
@@ -0,0 +1,47 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from app import create_app, db
+from app.cache import response_cache
+from app.identity import user_cache
+from app.models import User
+from app.passwords import password_hasher
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """
+    An application under TestingConfig with the schema built in a fresh database.
+    The process-wide caches are emptied, since every test's database reuses the same user ids.
+    """
+    response_cache.clear()
+    user_cache.clear()
+    monkeypatch.setattr(config.TestingConfig, 'SQLALCHEMY_DATABASE_URI', 'sqlite:///' + str(tmp_path / 'test.db'))
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+@pytest.fixture
+def user(app):
+    """
+    A new user, alice, whose password is 'secret1'.
+    """
+    user = User(username='alice', email='alice@example.com', password=password_hasher.hash('secret1'))
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+@pytest.fixture
+def logged_in_client(app, user):
+    """
+    A test client logged in as the user fixture's alice.
+    """
+    client = app.test_client()
+    client.post('/auth/login', data={'email': 'alice@example.com', 'password': 'secret1'})
+    return client
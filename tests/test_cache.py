@@ -0,0 +1,47 @@
+import time
+from app.cache import ResponseCache, response_cache
+
+def test_cache_evicts_least_recently_used_bodies_to_fit():
+    cache = ResponseCache(max_bytes=10, ttl=60)
+    cache.set((1, '/a', ()), b'aaaa')
+    cache.set((1, '/b', ()), b'bbbb')
+    assert cache.get((1, '/a', ())) == b'aaaa'  # /b is now the least recently used
+    cache.set((2, '/c', ()), b'cccc')
+    assert cache.get((1, '/b', ())) is None
+    assert cache.get((1, '/a', ())) == b'aaaa' and cache.get((2, '/c', ())) == b'cccc'
+    cache.set((2, '/d', ()), b'x' * 11)  # Larger than the whole cache
+    assert cache.get((2, '/d', ())) is None
+    stats = cache.stats()
+    assert (stats['entries'], stats['bytes'], stats['evictions']) == (2, 8, 1)
+
+def test_cache_expires_entries_and_invalidates_one_user():
+    cache = ResponseCache(max_bytes=100, ttl=60)
+    cache.set((1, '/a', ()), b'a')
+    cache.set((1, '/b', ()), b'b')
+    cache.set((2, '/a', ()), b'c')
+    cache.invalidate_user(1)
+    assert cache.get((1, '/a', ())) is None and cache.get((1, '/b', ())) is None
+    assert cache.get((2, '/a', ())) == b'c'
+    cache.ttl = 0
+    cache.set((2, '/a', ()), b'd')
+    time.sleep(0.01)
+    assert cache.get((2, '/a', ())) is None
+    assert cache.stats()['bytes'] == 0
+
+def test_writes_invalidate_the_cached_responses(logged_in_client):
+    client = logged_in_client
+    hits = response_cache.hits
+    assert client.get('/sleep_data?period=weekly').get_json() == []
+    assert client.get('/sleep_data?period=weekly').get_json() == []
+    assert (response_cache.hits - hits, response_cache.stats()['entries']) == (1, 1)
+
+    # The form write drops the user's responses, so the next read is a miss that sees the entry
+    assert client.post('/log_sleep', data={'hours': 7, 'quality': 'Good'}).status_code == 302
+    assert response_cache.stats()['entries'] == 0
+    assert [point['hours'] for point in client.get('/sleep_data?period=weekly').get_json()] == [7.0]
+    assert response_cache.hits - hits == 1
+
+    # So does the bulk write
+    client.post('/entries/bulk', json={'entries': [{'kind': 'sleep', 'hours': 8, 'quality': 'Fair'}]})
+    assert [point['hours'] for point in client.get('/sleep_data?period=weekly').get_json()] == [7.0, 8.0]
+    assert response_cache.hits - hits == 1
@@ -0,0 +1,56 @@
+from datetime import date, timedelta
+from app.columnar import EPOCH, to_columnar
+
+def decode(payload, columns):
+    # Turns a columnar payload back into the row format for the day unit
+    rows = []
+    for i in range(len(payload['date'])):
+        row = {}
+        for column in columns:
+            value = payload[column]
+            if isinstance(value, dict):
+                row[column] = value['dictionary'][value['codes'][i]]
+            elif column == 'date':
+                row[column] = (EPOCH + timedelta(days=value[i])).isoformat()
+            else:
+                row[column] = value[i]
+        rows.append(row)
+    return rows
+
+def test_to_columnar_encodes_dates_and_categories():
+    points = [
+        {'steps': 100, 'type': 'Running', 'date': '1970-01-02'},
+        {'steps': 200, 'type': 'Walking', 'date': '2024-05-01'},
+        {'steps': 300, 'type': 'Running', 'date': '2024-05-01'},
+    ]
+    payload = to_columnar(points, ['steps', 'type', 'date'])
+    assert payload == {
+        'date_unit': 'day',
+        'steps': [100, 200, 300],
+        'type': {'dictionary': ['Running', 'Walking'], 'codes': [0, 1, 0]},
+        'date': [1, 19844, 19844],
+    }
+    assert to_columnar([{'date': '1970-01-01 05:00', 'count': 2}], ['date', 'count'], 'hour') == \
+        {'date_unit': 'hour', 'date': [5], 'count': [2]}
+    # An empty series keeps its columns
+    assert to_columnar([], ['hours', 'quality', 'date']) == \
+        {'date_unit': 'day', 'hours': [], 'quality': {'dictionary': [], 'codes': []}, 'date': []}
+
+def test_columnar_endpoint_carries_the_same_points(logged_in_client):
+    client = logged_in_client
+    days = [(date.today() - timedelta(days=i)).isoformat() for i in range(3)]
+    client.post('/entries/bulk', json={'entries': [
+        {'kind': 'activity', 'steps': 1000 * (i + 1), 'distance': 1.0, 'calories': 80,
+         'type': ('Running', 'Walking')[i % 2], 'duration': 15, 'date': day}
+        for i, day in enumerate(days)
+    ]})
+    rows = client.get('/activity_data?period=weekly').get_json()
+    payload = client.get('/activity_data?period=weekly&format=columnar').get_json()
+    assert sorted(payload['type']['dictionary']) == ['Running', 'Walking']
+    assert decode(payload, ['steps', 'distance', 'calories', 'type', 'duration', 'date']) == rows
+
+    # Buckets are columnar too, with the fields they aggregate
+    buckets = client.get('/activity_data?period=weekly&granularity=day&format=columnar').get_json()
+    assert buckets['date_unit'] == 'day'
+    assert sorted(buckets['steps']) == [1000, 2000, 3000]
+    assert buckets['count'] == [1, 1, 1]
@@ -0,0 +1,54 @@
+import json
+import re
+from datetime import date, datetime, timedelta
+import pytest
+
+SERIES = ('activity', 'nutrition', 'sleep', 'mood')
+
+@pytest.fixture
+def client(logged_in_client):
+    """
+    A logged-in client whose user has logged entries of every kind.
+    """
+    client = logged_in_client
+    yesterday = date.today() - timedelta(days=1)
+    response = client.post('/entries/bulk', json={'entries': [
+        {'kind': 'activity', 'steps': 4000, 'distance': 3.0, 'calories': 200, 'type': 'Running', 'duration': 30,
+         'date': (datetime.utcnow() - timedelta(hours=2)).isoformat()},
+        {'kind': 'nutrition', 'calories': 600, 'protein': 30, 'carbs': 70, 'fats': 20, 'date': yesterday.isoformat()},
+        {'kind': 'nutrition', 'calories': 400, 'protein': 20, 'carbs': 50, 'fats': 10, 'date': yesterday.isoformat()},
+        {'kind': 'sleep', 'hours': 7, 'quality': 'Good', 'date': yesterday.isoformat()},
+        {'kind': 'sleep', 'hours': 8, 'quality': 'Fair', 'date': yesterday.isoformat()},
+        {'kind': 'mood', 'rating': 7, 'date': yesterday.isoformat()},
+    ]})
+    assert response.get_json()['inserted'] == 6
+    return client
+
+def test_bundle_holds_the_summary_and_every_series(client):
+    response = client.get('/dashboard_bundle?period=weekly')
+    assert response.status_code == 200
+    assert response.headers['ETag']
+    bundle = response.get_json()
+    assert set(bundle) == {'summary', *SERIES}
+    assert bundle['summary'] == {'avg_sleep_hours': 7.5, 'total_calories': 1000, 'mood_counts': {'7': 1}}
+    # Each series is exactly what its own endpoint returns for the same query
+    for name in SERIES:
+        assert bundle[name] == client.get(f'/{name}_data?period=weekly').get_json()
+    assert [point['steps'] for point in bundle['activity']] == [4000]
+
+def test_bundle_rejects_a_bad_query(client):
+    response = client.get('/dashboard_bundle?max_points=1')
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+def test_dashboard_page_inlines_the_columnar_bundle(client):
+    response = client.get('/dashboard_data?period=weekly', headers={'Accept': 'text/html'})
+    assert response.status_code == 200
+    match = re.search(r'<script id="dashboardBundle" type="application/json">(.*?)</script>',
+                      response.get_data(as_text=True), re.S)
+    assert match
+    inlined = json.loads(match.group(1))
+    assert inlined == client.get('/dashboard_bundle?period=weekly&format=columnar').get_json()
+    assert inlined['sleep']['date_unit'] == 'day'
+    assert inlined['sleep']['hours'] == [7.0, 8.0]
+    assert inlined['sleep']['quality']['dictionary'] == ['Good', 'Fair']
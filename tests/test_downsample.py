@@ -0,0 +1,31 @@
+import random
+import pytest
+from app import downsample
+from app.downsample import lttb_indices
+
+def random_walk(count, seed=0):
+    generator = random.Random(seed)
+    value, values = 100.0, []
+    for _ in range(count):
+        value += generator.gauss(0, 10)
+        values.append(value)
+    return values
+
+def test_short_series_are_kept_whole():
+    assert lttb_indices([1, 2, 3], 10) == [0, 1, 2]
+    assert lttb_indices(list(range(10)), 2) == list(range(10))
+
+def test_keeps_ends_and_peaks():
+    values = [0.0] * 1000
+    values[437] = 50.0
+    indices = lttb_indices(values, 20)
+    assert len(indices) == 20
+    assert indices[0] == 0 and indices[-1] == 999
+    assert 437 in indices
+    assert indices == sorted(indices)
+
+@pytest.mark.skipif(downsample.np is None, reason='numpy is not installed')
+@pytest.mark.parametrize('count, max_points', [(100, 3), (1001, 50), (20000, 500), (100003, 300)])
+def test_numpy_and_python_keep_the_same_points(count, max_points):
+    values = random_walk(count)
+    assert downsample._lttb_numpy(values, max_points) == downsample._lttb_python(values, max_points)
@@ -0,0 +1,34 @@
+def test_unchanged_data_is_answered_with_304(logged_in_client):
+    client = logged_in_client
+    response = client.get('/sleep_data?period=weekly')
+    etag = response.headers['ETag']
+    assert response.status_code == 200
+    assert 'private' in response.headers['Cache-Control'] and 'no-cache' in response.headers['Cache-Control']
+
+    response = client.get('/sleep_data?period=weekly', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.get_data() == b''
+    assert response.headers['ETag'] == etag
+
+    # Another query of the same data has its own tag
+    other = client.get('/sleep_data?period=monthly').headers['ETag']
+    assert other != etag
+    assert client.get('/sleep_data?period=weekly', headers={'If-None-Match': other}).status_code == 200
+
+def test_a_write_changes_the_etag(logged_in_client):
+    client = logged_in_client
+    query = '/sleep_data?start=2024-01-01&end=2030-12-31'
+    etag = client.get(query).headers['ETag']
+    client.post('/entries/bulk', json={'entries': [{'kind': 'sleep', 'hours': 7, 'quality': 'Good', 'date': '2024-05-01'}]})
+    response = client.get(query, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert [point['hours'] for point in response.get_json()] == [7.0]
+    assert response.headers['ETag'] != etag
+    assert client.get(query, headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+def test_streamed_responses_revalidate_too(logged_in_client):
+    client = logged_in_client
+    response = client.get('/sleep_data?period=weekly&stream=1')
+    assert response.status_code == 200 and response.get_json() == []
+    response = client.get('/sleep_data?period=weekly&stream=1', headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
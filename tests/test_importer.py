@@ -0,0 +1,74 @@
+import json
+import pytest
+from sqlalchemy import select
+from app import db
+from app.importer import create_job, read_records, run_import
+from app.models import ImportJob, Mood
+
+RECORDS = 10
+
+class Killed(BaseException):
+    # Like the worker being killed: not an Exception, so run_import cannot mark the job failed
+    pass
+
+def note(i):
+    # Every third note spans lines and holds the CSV delimiter and quotes
+    return f'entry {i}\nsecond line, with a comma and "quotes"' if i % 3 == 0 else f'entry {i}'
+
+def write_csv(path):
+    lines = ['kind,rating,notes,date']
+    for i in range(RECORDS):
+        escaped = note(i).replace('"', '""')
+        lines.append(f'mood,{i % 10 + 1},"{escaped}",2024-05-{i + 1:02d}')
+    # A byte order mark, as spreadsheet exports write, shifts every byte offset
+    path.write_bytes(b'\xef\xbb\xbf' + '\r\n'.join(lines).encode() + b'\r\n')
+
+def write_ndjson(path):
+    path.write_text(''.join(
+        json.dumps({'kind': 'mood', 'rating': i % 10 + 1, 'notes': note(i), 'date': f'2024-05-{i + 1:02d}'}) + '\n'
+        for i in range(RECORDS)
+    ))
+
+def imported_notes(user_id):
+    return db.session.execute(select(Mood.notes).where(Mood.user_id == user_id).order_by(Mood.id)).scalars().all()
+
+@pytest.mark.parametrize('fmt, write', [('csv', write_csv), ('ndjson', write_ndjson)])
+def test_killed_import_resumes_without_losing_or_repeating_rows(app, user, tmp_path, fmt, write):
+    path = tmp_path / f'moods.{fmt}'
+    write(path)
+    job = create_job(user.id, str(path))
+
+    def kill_after_second_chunk(job):
+        if job.rows_read == 6:
+            raise Killed()
+    with pytest.raises(Killed):
+        run_import(job, chunk_size=3, progress=kill_after_second_chunk)
+    db.session.rollback()
+    job = db.session.get(ImportJob, job.id)
+    assert job.status == 'running'
+    assert (job.rows_read, job.rows_imported) == (6, 6)
+    assert imported_notes(user.id) == [note(i) for i in range(6)]
+
+    # The saved offset is where the seventh record starts, past the header and the multi-line notes
+    with open(path, 'rb') as stream:
+        resumed = [record for _, record in read_records(stream, fmt, job.offset)]
+    assert [record['notes'] for record in resumed] == [note(i) for i in range(6, RECORDS)]
+
+    job = run_import(job, chunk_size=3)
+    assert job.status == 'done'
+    assert (job.rows_read, job.rows_imported, job.rows_rejected) == (RECORDS, RECORDS, 0)
+    assert imported_notes(user.id) == [note(i) for i in range(RECORDS)]
+
+def test_oversized_integer_rejects_its_row_only(app, user, tmp_path):
+    path = tmp_path / 'moods.ndjson'
+    path.write_text(''.join(json.dumps(record) + '\n' for record in [
+        {'kind': 'mood', 'rating': 5, 'notes': 'before', 'date': '2024-05-01'},
+        {'kind': 'activity', 'steps': 2 ** 70, 'distance': 1.0, 'calories': 80, 'type': 'Running',
+         'duration': 15, 'date': '2024-05-02'},
+        {'kind': 'mood', 'rating': 6, 'notes': 'after', 'date': '2024-05-03'},
+    ]))
+    job = run_import(create_job(user.id, str(path)), chunk_size=2)
+    assert job.status == 'done'
+    assert (job.rows_read, job.rows_imported, job.rows_rejected) == (3, 2, 1)
+    assert json.loads(job.errors) == [{'record': 2, 'errors': {'steps': f'must be at most {2 ** 63 - 1}'}}]
+    assert imported_notes(user.id) == ['before', 'after']
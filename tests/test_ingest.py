@@ -0,0 +1,83 @@
+from datetime import date, datetime
+from sqlalchemy import func, select
+from app import db
+from app.ingest import validate_entries
+from app.models import Activity, DailySummary, Sleep
+from app.tokens import issue_token
+
+NOW = datetime(2024, 5, 1, 12, 0)
+
+def sleep(**fields):
+    return {'kind': 'sleep', 'hours': 7.5, 'quality': 'Good', 'date': '2024-04-30', **fields}
+
+def activity(**fields):
+    return {'kind': 'activity', 'steps': 5000, 'distance': 3.2, 'calories': 250, 'type': 'Walking',
+            'duration': 45, 'date': '2024-04-30T07:30:00Z', **fields}
+
+def count(model, user_id):
+    return db.session.execute(select(func.count()).where(model.user_id == user_id)).scalar()
+
+def test_batch_validation_reports_each_entry():
+    rows, results = validate_entries([
+        sleep(),
+        activity(steps=-1),
+        {'kind': 'dance'},
+        'not an entry',
+        sleep(quality='Great', date=None),
+        activity(),
+        {'kind': 'mood', 'rating': 11},
+        activity(steps=2 ** 70),
+    ], user_id=1, now=NOW)
+    assert [result['status'] for result in results] == \
+        ['ok', 'invalid', 'invalid', 'invalid', 'invalid', 'ok', 'invalid', 'invalid']
+    assert [result['index'] for result in results] == list(range(8))
+    assert results[1]['errors'] == {'steps': 'must be at least 0'}
+    assert 'kind' in results[2]['errors']
+    assert results[3]['errors'] == {'entry': 'must be an object'}
+    assert set(results[4]['errors']) == {'quality'}
+    assert results[6]['errors']['rating'] == 'must be at most 10'
+    assert results[7]['errors'] == {'steps': f'must be at most {2 ** 63 - 1}'}
+    assert [row['hours'] for row in rows[Sleep]] == [7.5]
+    # Aware datetimes are stored as naive UTC, and entries without a date get now
+    assert rows[Activity][0]['date'] == datetime(2024, 4, 30, 7, 30)
+    assert validate_entries([sleep(date=None)], user_id=1, now=NOW)[0][Sleep][0]['date'] == date(2024, 5, 1)
+
+def test_bulk_inserts_valid_entries_and_returns_per_item_results(app, user):
+    client = app.test_client()
+    client.post('/auth/login', data={'email': 'alice@example.com', 'password': 'secret1'})
+    response = client.post('/entries/bulk', json={'entries': [sleep(), activity(calories='lots'), activity()]})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert (body['inserted'], body['rejected']) == (2, 1)
+    assert [result['status'] for result in body['results']] == ['ok', 'invalid', 'ok']
+    assert body['results'][1]['errors'] == {'calories': 'is invalid'}
+    assert count(Sleep, user.id) == 1 and count(Activity, user.id) == 1
+    summary = db.session.get(DailySummary, (user.id, date(2024, 4, 30)))
+    assert (summary.sleep_count, summary.steps) == (1, 5000)
+
+def test_atomic_bulk_rejects_the_whole_batch(app, user):
+    client = app.test_client()
+    client.post('/auth/login', data={'email': 'alice@example.com', 'password': 'secret1'})
+    response = client.post('/entries/bulk?atomic=1', json={'entries': [sleep(), sleep(hours='x')]})
+    assert response.status_code == 422
+    body = response.get_json()
+    assert (body['inserted'], body['rejected']) == (0, 1)
+    assert count(Sleep, user.id) == 0
+
+def test_bulk_rejects_malformed_and_oversized_payloads(app, user):
+    app.config['BULK_MAX_ENTRIES'] = 2
+    client = app.test_client()
+    client.post('/auth/login', data={'email': 'alice@example.com', 'password': 'secret1'})
+    assert client.post('/entries/bulk', json={'entries': 'sleep'}).status_code == 400
+    assert client.post('/entries/bulk', json=[sleep(), sleep(), sleep()]).status_code == 413
+
+def test_bulk_needs_the_write_scope(app, user):
+    read_token, _ = issue_token(user.id, ['read'])
+    write_token, _ = issue_token(user.id, ['write'])
+    client = app.test_client()
+    response = client.post('/entries/bulk', json={'entries': [sleep()]}, headers={'Authorization': f'Bearer {read_token}'})
+    assert response.status_code == 401
+    assert count(Sleep, user.id) == 0
+    response = client.post('/entries/bulk', json={'entries': [sleep()]}, headers={'Authorization': f'Bearer {write_token}'})
+    assert response.status_code == 200
+    assert count(Sleep, user.id) == 1
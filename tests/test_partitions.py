@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from app import db
+from app.models import Mood
+from app.partitions import month_start, partition_model, partition_table
+
+def add_moods(user, when, count):
+    db.session.add_all([Mood(user_id=user.id, rating=5, date=when) for _ in range(count)])
+    db.session.commit()
+
+def ids(table):
+    return set(db.session.execute(select(table.c.id)).scalars())
+
+def test_new_rows_never_reuse_sealed_ids(app, user):
+    # Every row is sealed away, so a plain rowid table would start again at id 1
+    old = datetime.utcnow() - timedelta(days=200)
+    add_moods(user, old, 3)
+    assert partition_model(Mood)
+    add_moods(user, datetime.utcnow(), 1)
+    sealed = ids(partition_table(Mood, month_start(old)))
+    assert len(sealed) == 3
+    assert not sealed & ids(Mood.__table__)
+
+def test_tables_without_autoincrement_are_rebuilt(app, user):
+    # A mood table created before the models asked for AUTOINCREMENT
+    old = datetime.utcnow() - timedelta(days=200)
+    connection = db.session.connection()
+    connection.exec_driver_sql('DROP TABLE mood')
+    connection.exec_driver_sql(
+        'CREATE TABLE mood (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES user (id) ON DELETE CASCADE, '
+        'date DATETIME NOT NULL, rating INTEGER NOT NULL, notes VARCHAR(200))'
+    )
+    connection.exec_driver_sql('CREATE INDEX ix_mood_user_id_date ON mood (user_id, date)')
+    db.session.commit()
+    add_moods(user, old, 3)
+    add_moods(user, datetime.utcnow(), 1)
+
+    assert partition_model(Mood)
+    sql = db.session.connection().exec_driver_sql("SELECT sql FROM sqlite_master WHERE name = 'mood'").scalar()
+    assert 'AUTOINCREMENT' in sql
+    assert ids(Mood.__table__) == {4}
+    db.session.execute(Mood.__table__.delete())
+    db.session.commit()
+    add_moods(user, datetime.utcnow(), 1)
+    assert ids(Mood.__table__) == {5}
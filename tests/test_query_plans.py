@@ -0,0 +1,49 @@
+from datetime import date, datetime, timedelta
+import pytest
+from app import db
+from app.models import Activity, Nutrition, Sleep, Mood
+from app.partitions import partition_model
+from app.queryplan import LOG_MODELS, check_query_plans, full_scans, hot_queries, explain
+
+LOG_TABLES = {model.__tablename__ for model in LOG_MODELS}
+
+def assert_indexed(name, plan):
+    keyed = ('USING INDEX', 'USING COVERING INDEX', 'USING INTEGER PRIMARY KEY')
+    assert any(key in step for step in plan for key in keyed), f'{name}: {plan}'
+    scans = [step for step in plan if step.startswith('SCAN ') and step.split()[1] in LOG_TABLES]
+    assert not scans, f'{name} scans a log table: {plan}'
+
+def add_old_entries(user):
+    # One entry of each kind half a year back, so partition_model seals a month of every log table
+    day = date.today() - timedelta(days=183)
+    moment = datetime.combine(day, datetime.min.time())
+    db.session.add_all([
+        Activity(user_id=user.id, date=moment, steps=1000, distance=1.0, calories=100, type='walk', duration=10),
+        Nutrition(user_id=user.id, date=day, calories=500, protein=20, fats=10, carbs=60),
+        Sleep(user_id=user.id, date=day, hours=7.5, quality='good'),
+        Mood(user_id=user.id, date=day, rating=7),
+    ])
+    db.session.commit()
+
+def test_every_hot_query_uses_an_index(app, user):
+    plans, failures = check_query_plans(user.id)
+    assert not failures
+    assert set(plans) == set(hot_queries(user.id))
+    for name, plan in plans.items():
+        assert_indexed(name, plan)
+
+def test_sealed_partitions_are_searched_by_index(app, user):
+    add_old_entries(user)
+    for model in LOG_MODELS:
+        assert partition_model(model)
+    plans, failures = check_query_plans(user.id)
+    assert not failures
+    for name, plan in plans.items():
+        assert_indexed(name, plan)
+    partitions = [step for step in plans['activity_year_by_hour'] if step.startswith('SEARCH activity_')]
+    assert partitions, plans['activity_year_by_hour']
+
+@pytest.mark.parametrize('model', LOG_MODELS, ids=lambda model: model.__tablename__)
+def test_full_scan_is_reported(app, model):
+    plan = explain(db.select(model))
+    assert full_scans(plan) == [f'SCAN {model.__tablename__}']
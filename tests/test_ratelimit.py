@@ -0,0 +1,55 @@
+import pytest
+from app import tokens
+from app.ratelimit import _user_key, rate_limiter
+
+@pytest.fixture
+def limited(app):
+    """
+    Returns a function that enables rate limiting with the given RATE_LIMITS.
+    """
+    def configure(limits):
+        app.config['RATE_LIMIT_ENABLED'] = True
+        rate_limiter.limits = limits
+        rate_limiter.rejected = 0
+        return app.test_client()
+    return configure
+
+def test_blueprint_limits_are_shared_by_its_endpoints(limited):
+    client = limited({'main': [('ip', 3, 60)]})
+    codes = [client.post(path).status_code for path in ('/log_sleep', '/log_mood', '/log_sleep', '/log_mood')]
+    assert codes[:3] == [302, 302, 302]
+    assert codes[3] == 429
+
+def test_endpoint_and_blueprint_limits_both_apply(limited):
+    client = limited({'main.log_sleep': [('ip', 1, 60)], 'main': [('ip', 2, 60)]})
+    assert client.post('/log_mood').status_code == 302
+    assert client.post('/log_sleep').status_code == 302
+    assert client.post('/log_sleep').status_code == 429  # The endpoint's own limit
+    assert client.post('/log_mood').status_code == 429  # The blueprint's budget, spent by both
+
+def test_rejected_request_spends_no_later_budget(limited):
+    client = limited({'main.log_sleep': [('ip', 1, 60)], 'main': [('ip', 2, 60)]})
+    assert client.post('/log_sleep').status_code == 302
+    assert client.post('/log_sleep').status_code == 429
+    assert client.post('/log_mood').status_code == 302  # The blueprint budget still has a token
+    assert rate_limiter.rejected == 1
+
+def test_rejection_carries_retry_after(limited):
+    client = limited({'main': [('ip', 1, 60)]})
+    client.post('/log_sleep')
+    response = client.post('/log_sleep')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    assert response.get_json()['error'] == 'Too many requests'
+
+def test_get_requests_are_not_limited(limited):
+    client = limited({'main': [('ip', 1, 60)]})
+    assert all(client.get('/').status_code == 200 for _ in range(3))
+
+def test_user_key_does_not_load_revocations(app, monkeypatch):
+    token, _ = tokens.issue_token(7)
+    monkeypatch.setattr(tokens, '_revocations', lambda: pytest.fail('revocation list loaded'))
+    with app.test_request_context('/bulk_entries', method='POST', headers={'Authorization': f'Bearer {token}'}):
+        assert _user_key() == '7'
+    with app.test_request_context('/bulk_entries', method='POST', headers={'Authorization': 'Bearer forged'}):
+        assert _user_key() is None
@@ -0,0 +1,70 @@
+from collections import Counter
+from datetime import datetime
+import pytest
+from sqlalchemy import func, select
+from app import db, rebalance
+from app.models import Shard, ShardMove, Sleep, User
+from app.rebalance import move_user, unfinished_moves
+from app.sharding import select_shard, shard_for
+
+USERS = range(1, 20001)
+
+@pytest.mark.parametrize('shards', [2, 4, 8])
+def test_users_spread_evenly(shards):
+    counts = Counter(shard_for(user_id, range(1, shards + 1)) for user_id in USERS)
+    assert set(counts) == set(range(1, shards + 1))
+    ideal = len(USERS) / shards
+    assert all(abs(count - ideal) < 0.1 * ideal for count in counts.values()), counts
+
+@pytest.mark.parametrize('shards', [1, 3, 4])
+def test_adding_a_shard_only_moves_users_to_it(shards):
+    before = {user_id: shard_for(user_id, range(1, shards + 1)) for user_id in USERS}
+    after = {user_id: shard_for(user_id, range(1, shards + 2)) for user_id in USERS}
+    moved = [user_id for user_id in USERS if before[user_id] != after[user_id]]
+    assert all(after[user_id] == shards + 1 for user_id in moved)
+    assert abs(len(moved) / len(USERS) - 1 / (shards + 1)) < 0.02
+
+def test_placement_is_stable_and_order_independent():
+    assert shard_for(42, [1, 2, 3]) == shard_for(42, [3, 1, 2])
+    assert shard_for(42, []) is None
+
+class Interrupted(Exception):
+    pass
+
+def sleep_count(user_id, shard_id):
+    select_shard(db.session, shard_id)
+    return db.session.execute(select(func.count()).where(Sleep.user_id == user_id)).scalar()
+
+def test_move_interrupted_after_the_switch_resumes(app, tmp_path, monkeypatch):
+    for name in ('a', 'b'):
+        db.session.add(Shard(url='sqlite:///' + str(tmp_path / f'{name}.db')))
+    db.session.commit()
+    user = User(username='alice', email='alice@example.com', password='x')
+    db.session.add(user)
+    db.session.commit()
+    source = user.shard_id
+    target = next(shard.id for shard in Shard.query.all() if shard.id != source)
+    select_shard(db.session, source)
+    db.session.add_all([Sleep(user_id=user.id, hours=7, quality='Good', date=datetime(2024, 5, day))
+                        for day in range(1, 6)])
+    db.session.commit()
+
+    def crash(seconds):
+        raise Interrupted()
+    monkeypatch.setattr(rebalance.time, 'sleep', crash)
+    with pytest.raises(Interrupted):
+        move_user(user.id, target, batch_size=2, grace=0)
+    db.session.rollback()
+    assert db.session.get(User, user.id).shard_id == target
+    assert unfinished_moves() == [(user.id, source, target)]
+
+    # A request that loaded the user before the switch still writes to the old shard
+    select_shard(db.session, source)
+    db.session.add(Sleep(user_id=user.id, hours=8, quality='Fair', date=datetime(2024, 5, 6)))
+    db.session.commit()
+
+    monkeypatch.setattr(rebalance.time, 'sleep', lambda seconds: None)
+    assert move_user(user.id, target, batch_size=2, grace=0) == 6
+    assert sleep_count(user.id, target) == 6
+    assert sleep_count(user.id, source) == 0
+    assert db.session.get(ShardMove, user.id) is None
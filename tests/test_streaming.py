@@ -0,0 +1,67 @@
+import json
+import tracemalloc
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from app import db
+from app.models import Activity, User
+from app.passwords import password_hasher
+from app.streaming import STREAM_BATCH_SIZE, json_array_chunks
+
+# Peak traced memory allowed while streaming, whatever the number of rows: a few chunks of
+# STREAM_BATCH_SIZE encoded rows, far below what a million of them take
+PEAK_BOUND = 1024 * 1024
+
+def synthetic_rows(count):
+    # Rows shaped like the activity series, generated one at a time like a yield_per cursor
+    for i in range(count):
+        yield (i, f'2024-01-{i % 28 + 1:02d}T08:00:00', 1000 + i % 5000, 'running')
+
+def serialize(row):
+    return {'id': row[0], 'date': row[1], 'steps': row[2], 'type': row[3]}
+
+def stream_peak(count):
+    # Consumes the chunks the way a WSGI server sends them, returning its size and the peak traced memory
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        size = 0
+        for chunk in json_array_chunks(synthetic_rows(count), serialize):
+            size += len(chunk)
+        return size, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def test_chunks_form_a_json_array():
+    chunks = list(json_array_chunks(synthetic_rows(2500), serialize, chunk_size=1000))
+    assert len(chunks) == 5  # '[', three chunks, ']'
+    assert [row['id'] for row in json.loads(''.join(chunks))] == list(range(2500))
+    assert json.loads(''.join(json_array_chunks(iter(()), serialize))) == []
+
+def test_million_rows_stream_in_bounded_memory():
+    size, peak = stream_peak(1_000_000)
+    assert size > 50 * PEAK_BOUND  # The document itself is far larger than the bound
+    assert peak < PEAK_BOUND
+
+def test_peak_does_not_grow_with_rows():
+    _, small = stream_peak(10 * STREAM_BATCH_SIZE)
+    _, large = stream_peak(100 * STREAM_BATCH_SIZE)
+    assert large < small * 1.5
+
+def test_streamed_series_reads_in_batches(app):
+    user = User(username='alice', email='alice@example.com', password=password_hasher.hash('secret1'))
+    db.session.add(user)
+    db.session.commit()
+    start = datetime.utcnow() - timedelta(hours=12)
+    count = 3 * STREAM_BATCH_SIZE + 7
+    db.session.execute(insert(Activity), [
+        {'user_id': user.id, 'date': start + timedelta(seconds=i), 'steps': i, 'distance': 1.0,
+         'calories': 10, 'type': 'walk', 'duration': 1}
+        for i in range(count)
+    ])
+    db.session.commit()
+    client = app.test_client()
+    client.post('/auth/login', data={'email': 'alice@example.com', 'password': 'secret1'})
+    response = client.get('/activity_data?period=daily&stream=1')
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert [row['steps'] for row in json.loads(response.get_data(as_text=True))] == list(range(count))
@@ -0,0 +1,53 @@
+from datetime import date
+from sqlalchemy import event
+from app import db
+from app.purge import soft_delete_user
+from app.routing import PIN_KEY
+from app.tokens import issue_token
+
+def bulk_sleep():
+    return {'entries': [{'kind': 'sleep', 'hours': 7.5, 'quality': 'Good', 'date': date.today().isoformat()}]}
+
+def test_token_write_sets_no_cookie(app, user):
+    token, _ = issue_token(user.id, ['write'])
+    response = app.test_client().post('/entries/bulk', json=bulk_sleep(), headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    assert response.get_json()['inserted'] == 1
+    assert 'Set-Cookie' not in response.headers
+
+def test_cookie_write_pins_session(app, user):
+    client = app.test_client()
+    client.post('/auth/login', data={'email': 'alice@example.com', 'password': 'secret1'})
+    response = client.post('/entries/bulk', json=bulk_sleep())
+    assert response.status_code == 200
+    with client.session_transaction() as session:
+        assert PIN_KEY in session
+
+def test_invalid_token_is_rejected_with_json(app, user):
+    response = app.test_client().post('/entries/bulk', json=bulk_sleep(), headers={'Authorization': 'Bearer forged'})
+    assert response.status_code == 401
+    assert 'error' in response.get_json()
+
+def test_token_request_reads_identity_from_the_user_cache(app, user):
+    token, _ = issue_token(user.id, ['read'])
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+    client.get('/activity_data', headers=headers)  # Loads the revocation list and caches the identity
+    statements = []
+    def record(connection, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        with app.app_context():  # A fresh g, so the identity is not reused from the first request
+            response = client.get('/sleep_data', headers=headers)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert response.status_code == 200
+    assert not [statement for statement in statements if 'FROM user' in statement or 'FROM data_version' in statement]
+
+def test_deleted_users_tokens_are_refused(app, user):
+    token, _ = issue_token(user.id, ['read', 'write'])
+    soft_delete_user(user)
+    db.session.commit()
+    response = app.test_client().get('/activity_data', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 401